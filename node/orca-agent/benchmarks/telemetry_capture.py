@@ -0,0 +1,107 @@
+"""Microbenchmark of per-request telemetry capture overhead.
+
+Compares the original ``capture_telemetry`` implementation, which queried
+psutil, platform and socket and copied every header on each request, with the
+current one backed by precomputed server info and the background sampler.
+
+Usage (from node/orca-agent):
+
+    python -m benchmarks.telemetry_capture [iterations]
+"""
+
+import asyncio
+import platform
+import socket
+import sys
+from datetime import UTC, datetime
+from time import perf_counter
+from uuid import uuid4
+
+import psutil
+from starlette.requests import Request
+
+from src.api.api import capture_telemetry
+
+
+def make_request() -> Request:
+    """Build a representative API request."""
+    headers = [
+        (b"host", b"api.example.com"),
+        (b"user-agent", b"python-requests/2.31.0"),
+        (b"accept", b"application/json"),
+        (b"content-type", b"application/json"),
+        (b"content-length", b"512"),
+        (b"x-api-key", b"sk-benchmark"),
+        (b"x-forwarded-for", b"203.0.113.7, 10.0.0.1"),
+    ]
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/v1/swarm/completions",
+        "query_string": b"",
+        "headers": headers,
+        "client": ("10.0.0.1", 54321),
+        "server": ("api.example.com", 443),
+        "scheme": "https",
+    }
+    return Request(scope)
+
+
+async def legacy_capture_telemetry(request: Request) -> dict:
+    """The original per-request capture, kept here for comparison."""
+    headers = dict(request.headers)
+    user_agent_string = headers.get("user-agent", "")
+    client_ip = request.client.host
+    forwarded_for = headers.get("x-forwarded-for")
+    if forwarded_for:
+        client_ip = forwarded_for.split(",")[0]
+    cpu_percent = psutil.cpu_percent()
+    memory = psutil.virtual_memory()
+    return {
+        "request_id": str(uuid4()),
+        "timestamp": datetime.now(UTC).isoformat(),
+        "method": request.method,
+        "path": str(request.url.path),
+        "query_params": dict(request.query_params),
+        "client_ip": client_ip,
+        "headers": headers,
+        "user_agent": user_agent_string,
+        "server": {
+            "hostname": socket.gethostname(),
+            "platform": platform.platform(),
+            "python_version": platform.python_version(),
+            "processor": platform.processor() or "unknown",
+        },
+        "system_metrics": {
+            "cpu_percent": cpu_percent,
+            "memory_total": memory.total,
+            "memory_available": memory.available,
+            "memory_percent": memory.percent,
+        },
+    }
+
+
+async def measure(capture, iterations: int) -> float:
+    """Return mean microseconds per call, using a fresh request each time."""
+    requests = [make_request() for _ in range(iterations)]
+    start = perf_counter()
+    for request in requests:
+        await capture(request)
+    return (perf_counter() - start) / iterations * 1e6
+
+
+async def main(iterations: int) -> None:
+    # Warm up caches on both paths before timing
+    await measure(legacy_capture_telemetry, 100)
+    await measure(capture_telemetry, 100)
+
+    before = await measure(legacy_capture_telemetry, iterations)
+    after = await measure(capture_telemetry, iterations)
+    print(f"iterations: {iterations}")
+    print(f"before: {before:8.1f} us/request")
+    print(f"after:  {after:8.1f} us/request")
+    print(f"speedup: {before / after:6.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000))
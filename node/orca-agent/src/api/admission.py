@@ -0,0 +1,390 @@
+"""Two-class admission control for the standard and flex service tiers.
+
+Flex runs are discounted because they only use capacity standard traffic is
+not using. :class:`AdmissionController` enforces that:
+
+- standard runs are admitted immediately, whatever the load;
+- flex runs are admitted only while utilization (admitted runs over
+  ``capacity``) is below ``flex_threshold``; otherwise they wait in a FIFO
+  queue that is drained as runs finish;
+- a flex run that cannot start within ``flex_max_wait`` (15 minutes by
+  default), or that arrives when ``flex_max_waiting`` runs are already
+  waiting, fails with :class:`FlexCapacityError`.
+
+Waiting costs no worker thread. :meth:`AdmissionController.submit` (or an
+:class:`AdmittedExecutor`) hands a run to its executor only once it is
+admitted, and :meth:`AdmissionController.acquire_async` waits on the event
+loop. One timer thread expires flex runs that waited too long.
+"""
+
+import asyncio
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future
+from contextlib import asynccontextmanager, contextmanager
+from time import monotonic
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from dotenv import load_dotenv
+from loguru import logger
+
+from src.api.executors import EXECUTOR_SWARM_RUN_WORKERS
+
+load_dotenv()
+
+# Concurrent runs that count as full utilization
+ADMISSION_CAPACITY = int(
+    os.getenv("ADMISSION_CAPACITY", str(EXECUTOR_SWARM_RUN_WORKERS))
+)
+# Flex runs start only while utilization is below this fraction
+FLEX_UTILIZATION_THRESHOLD = float(os.getenv("FLEX_UTILIZATION_THRESHOLD", "0.7"))
+# Seconds a flex run may wait for capacity
+FLEX_MAX_WAIT = float(os.getenv("FLEX_MAX_WAIT", "900"))
+# Flex runs that may wait at once
+FLEX_MAX_WAITING = int(os.getenv("FLEX_MAX_WAITING", "32"))
+
+FLEX_TIER = "flex"
+
+
+class FlexCapacityError(RuntimeError):
+    """Raised when a flex run cannot be admitted in time."""
+
+
+class AdmissionController:
+    """
+    Admits standard runs immediately and flex runs into idle capacity.
+
+    Args:
+        capacity: Number of concurrent runs that counts as full utilization
+        flex_threshold: Utilization below which flex runs are admitted
+        flex_max_wait: Seconds a flex run may wait before it is rejected
+        flex_max_waiting: Maximum number of flex runs waiting at once
+    """
+
+    def __init__(
+        self,
+        capacity: int = ADMISSION_CAPACITY,
+        flex_threshold: float = FLEX_UTILIZATION_THRESHOLD,
+        flex_max_wait: float = FLEX_MAX_WAIT,
+        flex_max_waiting: int = FLEX_MAX_WAITING,
+        clock: Callable[[], float] = monotonic,
+    ):
+        self.capacity = capacity
+        self.flex_threshold = flex_threshold
+        self.flex_max_wait = flex_max_wait
+        self.flex_max_waiting = flex_max_waiting
+        self._clock = clock
+        self._running = 0
+        # (deadline, ticket) of waiting flex runs, in arrival order
+        self._waiting: Deque[Tuple[float, Future]] = deque()
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._expirer: Optional[threading.Thread] = None
+        self._stats = {
+            "admitted_standard": 0,
+            "admitted_flex": 0,
+            "flex_expired": 0,
+            "flex_rejected": 0,
+        }
+
+    def _has_flex_room(self) -> bool:
+        """Whether a flex run may start now. Caller holds the lock."""
+        return (
+            self._running == 0
+            or self._running < self.capacity * self.flex_threshold
+        )
+
+    def request(self, tier: Optional[str], timeout: Optional[float] = None) -> Future:
+        """
+        Ask to start a run of ``tier`` without blocking.
+
+        Args:
+            tier: Service tier of the run; anything but flex is standard
+            timeout: Seconds a flex run may wait; ``flex_max_wait`` if None
+
+        Returns:
+            Future: Ticket that resolves once the run is admitted, or fails
+            with :class:`FlexCapacityError`. Cancelling a waiting ticket
+            gives up its place in the queue.
+        """
+        ticket: Future = Future()
+        error = None
+        with self._lock:
+            if tier != FLEX_TIER:
+                self._running += 1
+                self._stats["admitted_standard"] += 1
+            elif not self._waiting and self._has_flex_room():
+                self._running += 1
+                self._stats["admitted_flex"] += 1
+            elif len(self._waiting) >= self.flex_max_waiting:
+                self._stats["flex_rejected"] += 1
+                error = FlexCapacityError(
+                    "Flex capacity is unavailable, please retry later"
+                )
+            else:
+                wait = self.flex_max_wait if timeout is None else timeout
+                self._waiting.append((self._clock() + wait, ticket))
+                self._start_expirer()
+                self._changed.notify()
+                return ticket
+
+        ticket.set_running_or_notify_cancel()
+        if error is None:
+            ticket.set_result(None)
+        else:
+            ticket.set_exception(error)
+        return ticket
+
+    def acquire(self, tier: Optional[str], timeout: Optional[float] = None) -> None:
+        """
+        Block until a run of ``tier`` may start.
+
+        Prefer :meth:`submit` or :meth:`acquire_async`, which do not hold a
+        thread while a flex run waits.
+
+        Raises:
+            FlexCapacityError: If a flex run cannot be admitted in time
+        """
+        self.request(tier, timeout).result()
+
+    async def acquire_async(
+        self, tier: Optional[str], timeout: Optional[float] = None
+    ) -> None:
+        """
+        Like :meth:`acquire`, waiting on the event loop.
+
+        Raises:
+            FlexCapacityError: If a flex run cannot be admitted in time
+        """
+        ticket = self.request(tier, timeout)
+        try:
+            await asyncio.wrap_future(ticket)
+        except asyncio.CancelledError:
+            # A ticket being admitted can no longer be cancelled; hand its
+            # slot back once it is
+            if not ticket.cancel():
+                ticket.add_done_callback(self._release_admitted)
+            raise
+
+    def submit(
+        self,
+        tier: Optional[str],
+        executor: Any,
+        fn: Callable[..., Any],
+        *args,
+        timeout: Optional[float] = None,
+        **kwargs,
+    ) -> Future:
+        """
+        Run ``fn`` on ``executor`` once a run of ``tier`` is admitted.
+
+        Nothing is submitted to ``executor`` while a flex run waits, and the
+        admission is released when ``fn`` returns.
+
+        Returns:
+            Future: Result of ``fn``. It fails with :class:`FlexCapacityError`
+            without running ``fn`` if the run is not admitted. Cancelling it
+            before ``fn`` starts drops the run.
+
+        Raises:
+            Exception: Whatever ``executor.submit`` raises for a run admitted
+                at once; a run admitted later fails its future instead
+        """
+        result: Future = Future()
+
+        def run() -> None:
+            try:
+                if not result.set_running_or_notify_cancel():
+                    return
+                try:
+                    value = fn(*args, **kwargs)
+                except BaseException as e:
+                    result.set_exception(e)
+                else:
+                    result.set_result(value)
+            finally:
+                self.release()
+
+        def dropped(inner: Future) -> None:
+            # The executor cancelled run() before it started (e.g. shutdown)
+            if inner.cancelled():
+                self.release()
+                result.cancel()
+
+        def start(ticket: Future) -> None:
+            if ticket.cancelled():
+                return
+            error = ticket.exception()
+            if error is None:
+                try:
+                    executor.submit(run).add_done_callback(dropped)
+                    return
+                except BaseException as e:
+                    self.release()
+                    error = e
+            if result.set_running_or_notify_cancel():
+                result.set_exception(error)
+
+        ticket = self.request(tier, timeout)
+        if ticket.done() and ticket.exception() is None:
+            try:
+                executor.submit(run).add_done_callback(dropped)
+            except BaseException:
+                self.release()
+                raise
+            return result
+
+        def withdraw(future: Future) -> None:
+            if future.cancelled():
+                ticket.cancel()
+
+        result.add_done_callback(withdraw)
+        ticket.add_done_callback(start)
+        return result
+
+    def _release_admitted(self, ticket: Future) -> None:
+        if not ticket.cancelled() and ticket.exception() is None:
+            self.release()
+
+    def release(self) -> None:
+        """Mark an admitted run finished and admit waiting flex runs."""
+        admitted: List[Future] = []
+        with self._lock:
+            self._running -= 1
+            while self._waiting and self._has_flex_room():
+                _, ticket = self._waiting.popleft()
+                if ticket.cancelled():
+                    continue
+                self._running += 1
+                self._stats["admitted_flex"] += 1
+                admitted.append(ticket)
+            self._changed.notify()
+
+        # Resolve outside the lock: callbacks may submit runs or release
+        for ticket in admitted:
+            if ticket.set_running_or_notify_cancel():
+                ticket.set_result(None)
+            else:
+                # Cancelled while being admitted: give the slot back
+                with self._lock:
+                    self._stats["admitted_flex"] -= 1
+                self.release()
+
+    def _start_expirer(self) -> None:
+        """Start the expiry thread on first use. Caller holds the lock."""
+        if self._expirer is None:
+            self._expirer = threading.Thread(
+                target=self._expire_loop, name="flex-admission", daemon=True
+            )
+            self._expirer.start()
+
+    def _expire_loop(self) -> None:
+        """Fail waiting flex runs whose deadline has passed."""
+        while True:
+            expired: List[Tuple[float, Future]] = []
+            with self._lock:
+                while not expired:
+                    # Cancelled tickets no longer wait
+                    self._waiting = deque(
+                        (d, t) for d, t in self._waiting if not t.cancelled()
+                    )
+                    if not self._waiting:
+                        self._changed.wait()
+                        continue
+                    now = self._clock()
+                    expired = [(d, t) for d, t in self._waiting if d <= now]
+                    if not expired:
+                        next_deadline = min(d for d, _ in self._waiting)
+                        self._changed.wait(next_deadline - now)
+                for entry in expired:
+                    self._waiting.remove(entry)
+
+            for deadline, ticket in expired:
+                if not ticket.set_running_or_notify_cancel():
+                    continue
+                with self._lock:
+                    self._stats["flex_expired"] += 1
+                logger.info("Flex run expired after waiting for capacity")
+                ticket.set_exception(
+                    FlexCapacityError(
+                        "Flex capacity was unavailable in time, please retry later"
+                    )
+                )
+
+    @contextmanager
+    def admit(self, tier: Optional[str]) -> Iterator[None]:
+        """Hold an admission for the duration of a ``with`` block."""
+        self.acquire(tier)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def admit_async(self, tier: Optional[str]) -> AsyncIterator[None]:
+        """Hold an admission for the duration of an ``async with`` block."""
+        await self.acquire_async(tier)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def executor(
+        self, executor: Any, tier: Union[Optional[str], Callable[..., Optional[str]]]
+    ) -> "AdmittedExecutor":
+        """Return a view of ``executor`` that admits each task before it runs."""
+        return AdmittedExecutor(self, executor, tier)
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        """Return admission counters, running and waiting runs and utilization."""
+        with self._lock:
+            return {
+                **self._stats,
+                "running": self._running,
+                "flex_waiting": sum(1 for _, t in self._waiting if not t.cancelled()),
+                "capacity": self.capacity,
+                "utilization": self._running / self.capacity if self.capacity else 0.0,
+            }
+
+
+class AdmittedExecutor:
+    """
+    Executor wrapper that submits each task only once it is admitted.
+
+    Args:
+        controller: Admission controller to admit tasks with
+        executor: Executor the admitted tasks run on
+        tier: Service tier of every task, or a function returning the tier
+            of a task from the arguments it is submitted with
+    """
+
+    def __init__(
+        self,
+        controller: AdmissionController,
+        executor: Any,
+        tier: Union[Optional[str], Callable[..., Optional[str]]],
+    ):
+        self.controller = controller
+        self.executor = executor
+        self.tier = tier
+
+    @property
+    def max_workers(self) -> int:
+        return self.executor.max_workers
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        """Admit the task, then submit ``fn(*args, **kwargs)`` to the executor."""
+        tier = self.tier(*args, **kwargs) if callable(self.tier) else self.tier
+        return self.controller.submit(tier, self.executor, fn, *args, **kwargs)
@@ -0,0 +1,198 @@
+"""Warm pool of pre-built agents keyed by their normalized configuration.
+
+Building a ``swarms.Agent`` sets up its LLM client, tools and memory, which is a
+visible share of request latency when most traffic reuses a handful of agent
+configurations. :class:`AgentPool` keeps idle agents per configuration key:
+
+- :meth:`AgentPool.acquire` hands out an idle agent for the key, or builds one.
+  An agent is only ever leased to one caller at a time.
+- :meth:`AgentPool.release` restores the configuration attributes swarms may
+  change during a run, resets the agent's short-term memory and usage totals
+  and returns it to the pool.
+- The number of idle agents is capped per key and in total (least recently
+  used keys are dropped first), and agents idle for longer than ``idle_ttl``
+  are evicted.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from time import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from loguru import logger
+
+from src.api.cache import make_cache_key
+
+load_dotenv()
+
+AGENT_POOL_MAX_IDLE = int(os.getenv("AGENT_POOL_MAX_IDLE", "256"))
+AGENT_POOL_MAX_IDLE_PER_KEY = int(os.getenv("AGENT_POOL_MAX_IDLE_PER_KEY", "8"))
+AGENT_POOL_IDLE_TTL = float(os.getenv("AGENT_POOL_IDLE_TTL", "600"))
+
+# Attributes restored on release, e.g. dynamic temperature changes temperature
+RESET_ATTRIBUTES = ("system_prompt", "temperature", "max_loops", "max_tokens")
+
+
+def agent_pool_key(agent_kwargs: Dict[str, Any]) -> str:
+    """Return the pool key for the keyword arguments an agent is built from."""
+    return make_cache_key("agent_spec", agent_kwargs)
+
+
+def snapshot_agent(agent: Any) -> Dict[str, Any]:
+    """Return the configuration attributes :func:`reset_agent` restores."""
+    return {
+        name: getattr(agent, name) for name in RESET_ATTRIBUTES if hasattr(agent, name)
+    }
+
+
+def reset_agent(agent: Any, baseline: Dict[str, Any]) -> None:
+    """
+    Clear the per-run state of an agent so it can serve another request.
+
+    Restores ``baseline`` attributes, rebuilds the short-term memory (system
+    prompt only) and zeroes the provider usage totals that billing reads.
+    """
+    for name, value in baseline.items():
+        setattr(agent, name, value)
+    if hasattr(agent, "short_memory_init"):
+        agent.short_memory = agent.short_memory_init()
+    usage = getattr(agent, "_usage", None)
+    if isinstance(usage, dict):
+        for key in usage:
+            usage[key] = 0
+
+
+class AgentPool:
+    """
+    Thread-safe pool of idle agents.
+
+    Args:
+        max_idle: Maximum number of idle agents across all keys
+        max_idle_per_key: Maximum number of idle agents for one key
+        idle_ttl: Seconds an idle agent is kept before eviction
+        sweep_interval: Minimum seconds between idle sweeps
+    """
+
+    def __init__(
+        self,
+        max_idle: int = AGENT_POOL_MAX_IDLE,
+        max_idle_per_key: int = AGENT_POOL_MAX_IDLE_PER_KEY,
+        idle_ttl: float = AGENT_POOL_IDLE_TTL,
+        sweep_interval: float = 60.0,
+        clock: Callable[[], float] = time,
+    ):
+        self.max_idle = max_idle
+        self.max_idle_per_key = max_idle_per_key
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+        self._clock = clock
+        self._last_sweep = clock()
+        # key -> idle (agent, baseline, released_at), oldest first; keys in LRU order
+        self._idle: "OrderedDict[str, List[Tuple[Any, Dict, float]]]" = OrderedDict()
+        self._idle_count = 0
+        # id(agent) -> (key, baseline) for leased agents
+        self._leased: Dict[int, Tuple[str, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def acquire(self, key: str, factory: Callable[[], Any]) -> Any:
+        """
+        Lease an agent for ``key``, building one with ``factory`` on a miss.
+
+        The agent must be handed back with :meth:`release`.
+        """
+        agent = baseline = None
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                # Most recently released first: it is the warmest
+                agent, baseline, _ = idle.pop()
+                self._idle_count -= 1
+                if not idle:
+                    del self._idle[key]
+                self._stats["hits"] += 1
+            else:
+                self._stats["misses"] += 1
+
+        if agent is None:
+            agent = factory()
+            baseline = snapshot_agent(agent)
+
+        with self._lock:
+            self._leased[id(agent)] = (key, baseline)
+        return agent
+
+    def release(self, agent: Any) -> None:
+        """Reset a leased agent and return it to the pool."""
+        with self._lock:
+            lease = self._leased.pop(id(agent), None)
+        if lease is None:
+            return
+
+        key, baseline = lease
+        try:
+            reset_agent(agent, baseline)
+        except Exception as e:
+            logger.warning(f"Discarding agent that failed to reset: {str(e)}")
+            return
+
+        now = self._clock()
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            self._idle.move_to_end(key)
+            idle.append((agent, baseline, now))
+            self._idle_count += 1
+            if len(idle) > self.max_idle_per_key:
+                idle.pop(0)
+                self._idle_count -= 1
+                self._stats["evictions"] += 1
+            while self._idle_count > self.max_idle:
+                self._evict_oldest_key_entry()
+
+        if now - self._last_sweep >= self.sweep_interval:
+            self._last_sweep = now
+            self.evict_idle()
+
+    def _evict_oldest_key_entry(self) -> None:
+        """Drop the LRU key's oldest idle agent. Caller holds the lock."""
+        key, idle = next(iter(self._idle.items()))
+        idle.pop(0)
+        self._idle_count -= 1
+        self._stats["evictions"] += 1
+        if not idle:
+            del self._idle[key]
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        """Drop agents idle for longer than ``idle_ttl``; return how many."""
+        cutoff = (self._clock() if now is None else now) - self.idle_ttl
+        removed = 0
+        with self._lock:
+            for key in list(self._idle):
+                idle = self._idle[key]
+                fresh = [entry for entry in idle if entry[2] > cutoff]
+                removed += len(idle) - len(fresh)
+                if fresh:
+                    self._idle[key] = fresh
+                else:
+                    del self._idle[key]
+            self._idle_count -= removed
+            self._stats["evictions"] += removed
+        return removed
+
+    def clear(self) -> None:
+        """Drop every idle agent."""
+        with self._lock:
+            self._idle.clear()
+            self._idle_count = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit, miss and eviction counters and idle and leased counts."""
+        with self._lock:
+            return {
+                **self._stats,
+                "idle": self._idle_count,
+                "leased": len(self._leased),
+                "keys": len(self._idle),
+            }
@@ -1,13 +1,9 @@
 import asyncio
+import json
 import os
-import platform
 import secrets
-import socket
 import string
-from collections import defaultdict
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from datetime import UTC, datetime
-from decimal import Decimal
+from datetime import UTC, datetime, timedelta
 from functools import lru_cache
 from time import time
 from typing import (
@@ -20,7 +16,7 @@ from typing import (
 )
 from uuid import uuid4
 
-import psutil
+import litellm
 import pytz
 import supabase
 from dotenv import load_dotenv
@@ -29,16 +25,94 @@ from fastapi import (
     FastAPI,
     Header,
     HTTPException,
+    Query,
     Request,
+    Response,
     status,
 )
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from litellm import model_list
 from loguru import logger
 from pydantic import BaseModel, Field
 from swarms import Agent, SwarmRouter, SwarmType
 from swarms.utils.any_to_str import any_to_str
-from swarms.utils.litellm_tokenizer import count_tokens
+
+from src.api.admission import AdmissionController, FlexCapacityError
+from src.api.agent_pool import AgentPool, agent_pool_key
+from src.api.auth import INVALID_KEY, AuthCache, AuthInfo, is_admin_token
+from src.api.batch import (
+    BATCH_HEARTBEAT_INTERVAL,
+    NDJSON_MEDIA_TYPE,
+    FairBatchScheduler,
+    batch_concurrency,
+    iter_batch,
+)
+from src.api.billing import (
+    CreditAccountNotFoundError,
+    CreditLedger,
+    Hold,
+    InsufficientCreditsError,
+    create_credit_store,
+)
+from src.api.cache import (
+    AGENT_CACHE_TTL,
+    SWARM_CACHE_TTL,
+    ResponseCache,
+    SingleFlight,
+    create_disk_cache,
+    make_cache_key,
+)
+from src.api.database import AsyncDatabase, DatabaseUnavailableError
+from src.api.executors import (
+    ExecutorSaturatedError,
+    executor_stats,
+    get_executor,
+    shutdown_executors,
+)
+from src.api.governor import GovernorCallback, LLMGovernor, messages_text
+from src.api.jobs import JobQueueFullError, SwarmJobManager
+from src.api.logs import (
+    LOG_PAGE_MAX,
+    LOG_STREAM_PAGE_SIZE,
+    InvalidLogQueryError,
+    LogQuery,
+    decode_cursor,
+    fetch_log_page,
+    parse_fields,
+)
+from src.api.profiler import (
+    PROFILE_DEFAULT_INTERVAL,
+    PROFILE_MAX_SECONDS,
+    PROFILE_MIN_INTERVAL,
+    ProfilerBusyError,
+    SamplingProfiler,
+)
+from src.api.rate_limit import client_key, create_rate_limiter
+from src.api.metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    LLMMetricsCallback,
+    MetricFamily,
+    MetricsRegistry,
+    hit_ratio,
+)
+from src.api.resilience import GuardedLLM, LLMGuard
+from src.api.routing import ModelRouter
+from src.api.scheduler import ScheduledSwarm, ScheduleStore, SwarmScheduler
+from src.api.streaming import (
+    SSE_HEADERS,
+    SSE_MEDIA_TYPE,
+    EventStream,
+    stream_result,
+)
+from src.api.tokens import TokenCounter, reported_usage
+from src.api.telemetry import (
+    SERVER_ID,
+    SERVER_INFO,
+    SystemMetricsSampler,
+    TelemetryWriter,
+    should_log_path,
+)
 
 # Configure logging
 logger.add("api.log", rotation="500 MB")
@@ -67,12 +141,35 @@ async def startup_event():
     """Initialize API state on startup."""
     try:
         # Add any initialization logic here
+        system_metrics.start()
+        litellm.callbacks.append(governor_callback)
+        litellm.callbacks.append(llm_metrics_callback)
+        await asyncio.to_thread(response_cache.warm_load)
+        swarm_scheduler.start()
+        logger.info("Server info {}: {}", SERVER_ID, SERVER_INFO)
         app.state.initialized = True
         logger.info("API initialized successfully")
     except Exception as e:
         logger.error(f"Failed to initialize API: {str(e)}")
         raise
 
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release background workers on shutdown."""
+    swarm_scheduler.stop()
+    swarm_job_manager.shutdown()
+    shutdown_executors()
+    credit_ledger.stop()
+    response_cache.snapshot()
+    token_counter.shutdown()
+    telemetry_writer.stop()
+    system_metrics.stop()
+    await database.aclose()
+    for callback in (governor_callback, llm_metrics_callback):
+        if callback in litellm.callbacks:
+            litellm.callbacks.remove(callback)
+
 # Literal of output types
 OutputType = Literal[
     "all",
@@ -108,14 +205,18 @@ output_type: OutputType
 load_dotenv()
 
 # Define rate limit parameters
-RATE_LIMIT = 100  # Max requests
-TIME_WINDOW = 60  # Time window in seconds
+RATE_LIMIT = int(os.getenv("RATE_LIMIT", "100"))  # Max requests (burst size)
+TIME_WINDOW = int(os.getenv("RATE_LIMIT_WINDOW", "60"))  # Time window in seconds
 
-# In-memory store for tracking requests
-request_counts = defaultdict(lambda: {"count": 0, "start_time": time()})
+# Token buckets per API key (or IP), shared across workers on this host
+request_limiter = create_rate_limiter(RATE_LIMIT, TIME_WINDOW)
 
-# In-memory store for scheduled jobs
-scheduled_jobs: Dict[str, Dict] = {}
+# Admits standard runs at once and flex runs only into idle capacity
+admission = AdmissionController()
+
+# Worker pool for asynchronous swarm jobs; flex jobs wait for admission
+# before they take a worker
+swarm_job_manager = SwarmJobManager(admission=admission)
 
 
 def generate_key(prefix: str = "swarms") -> str:
@@ -134,25 +235,32 @@ def generate_key(prefix: str = "swarms") -> str:
     return f"{prefix}-{random_part}"
 
 
-def rate_limiter(request: Request):
-    client_ip = request.client.host
-    current_time = time()
-    client_data = request_counts[client_ip]
+def rate_limiter(request: Request, response: Response):
+    """
+    Dependency enforcing a token-bucket limit per API key, or per IP without one.
 
-    # Reset count if time window has passed
-    if current_time - client_data["start_time"] > TIME_WINDOW:
-        client_data["count"] = 0
-        client_data["start_time"] = current_time
+    Only keys accepted by :func:`verify_api_key` (listed before this dependency)
+    get their own bucket; on open endpoints any header value is ignored.
 
-    # Increment request count
-    client_data["count"] += 1
+    Sets ``X-RateLimit-*`` quota headers on every response and ``Retry-After``
+    when the limit is exceeded.
+    """
+    auth_info = getattr(request.state, "auth", None)
+    api_key = request.headers.get("x-api-key") if auth_info is not None else None
+    key = client_key(api_key, request.client.host)
+    decision = request_limiter.acquire(key)
+    headers = decision.headers()
 
     # Check if rate limit is exceeded
-    if client_data["count"] > RATE_LIMIT:
+    if not decision.allowed:
         raise HTTPException(
-            status_code=429, detail="Rate limit exceeded. Please try again later."
+            status_code=429,
+            detail="Rate limit exceeded. Please try again later.",
+            headers=headers,
         )
 
+    response.headers.update(headers)
+
 
 class AgentSpec(BaseModel):
     agent_name: Optional[str] = Field(
@@ -195,6 +303,10 @@ class AgentSpec(BaseModel):
         default=None,
         description="A dictionary of tools that the agent can use to complete its task.",
     )
+    routing_models: Optional[List[str]] = Field(
+        default=None,
+        description="Other models the agent may use interchangeably with model_name. When set, each LLM call is routed to whichever of these models is currently answering fastest, based on live latency, error rate and queue depth.",
+    )
     # mcp_servers: Optional[str] = Field(
     #     description="A list of MCP servers that the agent can use to complete its task."
     # )
@@ -208,6 +320,10 @@ class AgentCompletion(BaseModel):
         ..., description="The configuration of the agent to be completed."
     )
     task: str = Field(..., description="The task to be completed by the agent.")
+    stream: Optional[bool] = Field(
+        False,
+        description="A flag indicating whether the agent should stream its output as Server-Sent Events.",
+    )
 
     class Config:
         arbitrary_types_allowed = True
@@ -338,13 +454,45 @@ class ReasoningAgentSpec(BaseModel):
         arbitrary_types_allowed = True
 
 
+# Request headers worth keeping in telemetry; everything else (including
+# credentials such as x-api-key) is left out
+TELEMETRY_HEADERS = (
+    "user-agent",
+    "content-type",
+    "content-length",
+    "accept",
+    "origin",
+    "referer",
+    "x-forwarded-for",
+)
+
+# Background sampler providing CPU and memory snapshots for telemetry
+system_metrics = SystemMetricsSampler()
+
+# Prometheus metrics served on /metrics; component stats are collected when
+# it is scraped (see collect_component_metrics)
+metrics = MetricsRegistry()
+request_duration = metrics.histogram(
+    "http_request_duration_seconds",
+    "Latency of API requests until the response starts",
+    ["method", "route", "status"],
+)
+swarm_duration = metrics.histogram(
+    "swarm_execution_seconds",
+    "Execution time of swarm runs",
+    ["swarm_type", "model", "status"],
+)
+# Registered with litellm at startup
+llm_metrics_callback = LLMMetricsCallback(metrics)
+
+
 async def capture_telemetry(request: Request) -> Dict[str, Any]:
     """
-    Captures comprehensive telemetry data from incoming requests including:
-    - Request metadata (method, path, headers)
+    Captures telemetry data from incoming requests including:
+    - Request metadata (method, path, selected headers)
     - Client information (IP, user agent string)
-    - Server information (hostname, platform)
-    - System metrics (CPU, memory)
+    - Server id (static host details are logged once at startup)
+    - System metrics (latest CPU and memory sample)
     - Timing data
 
     Args:
@@ -355,7 +503,12 @@ async def capture_telemetry(request: Request) -> Dict[str, Any]:
     """
     try:
         # Get request headers
-        headers = dict(request.headers)
+        request_headers = request.headers
+        headers = {
+            name: request_headers[name]
+            for name in TELEMETRY_HEADERS
+            if name in request_headers
+        }
         user_agent_string = headers.get("user-agent", "")
 
         # Get client IP, handling potential proxies
@@ -364,35 +517,21 @@ async def capture_telemetry(request: Request) -> Dict[str, Any]:
         if forwarded_for:
             client_ip = forwarded_for.split(",")[0]
 
-        # Basic system metrics
-        cpu_percent = psutil.cpu_percent()
-        memory = psutil.virtual_memory()
-
         telemetry = {
             "request_id": str(uuid4()),
             "timestamp": datetime.now(UTC).isoformat(),
             # Request data
             "method": request.method,
-            "path": str(request.url.path),
+            "path": request.url.path,
             "query_params": dict(request.query_params),
             "client_ip": client_ip,
             # Headers and user agent info
             "headers": headers,
             "user_agent": user_agent_string,
             # Server information
-            "server": {
-                "hostname": socket.gethostname(),
-                "platform": platform.platform(),
-                "python_version": platform.python_version(),
-                "processor": platform.processor() or "unknown",
-            },
+            "server": {"id": SERVER_ID},
             # System metrics
-            "system_metrics": {
-                "cpu_percent": cpu_percent,
-                "memory_total": memory.total,
-                "memory_available": memory.available,
-                "memory_percent": memory.percent,
-            },
+            "system_metrics": system_metrics.latest(),
         }
 
         return telemetry
@@ -412,23 +551,84 @@ def get_supabase_client():
     return supabase.create_client(supabase_url, supabase_key)
 
 
-@lru_cache(maxsize=1000)
-def check_api_key(api_key: str) -> bool:
-    supabase_client = get_supabase_client()
-    response = (
-        supabase_client.table("swarms_cloud_api_keys")
-        .select("*")
+# Columns read for API key lookups; a NULL tier falls back to "standard"
+API_KEY_COLUMNS = os.getenv("API_KEY_COLUMNS", "user_id,tier")
+
+
+# Pooled async client for Supabase calls made from request handlers
+database = AsyncDatabase()
+
+
+def api_key_query(client: Any, api_key: str) -> Any:
+    """Build the swarms_cloud_api_keys lookup on a sync or async client."""
+    return (
+        client.table("swarms_cloud_api_keys")
+        .select(API_KEY_COLUMNS)
         .eq("key", api_key)
-        .execute()
+        .limit(1)
+    )
+
+
+def auth_info_from_rows(rows: List[Dict[str, Any]]) -> AuthInfo:
+    """Map the rows of an API key lookup to an AuthInfo."""
+    if not rows:
+        return INVALID_KEY
+    record = rows[0]
+    return AuthInfo(
+        valid=True,
+        user_id=record.get("user_id"),
+        tier=record.get("tier") or "standard",
+    )
+
+
+def lookup_api_key(api_key: str) -> AuthInfo:
+    """
+    Look up an API key in the swarms_cloud_api_keys table.
+
+    Used by background refreshes; request handlers use
+    :func:`lookup_api_key_async`.
+
+    Args:
+        api_key (str): The API key to look up
+
+    Returns:
+        AuthInfo: Whether the key is valid, its user ID and its tier
+    """
+    return auth_info_from_rows(
+        api_key_query(get_supabase_client(), api_key).execute().data
+    )
+
+
+async def lookup_api_key_async(api_key: str) -> AuthInfo:
+    """Look up an API key through the pooled async database client."""
+    response = await database.execute(api_key_query(database, api_key))
+    return auth_info_from_rows(response.data)
+
+
+# Single TTL cache for API key validity and ownership
+auth_cache = AuthCache(lookup_api_key, async_loader=lookup_api_key_async)
+
+
+def database_unavailable(error: DatabaseUnavailableError) -> HTTPException:
+    """Map an unreachable database to a retryable 503 response."""
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=str(error),
+        headers={"Retry-After": "5"},
     )
-    return bool(response.data)
 
 
-@lru_cache(maxsize=1000)
+async def check_api_key(api_key: str) -> bool:
+    return (await auth_cache.aget(api_key)).valid
+
+
 def get_user_id_from_api_key(api_key: str) -> str:
     """
     Maps an API key to its associated user ID.
 
+    Called from the worker threads that run and bill swarms; the key is
+    normally cached by :func:`verify_api_key` by then.
+
     Args:
         api_key (str): The API key to look up
 
@@ -438,49 +638,53 @@ def get_user_id_from_api_key(api_key: str) -> str:
     Raises:
         ValueError: If the API key is invalid or not found
     """
-    supabase_client = get_supabase_client()
-    response = (
-        supabase_client.table("swarms_cloud_api_keys")
-        .select("user_id")
-        .eq("key", api_key)
-        .execute()
-    )
-    if not response.data:
+    auth_info = auth_cache.get(api_key)
+    if not auth_info.valid:
         raise ValueError("Invalid API key")
-    return response.data[0]["user_id"]
+    return auth_info.user_id
 
 
-@lru_cache(maxsize=1000)
-def verify_api_key(x_api_key: str = Header(...)) -> None:
+async def verify_api_key(request: Request, x_api_key: str = Header(...)) -> None:
     """
     Dependency to verify the API key.
+
+    The resolved AuthInfo is stored on ``request.state.auth`` for handlers.
     """
-    if not check_api_key(x_api_key):
+    try:
+        auth_info = await auth_cache.aget(x_api_key)
+    except DatabaseUnavailableError as e:
+        raise database_unavailable(e)
+    if not auth_info.valid:
         raise HTTPException(status_code=403, detail="Invalid API Key")
+    request.state.auth = auth_info
+
 
+async def verify_admin_token(x_admin_token: Optional[str] = Header(None)) -> None:
+    """Dependency guarding operator endpoints with the ADMIN_TOKEN."""
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
 
-async def get_api_key_logs(api_key: str) -> List[Dict[str, Any]]:
+
+async def get_api_key_logs(
+    api_key: str, query: LogQuery = LogQuery()
+) -> tuple[List[Dict[str, Any]], Optional[str]]:
     """
-    Retrieve all API request logs for a specific API key.
+    Retrieve one page of API request logs for a specific API key.
 
     Args:
         api_key: The API key to query logs for
+        query: Filters, projection and cursor of the page
 
     Returns:
-        List[Dict[str, Any]]: List of log entries for the API key
+        The log entries, newest first, and the cursor of the next page
     """
     try:
-        supabase_client = get_supabase_client()
-
-        # Query swarms_api_logs table for entries matching the API key
-        response = (
-            supabase_client.table("swarms_api_logs")
-            .select("*")
-            .eq("api_key", api_key)
-            .execute()
-        )
-        return response.data
-
+        return await fetch_log_page(database, api_key, query)
+    except InvalidLogQueryError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except DatabaseUnavailableError as e:
+        logger.error(f"Error retrieving API logs: {str(e)}")
+        raise database_unavailable(e)
     except Exception as e:
         logger.error(f"Error retrieving API logs: {str(e)}")
         raise HTTPException(
@@ -489,6 +693,22 @@ async def get_api_key_logs(api_key: str) -> List[Dict[str, Any]]:
         )
 
 
+async def stream_api_key_logs(api_key: str, query: LogQuery):
+    """Yield every log entry matching ``query`` as NDJSON, a page at a time."""
+    query = query._replace(limit=LOG_STREAM_PAGE_SIZE)
+    while True:
+        try:
+            rows, cursor = await get_api_key_logs(api_key, query)
+        except HTTPException as e:
+            yield json.dumps({"error": e.detail}) + "\n"
+            return
+        for row in rows:
+            yield json.dumps(row, default=str) + "\n"
+        if cursor is None:
+            return
+        query = query._replace(cursor=cursor)
+
+
 def validate_swarm_spec(swarm_spec: SwarmSpec) -> tuple[str, Optional[List[str]]]:
     """
     Validates the swarm specification and returns the task(s) to be executed.
@@ -530,12 +750,22 @@ def validate_swarm_spec(swarm_spec: SwarmSpec) -> tuple[str, Optional[List[str]]
     return task, tasks
 
 
-def create_single_agent(agent_spec: Union[AgentSpec, dict]) -> Agent:
+# Idle agents reused across requests with the same configuration
+agent_pool = AgentPool()
+
+
+def create_single_agent(
+    agent_spec: Union[AgentSpec, dict], event_stream: Optional[EventStream] = None
+) -> Agent:
     """
     Creates a single agent.
 
+    Non-streaming agents are leased from the warm pool and must be handed back
+    with ``agent_pool.release`` after the run.
+
     Args:
         agent_spec: Agent specification (either AgentSpec object or dict)
+        event_stream: Optional stream that receives the agent's tokens and completion
 
     Returns:
         Created Agent instance
@@ -564,8 +794,17 @@ def create_single_agent(agent_spec: Union[AgentSpec, dict]) -> Agent:
         # else:
         #     output_type = "final"
 
-        # Create the agent
-        agent = Agent(
+        # Stream tokens to the client when requested
+        streaming_kwargs = {}
+        if event_stream is not None:
+            streaming_kwargs = {
+                "streaming_on": True,
+                "streaming_callback": event_stream.token_callback(
+                    agent_spec.agent_name
+                ),
+            }
+
+        agent_kwargs = dict(
             agent_name=agent_spec.agent_name,
             description=agent_spec.description,
             system_prompt=agent_spec.system_prompt,
@@ -580,6 +819,14 @@ def create_single_agent(agent_spec: Union[AgentSpec, dict]) -> Agent:
             output_type="str-all-except-first",
         )
 
+        # Create the agent; streaming agents are bound to their request, so
+        # only non-streaming agents come from the warm pool
+        if event_stream is not None:
+            agent = Agent(**agent_kwargs, **streaming_kwargs)
+            event_stream.instrument_agent(agent)
+        else:
+            agent = acquire_pooled_agent(agent_kwargs, routing_models(agent_spec))
+
         logger.info("Successfully created agent: {}", agent_spec.agent_name)
         return agent
 
@@ -601,13 +848,20 @@ def create_single_agent(agent_spec: Union[AgentSpec, dict]) -> Agent:
         raise HTTPException(status_code=500, detail=f"Failed to create agent: {str(e)}")
 
 
-def create_swarm(swarm_spec: SwarmSpec, api_key: str):
+def create_swarm(
+    swarm_spec: SwarmSpec,
+    api_key: str,
+    event_stream: Optional[EventStream] = None,
+    user_id: Optional[str] = None,
+):
     """
     Creates and executes a swarm based on the provided specification.
 
     Args:
         swarm_spec: The swarm specification
         api_key: API key for authentication and billing
+        event_stream: Optional stream that receives agent tokens and completions
+        user_id: User to bill, if already known; looked up from api_key if not
 
     Returns:
         The swarm execution results
@@ -620,38 +874,114 @@ def create_swarm(swarm_spec: SwarmSpec, api_key: str):
 
         task, tasks = validate_swarm_spec(swarm_spec)
 
-        # Create agents in parallel if specified
-        agents = []
-        if swarm_spec.agents is not None:
-            # Use ThreadPoolExecutor for parallel agent creation
-            with ThreadPoolExecutor(
-                max_workers=min(len(swarm_spec.agents), 10)
-            ) as executor:
-                # Submit all agent creation tasks
-                future_to_agent = {
-                    executor.submit(create_single_agent, agent_spec): agent_spec
-                    for agent_spec in swarm_spec.agents
-                }
+        # Reserve the estimated cost up front so concurrent runs cannot overspend
+        hold = reserve_credits(
+            api_key, estimate_swarm_cost(swarm_spec, task, tasks), user_id
+        )
+        try:
+            output = run_swarm_spec(swarm_spec, task, tasks, event_stream)
+        except Exception:
+            credit_ledger.release(hold)
+            raise
+
+        # Bill the actual cost; the work is done, so this never fails the request
+        credit_ledger.capture(
+            hold,
+            output["total_cost"],
+            api_key,
+            f"swarm_execution_{swarm_spec.name}",
+        )
+
+        logger.info("Swarm task executed successfully: {}", swarm_spec.task)
+        return output["output"]
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error creating swarm: {}", str(e))
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to create swarm: {str(e)}",
+        )
+
+
+def create_agents(
+    agent_specs: List[AgentSpec], event_stream: Optional[EventStream] = None
+) -> List[Agent]:
+    """
+    Creates agents in parallel, in the order of ``agent_specs``.
+
+    If any agent fails, the pooled agents already created are released.
+
+    Raises:
+        HTTPException: If an agent cannot be created
+    """
+    agents, error = [], None
+    # Build agents in parallel on the shared agent_build executor
+    executor = get_executor("agent_build")
+    futures = []
+    for agent_spec in agent_specs:
+        try:
+            future = executor.submit(create_single_agent, agent_spec, event_stream)
+        except ExecutorSaturatedError as e:
+            error = service_busy(e)
+            break
+        futures.append((future, agent_spec))
+
+    for future, agent_spec in futures:
+        try:
+            agents.append(future.result())
+        except HTTPException as e:
+            # Keep HTTP exceptions with their original status code
+            error = error or e
+        except Exception as e:
+            logger.error(
+                "Error creating agent {}: {}",
+                getattr(agent_spec, "agent_name", "unknown"),
+                str(e),
+            )
+            error = error or HTTPException(
+                status_code=500, detail=f"Failed to create agent: {str(e)}"
+            )
 
-                # Collect results as they complete
-                for future in as_completed(future_to_agent):
-                    agent_spec = future_to_agent[future]
-                    try:
-                        agent = future.result()
-                        agents.append(agent)
-                    except HTTPException:
-                        # Re-raise HTTP exceptions with original status code
-                        raise
-                    except Exception as e:
-                        logger.error(
-                            "Error creating agent {}: {}",
-                            getattr(agent_spec, "agent_name", "unknown"),
-                            str(e),
-                        )
-                        raise HTTPException(
-                            status_code=500, detail=f"Failed to create agent: {str(e)}"
-                        )
+    if error is not None:
+        for agent in agents:
+            agent_pool.release(agent)
+        raise error
+    return agents
+
+
+def record_swarm_run(
+    swarm_spec: SwarmSpec, agents: List[Agent], seconds: float, status: str
+) -> None:
+    """Observe a swarm run's execution time by swarm type and agent models."""
+    models = sorted({str(getattr(agent, "model_name", None)) for agent in agents})
+    swarm_duration.observe(
+        seconds,
+        swarm_type=str(swarm_spec.swarm_type or "default"),
+        model=",".join(models) or "none",
+        status=status,
+    )
+
+
+def run_swarm_spec(
+    swarm_spec: SwarmSpec,
+    task: Optional[str],
+    tasks: Optional[List[str]],
+    event_stream: Optional[EventStream] = None,
+) -> Dict[str, Any]:
+    """
+    Builds the agents and swarm for a validated spec and runs it.
+
+    Returns:
+        Dict with the swarm ``output`` and its ``total_cost``
+    """
+    # Create agents in parallel if specified
+    agents = []
+    if swarm_spec.agents is not None:
+        agents = create_agents(swarm_spec.agents, event_stream)
 
+    try:
         # Create and configure the swarm
         swarm = SwarmRouter(
             name=swarm_spec.name,
@@ -668,81 +998,138 @@ def create_swarm(swarm_spec: SwarmSpec, api_key: str):
         # Calculate costs and execute
         start_time = time()
 
-        output = (
-            swarm.run(task=task)
-            if task is not None
-            else (
-                swarm.batch_run(tasks=tasks)
-                if tasks is not None
-                else swarm.run(task=task)
-            )
-        )
+        try:
+            if task is None and tasks is not None:
+                # Run each distinct task once and fan its output back out
+                unique_tasks = list(dict.fromkeys(tasks))
+                executed = swarm.batch_run(tasks=unique_tasks)
+                outputs_by_task = dict(zip(unique_tasks, executed))
+                output = [outputs_by_task[t] for t in tasks]
+            else:
+                executed = output = swarm.run(task=task)
+        except Exception:
+            record_swarm_run(swarm_spec, agents, time() - start_time, "error")
+            raise
 
         # Calculate execution time and costs
         execution_time = time() - start_time
+        record_swarm_run(swarm_spec, agents, execution_time, "success")
 
         # Calculate costs
         cost_info = calculate_swarm_cost(
             agents=agents,
             input_text=swarm_spec.task,
             execution_time=execution_time,
-            agent_outputs=output,
+            agent_outputs=executed,
             service_tier=swarm_spec.service_tier,
         )
 
-        # Deduct credits
-        deduct_credits(
-            api_key,
-            cost_info["total_cost"],
-            f"swarm_execution_{swarm_spec.name}",
-        )
+        return {"output": output, "total_cost": cost_info["total_cost"]}
+    finally:
+        # Hand pooled agents back once the run and its accounting are done
+        for agent in agents:
+            agent_pool.release(agent)
 
-        logger.info("Swarm task executed successfully: {}", swarm_spec.task)
-        return output
 
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error("Error creating swarm: {}", str(e))
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to create swarm: {str(e)}",
-        )
+def insert_api_logs(rows: List[Dict[str, Any]]) -> None:
+    """
+    Bulk insert log rows into the Supabase swarms_api_logs table.
+
+    Raises:
+        RuntimeError: If the insert is rejected
+    """
+    supabase_client = get_supabase_client()
+    response = supabase_client.table("swarms_api_logs").insert(rows).execute()
+    if not response.data:
+        raise RuntimeError("Failed to log API requests")
+
+
+# Batches API logs in the background so requests never wait on Supabase
+telemetry_writer = TelemetryWriter(insert_api_logs, server_info=SERVER_INFO)
 
 
-# Add this function after your get_supabase_client() function
 async def log_api_request(api_key: str, data: Dict[str, Any]) -> None:
     """
-    Log API request data to Supabase swarms_api_logs table.
+    Queue API request data for the swarms_api_logs table.
+
+    Rows are written in bulk by the background telemetry writer.
 
     Args:
         api_key: The API key used for the request
         data: Dictionary containing request data to log
     """
     try:
-        supabase_client = get_supabase_client()
+        telemetry_writer.enqueue({"api_key": api_key, "data": data})
+    except Exception as e:
+        logger.error(f"Error logging API request: {str(e)}")
 
-        # Create log entry
-        log_entry = {
-            "api_key": api_key,
-            "data": data,
-        }
 
-        # Insert into swarms_api_logs table
-        response = supabase_client.table("swarms_api_logs").insert(log_entry).execute()
+# Paces every outbound LLM call against per-model RPM, TPM and concurrency
+# budgets
+llm_governor = LLMGovernor()
 
-        if not response.data:
-            logger.error("Failed to log API request")
+# Deadlines, per-provider circuit breakers, optional hedging and model routing
+# for agent LLM calls; routing counts calls the governor holds back as queued,
+# and calls to a model too far over its budgets are rejected up front
+llm_guard = LLMGuard(
+    executor=get_executor("llm_call"),
+    router=ModelRouter(load=lambda model: llm_governor.queued(model)),
+    governor=llm_governor,
+)
 
-    except Exception as e:
-        logger.error(f"Error logging API request: {str(e)}")
+
+def guard_agent(agent: Agent, models: Optional[List[str]] = None) -> Agent:
+    """
+    Route an agent's non-streaming LLM calls through the shared LLMGuard.
+
+    Streaming agents are left alone: their calls return a stream at once, so
+    a deadline or hedge would not apply to the tokens that follow.
+
+    Args:
+        agent: Agent to guard
+        models: Acceptable models to route each call among, if any
+    """
+    if not isinstance(agent.llm, GuardedLLM):
+        agent.llm = GuardedLLM(agent.llm, llm_guard, models)
+    return agent
+
+
+def routing_models(agent_spec: AgentSpec) -> Optional[List[str]]:
+    """Return the models an agent's calls are routed among, or None."""
+    if not agent_spec.routing_models:
+        return None
+    return list(dict.fromkeys([agent_spec.model_name, *agent_spec.routing_models]))
+
+
+def acquire_pooled_agent(
+    agent_kwargs: Dict[str, Any], models: Optional[List[str]] = None
+) -> Agent:
+    """Lease a guarded agent from the warm pool, routed among ``models`` if set."""
+    key_kwargs = agent_kwargs if models is None else {**agent_kwargs, "models": models}
+    return agent_pool.acquire(
+        agent_pool_key(key_kwargs),
+        lambda: guard_agent(Agent(**agent_kwargs), models),
+    )
 
 
-# Add cache dictionary at module level
-context_cache = {}
-CACHE_TTL = 3600  # 1 hour in seconds
-MAX_CACHE_SIZE = 1000  # Maximum number of cache entries
-CACHE_CLEANUP_INTERVAL = 300  # Clean up cache every 5 minutes
+# Shared response cache for swarm and agent completions
+response_cache = ResponseCache(
+    ttls={"swarm": SWARM_CACHE_TTL, "agent": AGENT_CACHE_TTL},
+    disk=create_disk_cache(),
+)
+
+# Coalesces identical swarm and agent runs that are in flight at the same time;
+# leaders run on the shared swarm_run executor
+request_flights = SingleFlight(executor=get_executor("swarm_run"))
+
+
+def service_busy(error: ExecutorSaturatedError) -> HTTPException:
+    """Map a saturated executor to a retryable 503 response."""
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=str(error),
+        headers={"Retry-After": "5"},
+    )
 
 
 def generate_cache_key(swarm: SwarmSpec) -> str:
@@ -750,58 +1137,124 @@ def generate_cache_key(swarm: SwarmSpec) -> str:
     Generate a unique cache key for a swarm configuration.
     Includes relevant fields that affect the output.
     """
-    key_parts = [
-        swarm.name,
-        swarm.task,
-        swarm.swarm_type,
-        str(swarm.max_loops),
-        str(swarm.return_history),
-    ]
+    payload = {
+        "name": swarm.name,
+        "task": swarm.task,
+        "swarm_type": swarm.swarm_type,
+        "max_loops": swarm.max_loops,
+        "return_history": swarm.return_history,
+        "rules": swarm.rules,
+        "rearrange_flow": swarm.rearrange_flow,
+        "tasks": swarm.tasks,
+        "messages": swarm.messages,
+    }
 
     # Add agent configurations to the key
     if swarm.agents:
-        agent_configs = []
-        for agent in swarm.agents:
-            agent_config = {
+        payload["agents"] = [
+            {
                 "name": agent.agent_name,
                 "model": agent.model_name,
                 "prompt": agent.system_prompt,
                 "temp": agent.temperature,
                 "max_loops": agent.max_loops,
             }
-            agent_configs.append(str(agent_config))
-        key_parts.extend(agent_configs)
+            for agent in swarm.agents
+        ]
 
-    # Add tasks and messages if present
-    if swarm.tasks:
-        key_parts.append(str(swarm.tasks))
-    if swarm.messages:
-        key_parts.append(str(swarm.messages))
+    return make_cache_key("swarm", payload)
 
-    return "|".join(key_parts)
+
+def flight_key(cache_key: str, api_key: Optional[str]) -> str:
+    """
+    Scope a cache key to one API key for coalescing in-flight runs.
+
+    A coalesced run is billed and logged once, to its leader, so only
+    requests made with the same API key may share it.
+    """
+    return make_cache_key("flight", {"cache_key": cache_key, "api_key": api_key})
 
 
-def cleanup_cache():
+def generate_agent_cache_key(agent_completion: AgentCompletion) -> str:
     """
-    Clean up expired cache entries and enforce size limits.
+    Generate a unique cache key for an agent completion request.
     """
-    current_time = time()
+    return make_cache_key(
+        "agent",
+        {
+            "agent_config": agent_completion.agent_config.model_dump(mode="json"),
+            "task": agent_completion.task,
+        },
+    )
 
-    # Remove expired entries
-    expired_keys = [
-        key
-        for key, value in context_cache.items()
-        if current_time - value["timestamp"] >= CACHE_TTL
-    ]
-    for key in expired_keys:
-        del context_cache[key]
 
-    # If still over size limit, remove oldest entries
-    if len(context_cache) > MAX_CACHE_SIZE:
-        sorted_entries = sorted(context_cache.items(), key=lambda x: x[1]["timestamp"])
-        entries_to_remove = sorted_entries[: len(context_cache) - MAX_CACHE_SIZE]
-        for key, _ in entries_to_remove:
-            del context_cache[key]
+def execute_swarm_completion(
+    swarm: SwarmSpec,
+    x_api_key: str = None,
+    job_id: Optional[str] = None,
+    event_stream: Optional[EventStream] = None,
+    user_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Execute a swarm and format its response.
+
+    This is blocking and must be run on a worker thread, never on the event loop.
+
+    Args:
+        swarm: The swarm specification
+        x_api_key: API key for authentication and billing
+        job_id: Identifier to report in the response; generated if omitted
+        event_stream: Optional stream that receives agent tokens and completions
+        user_id: User to bill, if already known
+
+    Returns:
+        Dict[str, Any]: The formatted swarm response
+    """
+    swarm_name = swarm.name
+    agents = swarm.agents
+
+    # Log start of swarm execution
+    logger.info(f"Starting swarm {swarm_name} with {len(agents)} agents")
+
+    # Create and run the swarm
+    logger.debug(f"Creating swarm object for {swarm_name}")
+    try:
+        result = create_swarm(swarm, x_api_key, event_stream, user_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error running swarm: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to run swarm: {e}",
+        )
+
+    logger.debug(f"Running swarm task: {swarm.task}")
+
+    if swarm.swarm_type == "MALT":
+        length_of_agents = 14
+    else:
+        length_of_agents = len(agents)
+
+    # Format the response
+    response = {
+        "job_id": job_id or generate_key(),
+        "status": "success",
+        "swarm_name": swarm_name,
+        "description": swarm.description,
+        "swarm_type": swarm.swarm_type,
+        "output": result,
+        "number_of_agents": length_of_agents,
+        "service_tier": swarm.service_tier,
+    }
+
+    if swarm.tasks is not None:
+        response["tasks"] = swarm.tasks
+
+    if swarm.messages is not None:
+        response["messages"] = swarm.messages
+
+    return response
 
 
 async def run_swarm_completion(
@@ -812,90 +1265,27 @@ async def run_swarm_completion(
     """
     try:
         swarm_name = swarm.name
-        agents = swarm.agents
 
         # Generate cache key based on swarm configuration
         cache_key = generate_cache_key(swarm)
 
         # Check if we have a valid cached result
-        current_time = time()
-        if cache_key in context_cache:
-            cached_result = context_cache[cache_key]
-            if current_time - cached_result["timestamp"] < CACHE_TTL:
-                logger.info(f"Using cached result for swarm {swarm_name}")
-                return cached_result["response"]
+        cached_result = await response_cache.aget("swarm", cache_key)
+        if cached_result is not None:
+            logger.info(f"Using cached result for swarm {swarm_name}")
+            return cached_result
 
         await log_api_request(x_api_key, swarm.model_dump())
 
-        # Log start of swarm execution
-        logger.info(f"Starting swarm {swarm_name} with {len(agents)} agents")
-
-        # Create and run the swarm
-        logger.debug(f"Creating swarm object for {swarm_name}")
-
-        # Handle flex processing
-        max_retries = 3 if swarm.service_tier == "flex" else 1
-        base_timeout = (
-            900.0 if swarm.service_tier == "flex" else 300.0
-        )  # 15 minutes for flex, 5 minutes for standard
-
-        for attempt in range(max_retries):
-            try:
-                result = create_swarm(swarm, x_api_key)
-                break
-            except HTTPException as e:
-                if e.status_code == 429 and swarm.service_tier == "flex":
-                    # Resource unavailable error in flex mode
-                    if attempt < max_retries - 1:
-                        # Exponential backoff
-                        backoff_time = (2**attempt) * 5  # 5, 10, 20 seconds
-                        logger.info(
-                            f"Resource unavailable, retrying in {backoff_time} seconds..."
-                        )
-                        await asyncio.sleep(backoff_time)
-                        continue
-                raise
-            except Exception as e:
-                logger.error(f"Error running swarm: {e}")
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail=f"Failed to run swarm: {e}",
-                )
-
-        logger.debug(f"Running swarm task: {swarm.task}")
-
-        if swarm.swarm_type == "MALT":
-            length_of_agents = 14
-        else:
-            length_of_agents = len(agents)
-
-        # Job id
-        job_id = generate_key()
-
-        # Format the response
-        response = {
-            "job_id": job_id,
-            "status": "success",
-            "swarm_name": swarm_name,
-            "description": swarm.description,
-            "swarm_type": swarm.swarm_type,
-            "output": result,
-            "number_of_agents": length_of_agents,
-            "service_tier": swarm.service_tier,
-        }
-
-        if swarm.tasks is not None:
-            response["tasks"] = swarm.tasks
-
-        if swarm.messages is not None:
-            response["messages"] = swarm.messages
-
-        # Cache the response
-        context_cache[cache_key] = {"response": response, "timestamp": current_time}
-
-        # Clean up cache periodically
-        if current_time % CACHE_CLEANUP_INTERVAL < 1:  # Check every ~5 minutes
-            cleanup_cache()
+        # Run the blocking swarm off the event loop once its tier is
+        # admitted, joining an identical run that is already in flight
+        response = await request_flights.do_async_on(
+            admission.executor(get_executor("swarm_run"), swarm.service_tier),
+            flight_key(cache_key, x_api_key),
+            execute_and_cache_swarm,
+            swarm,
+            x_api_key,
+        )
 
         await log_api_request(x_api_key, response)
 
@@ -904,6 +1294,12 @@ async def run_swarm_completion(
     except HTTPException as http_exc:
         logger.error("HTTPException occurred: {}", http_exc.detail)
         raise
+    except ExecutorSaturatedError as e:
+        raise service_busy(e)
+    except FlexCapacityError as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e)
+        )
     except Exception as e:
         logger.error("Error running swarm {}: {}", swarm_name, str(e))
         logger.exception(e)
@@ -913,93 +1309,337 @@ async def run_swarm_completion(
         )
 
 
-def deduct_credits(api_key: str, amount: float, product_name: str) -> None:
+def execute_and_cache_swarm(
+    swarm: SwarmSpec,
+    x_api_key: str,
+    job_id: Optional[str] = None,
+    event_stream: Optional[EventStream] = None,
+    user_id: Optional[str] = None,
+) -> Dict[str, Any]:
     """
-    Deducts the specified amount of credits for the user identified by api_key,
-    preferring to use free_credit before using regular credit, and logs the transaction.
+    Executes the swarm and populates the swarm cache so identical requests can
+    reuse the result.
     """
-    supabase_client = get_supabase_client()
-    user_id = get_user_id_from_api_key(api_key)
-
-    # 1. Retrieve the user's credit record
-    response = (
-        supabase_client.table("swarms_cloud_users_credits")
-        .select("*")
-        .eq("user_id", user_id)
-        .execute()
+    response = execute_swarm_completion(
+        swarm, x_api_key, job_id=job_id, event_stream=event_stream, user_id=user_id
     )
-    if not response.data:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User credits record not found.",
-        )
+    response_cache.set("swarm", generate_cache_key(swarm), response)
+    return response
 
-    record = response.data[0]
-    # Use Decimal for precise arithmetic
-    available_credit = Decimal(record["credit"])
-    free_credit = Decimal(record.get("free_credit", "0"))
-    deduction = Decimal(str(amount))
 
-    print(
-        f"Available credit: {available_credit}, Free credit: {free_credit}, Deduction: {deduction}"
+def run_and_cache_swarm(
+    swarm: SwarmSpec,
+    x_api_key: str,
+    job_id: Optional[str] = None,
+    event_stream: Optional[EventStream] = None,
+    user_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Worker entry point for swarm runs.
+
+    If an identical swarm with the same API key is already running, waits for
+    its result instead of running it again.
+    """
+    response = request_flights.do(
+        flight_key(generate_cache_key(swarm), x_api_key),
+        execute_and_cache_swarm,
+        swarm,
+        x_api_key,
+        job_id=job_id,
+        event_stream=event_stream,
+        user_id=user_id,
     )
+    if job_id is not None:
+        # Followers share the leader's response; each job reports its own id
+        response = {**response, "job_id": job_id}
+    return response
 
-    # 2. Verify sufficient total credits are available
-    if (available_credit + free_credit) < deduction:
-        raise HTTPException(
-            status_code=status.HTTP_402_PAYMENT_REQUIRED,
-            detail="Insufficient credits. Fill your credit card in the dashboard at https://swarms.world/platform/account",
-        )
 
-    # 3. Log the transaction
-    log_response = (
-        supabase_client.table("swarms_cloud_services")
-        .insert(
-            {
-                "user_id": user_id,
-                "api_key": api_key,
-                "charge_credit": int(
-                    deduction
-                ),  # Assuming credits are stored as integers
-                "product_name": product_name,
-            }
-        )
-        .execute()
+async def stream_swarm_completion(swarm: SwarmSpec, x_api_key: str):
+    """
+    Run a swarm and yield its agent tokens and completions as SSE frames.
+    """
+    cached_result = await response_cache.aget("swarm", generate_cache_key(swarm))
+    if cached_result is not None:
+        logger.info(f"Using cached result for swarm {swarm.name}")
+        async for frame in stream_result(cached_result):
+            yield frame
+        return
+
+    await log_api_request(x_api_key, swarm.model_dump())
+
+    # A flex run waits for admission before it takes a worker
+    event_stream = EventStream(
+        executor=admission.executor(get_executor("swarm_run"), swarm.service_tier)
     )
-    if not log_response.data:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to log the credit transaction.",
-        )
+    async for frame in event_stream.run(
+        run_and_cache_swarm, swarm, x_api_key, event_stream=event_stream
+    ):
+        yield frame
 
-    # 4. Deduct credits: use free_credit first, then deduct the remainder from available_credit
-    if free_credit >= deduction:
-        free_credit -= deduction
-    else:
-        remainder = deduction - free_credit
-        free_credit = Decimal("0")
-        available_credit -= remainder
 
-    update_response = (
-        supabase_client.table("swarms_cloud_users_credits")
-        .update(
-            {
-                "credit": str(available_credit),
-                "free_credit": str(free_credit),
-            }
-        )
-        .eq("user_id", user_id)
-        .execute()
-    )
-    if not update_response.data:
+def scheduled_time_utc(schedule: ScheduleSpec) -> datetime:
+    """
+    Resolve a schedule to an aware UTC datetime.
+
+    Naive times are read in the schedule's timezone.
+
+    Raises:
+        HTTPException: 400 if the timezone is unknown
+    """
+    try:
+        tz = pytz.timezone(schedule.timezone or "UTC")
+    except pytz.UnknownTimeZoneError:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to update credits.",
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown timezone: {schedule.timezone}",
         )
+    scheduled_time = schedule.scheduled_time
+    if scheduled_time.tzinfo is None:
+        scheduled_time = tz.localize(scheduled_time)
+    return scheduled_time.astimezone(UTC)
 
 
-def calculate_swarm_cost(
-    agents: List[Any],
+def format_scheduled_swarm(job: ScheduledSwarm) -> Dict[str, Any]:
+    """Format a scheduled job for API responses."""
+    scheduled_time = datetime.fromtimestamp(job.run_at, UTC)
+    return {
+        "job_id": job.job_id,
+        "swarm_name": job.spec.get("name"),
+        "status": job.status,
+        "scheduled_time": scheduled_time.isoformat(),
+        "off_peak": is_off_peak(scheduled_time),
+        "created_at": datetime.fromtimestamp(job.created_at, UTC).isoformat(),
+        "updated_at": datetime.fromtimestamp(job.updated_at, UTC).isoformat(),
+        "error": job.error,
+    }
+
+
+def schedule_swarm(swarm: SwarmSpec, user_id: str) -> Dict[str, Any]:
+    """
+    Store a swarm to run at its scheduled time, billed to ``user_id``.
+
+    Once it starts, the run is tracked like any swarm job under the same id.
+    This writes to the schedule store and must not run on the event loop.
+
+    Raises:
+        HTTPException: 400 if the spec or schedule is invalid
+    """
+    validate_swarm_spec(swarm)
+    run_at = scheduled_time_utc(swarm.schedule)
+    if run_at < datetime.now(UTC) - timedelta(minutes=1):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="scheduled_time is in the past",
+        )
+
+    job = swarm_scheduler.schedule(
+        generate_key("job"),
+        user_id,
+        run_at.timestamp(),
+        swarm.model_dump(mode="json", exclude={"schedule"}),
+    )
+    return format_scheduled_swarm(job)
+
+
+def run_scheduled_swarm(
+    spec: Dict[str, Any], user_id: str, job_id: str
+) -> Dict[str, Any]:
+    """
+    Scheduler entry point: run a stored swarm spec.
+
+    API keys are not stored with schedules, so the run is billed to the user
+    directly and its charge is recorded against the schedule's job id.
+    """
+    return run_and_cache_swarm(
+        SwarmSpec(**spec), f"schedule:{job_id}", job_id, user_id=user_id
+    )
+
+
+def dispatch_scheduled_swarm(
+    job_id: str, user_id: str, spec: Dict[str, Any], run, on_abandon
+) -> None:
+    """Hand a due scheduled swarm to the job pool so it can be polled."""
+    swarm_job_manager.submit(
+        job_id,
+        spec,
+        run,
+        owner=user_id,
+        tier=spec.get("service_tier"),
+        on_abandon=on_abandon,
+    )
+
+
+# Durable schedules, dispatched into the swarm job pool when due
+swarm_scheduler = SwarmScheduler(
+    ScheduleStore(), run_scheduled_swarm, dispatch_scheduled_swarm
+)
+
+
+INSUFFICIENT_CREDITS_DETAIL = "Insufficient credits. Fill your credit card in the dashboard at https://swarms.world/platform/account"
+
+# Cached balances, holds and batched settlement of charges
+credit_ledger = CreditLedger(create_credit_store(get_supabase_client))
+
+
+def reserve_credits(
+    api_key: str, amount: float, user_id: Optional[str] = None
+) -> Hold:
+    """
+    Places a hold on the user's credits before a billable run.
+
+    The user is looked up from ``api_key`` unless ``user_id`` is given.
+
+    Raises:
+        HTTPException: 402 if the balance cannot cover the hold, 404 if the
+            user has no credit record
+    """
+    try:
+        return credit_ledger.hold(user_id or get_user_id_from_api_key(api_key), amount)
+    except InsufficientCreditsError:
+        raise HTTPException(
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            detail=INSUFFICIENT_CREDITS_DETAIL,
+        )
+    except CreditAccountNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+
+def deduct_credits(api_key: str, amount: float, product_name: str) -> None:
+    """
+    Deducts the specified amount of credits for the user identified by api_key,
+    preferring to use free_credit before using regular credit, and logs the transaction.
+
+    The charge is applied to the cached balance immediately and written to the
+    database by the ledger's next settlement.
+    """
+    user_id = get_user_id_from_api_key(api_key)
+    try:
+        credit_ledger.charge(user_id, api_key, amount, product_name)
+    except InsufficientCreditsError:
+        raise HTTPException(
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            detail=INSUFFICIENT_CREDITS_DETAIL,
+        )
+    except CreditAccountNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+
+# Memoized, model-aware token counts for cost and usage accounting
+token_counter = TokenCounter()
+
+# Base costs per unit
+COST_PER_AGENT = 0.01  # Base cost per agent
+COST_PER_1M_INPUT_TOKENS = 2.00  # Cost per 1M input tokens
+COST_PER_1M_OUTPUT_TOKENS = 4.50  # Cost per 1M output tokens
+
+
+def estimate_llm_call_tokens(model: str, messages: Any) -> int:
+    """Prompt tokens of an outbound LLM call, for the governor's reservation."""
+    return token_counter.count(messages_text(messages), model)
+
+
+# Registered with litellm at startup to pace every outbound LLM call
+governor_callback = GovernorCallback(llm_governor, estimate=estimate_llm_call_tokens)
+
+
+def estimate_input_tokens(agent: Agent, input_text: str) -> int:
+    """
+    Estimate an agent's input tokens by tokenizing its task, system prompt and
+    memory. Used when the provider reported no usage.
+    """
+    model = getattr(agent, "model_name", None)
+    input_tokens = token_counter.count(input_text or "", model)
+
+    # Add system prompt tokens if present
+    if agent.system_prompt:
+        input_tokens += token_counter.count(agent.system_prompt, model)
+
+    # Add memory tokens if available
+    try:
+        memory = agent.short_memory.return_history_as_string()
+        if memory:
+            input_tokens += token_counter.count(str(memory), model)
+    except Exception as e:
+        logger.warning(f"Could not get memory for agent {agent.agent_name}: {str(e)}")
+
+    return input_tokens
+
+
+def count_output_tokens(
+    agent_outputs: Union[List[Dict[str, str]], Dict[str, Any], str, None],
+) -> Dict[Optional[str], int]:
+    """
+    Tokenize swarm output once, grouped by the role (agent name) that wrote it.
+
+    Output that is not a list of messages is grouped under ``None``.
+    """
+    if not agent_outputs:
+        return {}
+    if not isinstance(agent_outputs, list):
+        if not isinstance(agent_outputs, str):
+            agent_outputs = any_to_str(agent_outputs)
+        return {None: token_counter.count(agent_outputs)}
+
+    roles, contents = [], []
+    for message in agent_outputs:
+        role, content = None, message
+        if isinstance(message, dict):
+            role, content = message.get("role"), message.get("content") or ""
+        roles.append(role)
+        contents.append(content if isinstance(content, str) else any_to_str(content))
+
+    counts: Dict[Optional[str], int] = {}
+    for role, tokens in zip(roles, token_counter.count_many(contents)):
+        counts[role] = counts.get(role, 0) + tokens
+    return counts
+
+
+def is_off_peak(moment: datetime) -> bool:
+    """Whether ``moment`` falls in the night-time discount (8 PM to 6 AM Pacific)."""
+    hour = moment.astimezone(pytz.timezone("America/Los_Angeles")).hour
+    return hour >= 20 or hour < 6
+
+
+def estimate_swarm_cost(
+    swarm_spec: SwarmSpec, task: Optional[str], tasks: Optional[List[str]]
+) -> float:
+    """
+    Estimate what a swarm run will cost, to size its credit hold.
+
+    Every agent is assumed to read its system prompt and each task, and to
+    write up to its max_tokens, on every loop, at undiscounted prices.
+
+    Args:
+        swarm_spec: The swarm specification
+        task: The task to execute, if not a batch
+        tasks: The batch of tasks, if any
+
+    Returns:
+        The estimated cost
+    """
+    inputs = [task] if task is not None else list(tasks or [])
+    swarm_loops = swarm_spec.max_loops or 1
+
+    input_tokens = 0
+    output_tokens = 0
+    for agent_spec in swarm_spec.agents or []:
+        model = agent_spec.model_name or "gpt-4o-mini"
+        loops = swarm_loops * (agent_spec.max_loops or 1)
+        prompt_tokens = token_counter.count(agent_spec.system_prompt or "", model)
+        for text in inputs:
+            input_tokens += loops * (prompt_tokens + token_counter.count(text, model))
+            output_tokens += loops * (agent_spec.max_tokens or 8192)
+
+    return (
+        len(swarm_spec.agents or []) * COST_PER_AGENT
+        + (input_tokens / 1_000_000) * COST_PER_1M_INPUT_TOKENS
+        + (output_tokens / 1_000_000) * COST_PER_1M_OUTPUT_TOKENS
+    )
+
+
+def calculate_swarm_cost(
+    agents: List[Any],
     input_text: str,
     execution_time: float,
     agent_outputs: Union[List[Dict[str, str]], str] = None,  # Update agent_outputs type
@@ -1007,7 +1647,10 @@ def calculate_swarm_cost(
 ) -> Dict[str, Any]:
     """
     Calculate the cost of running a swarm based on agents, tokens, and execution time.
-    Includes system prompts, agent memory, and scaled output costs.
+
+    Token counts come from the usage the provider reported for each agent's LLM
+    calls. Agents without reported usage fall back to tokenizing their task,
+    system prompt, memory and the output messages they wrote.
 
     Args:
         agents: List of agents used in the swarm
@@ -1019,85 +1662,59 @@ def calculate_swarm_cost(
     Returns:
         Dict containing cost breakdown and total cost
     """
-    # Base costs per unit (these could be moved to environment variables)
-    COST_PER_AGENT = 0.01  # Base cost per agent
-    COST_PER_1M_INPUT_TOKENS = 2.00  # Cost per 1M input tokens
-    COST_PER_1M_OUTPUT_TOKENS = 4.50  # Cost per 1M output tokens
-
     # Flex processing discounts
     FLEX_INPUT_DISCOUNT = 0.25  # 75% discount for input tokens in flex mode
     FLEX_OUTPUT_DISCOUNT = 0.25  # 75% discount for output tokens in flex mode
 
-    # Get current time in California timezone
-    california_tz = pytz.timezone("America/Los_Angeles")
-    current_time = datetime.now(california_tz)
-    is_night_time = current_time.hour >= 20 or current_time.hour < 6  # 8 PM to 6 AM
+    is_night_time = is_off_peak(datetime.now(UTC))
 
     try:
-        # Calculate input tokens for task
-        task_tokens = count_tokens(input_text)
+        # Tokenize outputs only if some agent has no provider-reported usage
+        reported = {agent.agent_name: reported_usage(agent) for agent in agents}
+        estimated_outputs = (
+            count_output_tokens(agent_outputs)
+            if any(usage is None for usage in reported.values())
+            else {}
+        )
 
-        # Calculate total input tokens including system prompts and memory for each agent
         total_input_tokens = 0
         total_output_tokens = 0
         per_agent_tokens = {}
         agent_cost = 0
 
-        for i, agent in enumerate(agents):
-            agent_input_tokens = task_tokens  # Base task tokens
+        for agent in agents:
+            usage = reported[agent.agent_name]
+            # Messages this agent wrote are covered by its own usage or estimate
+            estimated_output = estimated_outputs.pop(agent.agent_name, 0)
 
-            # Add system prompt tokens if present
-            if agent.system_prompt:
-                agent_input_tokens += count_tokens(agent.system_prompt)
-
-            # Add memory tokens if available
-            try:
-                memory = agent.short_memory.return_history_as_string()
-                if memory:
-                    memory_tokens = count_tokens(str(memory))
-                    agent_input_tokens += memory_tokens
-            except Exception as e:
-                logger.warning(
-                    f"Could not get memory for agent {agent.agent_name}: {str(e)}"
-                )
-
-            # Calculate actual output tokens if available, otherwise estimate
-            if agent_outputs:
-                if isinstance(agent_outputs, list):
-                    # Sum tokens for each dictionary's content
-                    agent_output_tokens = sum(
-                        count_tokens(message["content"]) for message in agent_outputs
-                    )
-                elif isinstance(agent_outputs, str):
-                    agent_output_tokens = count_tokens(agent_outputs)
-                elif isinstance(agent_outputs, dict):
-                    agent_output_tokens = count_tokens(any_to_str(agent_outputs))
-                else:
-                    agent_output_tokens = any_to_str(agent_outputs)
+            if usage is not None:
+                agent_input_tokens = usage["input_tokens"]
+                agent_output_tokens = usage["output_tokens"]
             else:
-                agent_output_tokens = int(
-                    agent_input_tokens * 2.5
-                )  # Estimated output tokens
+                agent_input_tokens = estimate_input_tokens(agent, input_text)
+                agent_output_tokens = estimated_output
 
             # Store per-agent token counts
             per_agent_tokens[agent.agent_name] = {
                 "input_tokens": agent_input_tokens,
                 "output_tokens": agent_output_tokens,
                 "total_tokens": agent_input_tokens + agent_output_tokens,
+                "usage_source": "provider" if usage is not None else "estimated",
             }
 
             # Add to totals
             total_input_tokens += agent_input_tokens
             total_output_tokens += agent_output_tokens
 
+        # Output not attributable to a specific agent is counted once
+        total_output_tokens += sum(estimated_outputs.values())
+
         # Calculate costs (convert to millions of tokens)
         agent_cost = len(agents) * COST_PER_AGENT
-        input_token_cost = (
-            (total_input_tokens / 1_000_000) * COST_PER_1M_INPUT_TOKENS * len(agents)
-        )
+        input_token_cost = (total_input_tokens / 1_000_000) * COST_PER_1M_INPUT_TOKENS
         output_token_cost = (
-            (total_output_tokens / 1_000_000) * COST_PER_1M_OUTPUT_TOKENS * len(agents)
-        )
+            total_output_tokens / 1_000_000
+        ) * COST_PER_1M_OUTPUT_TOKENS
 
         # Apply flex processing discounts if applicable
         if service_tier == "flex":
@@ -1147,6 +1764,9 @@ def calculate_agent_cost(
     """
     Calculate the cost for a single agent based on its input, output, and execution time.
 
+    Uses the provider-reported usage of the agent's LLM calls, falling back to
+    tokenizing its input and output.
+
     Args:
         agent: The agent instance
         input_text: The input task/prompt text
@@ -1156,50 +1776,16 @@ def calculate_agent_cost(
     Returns:
         Dict containing cost breakdown and total cost for this agent
     """
-    # Base costs per unit
-    COST_PER_AGENT = 0.01  # Base cost per agent
-    COST_PER_1M_INPUT_TOKENS = 2.00  # Cost per 1M input tokens
-    COST_PER_1M_OUTPUT_TOKENS = 4.50  # Cost per 1M output tokens
-
-    # Get current time in California timezone
-    california_tz = pytz.timezone("America/Los_Angeles")
-    current_time = datetime.now(california_tz)
-    is_night_time = current_time.hour >= 20 or current_time.hour < 6  # 8 PM to 6 AM
+    is_night_time = is_off_peak(datetime.now(UTC))
 
     try:
-        # Calculate input tokens
-        input_tokens = count_tokens(input_text)  # Base task tokens
-
-        # Add system prompt tokens if present
-        if agent.system_prompt:
-            input_tokens += count_tokens(agent.system_prompt)
-
-        # Add memory tokens if available
-        try:
-            memory = agent.short_memory.return_history_as_string()
-            if memory:
-                memory_tokens = count_tokens(str(memory))
-                input_tokens += memory_tokens
-        except Exception as e:
-            logger.warning(
-                f"Could not get memory for agent {agent.agent_name}: {str(e)}"
-            )
-
-        # Calculate output tokens
-        if agent_output:
-            if isinstance(agent_output, list):
-                # Sum tokens for each dictionary's content
-                output_tokens = sum(
-                    count_tokens(message["content"]) for message in agent_output
-                )
-            elif isinstance(agent_output, str):
-                output_tokens = count_tokens(agent_output)
-            elif isinstance(agent_output, dict):
-                output_tokens = count_tokens(any_to_str(agent_output))
-            else:
-                output_tokens = count_tokens(any_to_str(agent_output))
+        usage = reported_usage(agent)
+        if usage is not None:
+            input_tokens = usage["input_tokens"]
+            output_tokens = usage["output_tokens"]
         else:
-            output_tokens = int(input_tokens * 2.5)  # Estimated output tokens
+            input_tokens = estimate_input_tokens(agent, input_text)
+            output_tokens = sum(count_output_tokens(agent_output).values())
 
         # Calculate base costs (convert to millions of tokens)
         agent_base_cost = COST_PER_AGENT
@@ -1302,7 +1888,7 @@ async def telemetry_middleware(request: Request, call_next):
         api_key = request.headers.get("x-api-key")
 
         # Log telemetry to database if we have an API key
-        if api_key:
+        if api_key and should_log_path(request.url.path):
             try:
                 await log_api_request(
                     api_key,
@@ -1332,7 +1918,7 @@ async def telemetry_middleware(request: Request, call_next):
 
         # Try to log error telemetry if we have an API key
         api_key = request.headers.get("x-api-key")
-        if api_key:
+        if api_key and should_log_path(request.url.path):
             try:
                 await log_api_request(
                     api_key,
@@ -1350,6 +1936,30 @@ async def telemetry_middleware(request: Request, call_next):
         raise  # Re-raise the original exception
 
 
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    """
+    Records each request's latency by method, route template and status.
+
+    Streaming responses are measured until their headers are sent.
+    """
+    start_time = time()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        # The template keeps ids out of the labels; unmatched paths share one
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        request_duration.observe(
+            time() - start_time,
+            method=request.method,
+            route=route,
+            status=str(status_code),
+        )
+
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
@@ -1380,12 +1990,33 @@ async def check_swarm_types() -> Dict[Any, Any]:
         Depends(rate_limiter),
     ],
 )
-async def run_swarm(swarm: SwarmSpec, x_api_key=Header(...)) -> Dict[str, Any]:
+async def run_swarm(
+    swarm: SwarmSpec, request: Request, x_api_key=Header(...)
+) -> Dict[str, Any]:
     """
     Run a swarm with the specified task.
+
+    When ``stream`` is set the response is a Server-Sent Events stream of agent
+    tokens and completions, ending with the full swarm response. A swarm with
+    a ``schedule`` is stored and runs at its scheduled time instead.
     """
+    if swarm.schedule is not None:
+        return await asyncio.to_thread(
+            schedule_swarm, swarm, request.state.auth.user_id
+        )
+
+    if swarm.stream:
+        validate_swarm_spec(swarm)
+        return StreamingResponse(
+            stream_swarm_completion(swarm, x_api_key),
+            media_type=SSE_MEDIA_TYPE,
+            headers=SSE_HEADERS,
+        )
+
     try:
         return await run_swarm_completion(swarm, x_api_key)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error running swarm: {str(e)}")
         raise HTTPException(
@@ -1393,66 +2024,223 @@ async def run_swarm(swarm: SwarmSpec, x_api_key=Header(...)) -> Dict[str, Any]:
         )
 
 
-# Cache for agent configurations and results
-agent_cache = {}
-CACHE_TTL = 300  # 5 minutes
-CACHE_CLEANUP_INTERVAL = 60  # 1 minute
+@app.post(
+    "/v1/swarm/jobs",
+    status_code=status.HTTP_202_ACCEPTED,
+    dependencies=[
+        Depends(verify_api_key),
+        Depends(rate_limiter),
+    ],
+)
+async def submit_swarm_job(
+    swarm: SwarmSpec, request: Request, x_api_key=Header(...)
+) -> Dict[str, Any]:
+    """
+    Queue a swarm for background execution and return its job id immediately.
+
+    Poll ``/v1/swarm/jobs/{job_id}`` for status and results. A swarm with a
+    ``schedule`` is stored and queued at its scheduled time instead.
+    """
+    if swarm.schedule is not None:
+        return await asyncio.to_thread(
+            schedule_swarm, swarm, request.state.auth.user_id
+        )
+
+    # Reject invalid specs up front instead of failing inside the worker
+    validate_swarm_spec(swarm)
+
+    job_id = generate_key("job")
+    try:
+        job = swarm_job_manager.submit(
+            job_id,
+            swarm.model_dump(mode="json"),
+            run_and_cache_swarm,
+            swarm,
+            x_api_key,
+            job_id,
+            owner=request.state.auth.user_id,
+            tier=swarm.service_tier,
+        )
+    except JobQueueFullError as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e)
+        )
 
+    return {
+        "job_id": job.job_id,
+        "status": job.status.value,
+        "created_at": job.created_at.isoformat(),
+    }
 
-def cleanup_agent_cache():
-    """Clean up expired cache entries"""
-    current_time = time()
-    expired_keys = [
-        k for k, v in agent_cache.items() if current_time - v["timestamp"] > CACHE_TTL
-    ]
-    for k in expired_keys:
-        del agent_cache[k]
 
+@app.get(
+    "/v1/swarm/jobs/{job_id}",
+    dependencies=[
+        Depends(verify_api_key),
+        Depends(rate_limiter),
+    ],
+)
+async def get_swarm_job(job_id: str, request: Request) -> Dict[str, Any]:
+    """
+    Get the status of a swarm job, including its result once finished.
+    """
+    owner = request.state.auth.user_id
+    job_status = swarm_job_manager.get_status(job_id, owner=owner)
+    if job_status is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Job not found"
+        )
 
-@app.post(
-    "/v1/agent/completions",
+    result = swarm_job_manager.get_result(job_id, owner=owner)
+    return {
+        **job_status.model_dump(mode="json"),
+        "result": result.model_dump(mode="json") if result else None,
+    }
+
+
+@app.delete(
+    "/v1/swarm/jobs/{job_id}",
     dependencies=[
         Depends(verify_api_key),
         Depends(rate_limiter),
     ],
 )
-async def run_agent(
-    agent_completion: AgentCompletion, x_api_key=Header(...)
+async def cancel_swarm_job(job_id: str, request: Request) -> Dict[str, Any]:
+    """
+    Cancel a swarm job that has not started running yet.
+    """
+    owner = request.state.auth.user_id
+    if swarm_job_manager.get_status(job_id, owner=owner) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Job not found"
+        )
+    # Cancelling a scheduled job also records it in the schedule store
+    if not await asyncio.to_thread(swarm_job_manager.cancel, job_id, owner):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Job is already running or finished",
+        )
+    return {"job_id": job_id, "status": "cancelled"}
+
+
+@app.get(
+    "/v1/swarm/schedule",
+    dependencies=[
+        Depends(verify_api_key),
+        Depends(rate_limiter),
+    ],
+)
+async def list_scheduled_swarms(
+    request: Request, limit: int = Query(default=100, ge=1, le=1000)
 ) -> Dict[str, Any]:
     """
-    Run an agent with the specified task.
+    List the scheduled swarms of the API key's user, soonest first.
     """
-    try:
-        current_time = time()
+    jobs = await asyncio.to_thread(
+        swarm_scheduler.list, request.state.auth.user_id, limit
+    )
+    return {
+        "count": len(jobs),
+        "scheduled_jobs": [format_scheduled_swarm(job) for job in jobs],
+    }
 
-        # Check cache first
-        cache_key = (
-            f"{agent_completion.agent_config.model_dump_json()}_{agent_completion.task}"
+
+@app.get(
+    "/v1/swarm/schedule/{job_id}",
+    dependencies=[
+        Depends(verify_api_key),
+        Depends(rate_limiter),
+    ],
+)
+async def get_scheduled_swarm(job_id: str, request: Request) -> Dict[str, Any]:
+    """
+    Get a scheduled swarm. Once it has started, its result is available from
+    ``/v1/swarm/jobs/{job_id}``.
+    """
+    job = await asyncio.to_thread(
+        swarm_scheduler.get, job_id, request.state.auth.user_id
+    )
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Scheduled job not found"
         )
-        if cache_key in agent_cache:
-            cached_data = agent_cache[cache_key]
-            if current_time - cached_data["timestamp"] <= CACHE_TTL:
-                logger.debug("Returning cached agent result")
-                return cached_data["response"]
-
-        # Validate agent configuration
-        if not agent_completion.agent_config.agent_name:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST, detail="Agent name is required"
-            )
+    return format_scheduled_swarm(job)
 
-        try:
-            # Create agent from the config
-            agent = Agent(
-                **agent_completion.agent_config.model_dump(),
-                output_type="dict-all-except-first",
-            )
-        except ValueError as ve:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Invalid agent configuration: {str(ve)}",
+
+@app.delete(
+    "/v1/swarm/schedule/{job_id}",
+    dependencies=[
+        Depends(verify_api_key),
+        Depends(rate_limiter),
+    ],
+)
+async def cancel_scheduled_swarm(job_id: str, request: Request) -> Dict[str, Any]:
+    """
+    Cancel a scheduled swarm that has not started yet.
+    """
+    owner = request.state.auth.user_id
+    if await asyncio.to_thread(swarm_scheduler.get, job_id, owner) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Scheduled job not found"
+        )
+    if not await asyncio.to_thread(swarm_scheduler.cancel, job_id, owner):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Scheduled job has already started or finished",
+        )
+    return {"job_id": job_id, "status": "cancelled"}
+
+
+def execute_agent_completion(
+    agent_completion: AgentCompletion, event_stream: Optional[EventStream] = None
+) -> Dict[str, Any]:
+    """
+    Build and run an agent for a completion request and format the response.
+
+    This is blocking and must be run on a worker thread, never on the event loop.
+
+    Args:
+        agent_completion: The agent configuration and task
+        event_stream: Optional stream that receives the agent's tokens
+
+    Returns:
+        Dict[str, Any]: The formatted agent response
+    """
+    # Validate agent configuration
+    if not agent_completion.agent_config.agent_name:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Agent name is required"
+        )
+
+    streaming_kwargs = {}
+    if event_stream is not None:
+        streaming_kwargs = {
+            "streaming_on": True,
+            "streaming_callback": event_stream.token_callback(
+                agent_completion.agent_config.agent_name
+            ),
+        }
+
+    agent_kwargs = dict(
+        **agent_completion.agent_config.model_dump(exclude={"routing_models"}),
+        output_type="dict-all-except-first",
+    )
+
+    try:
+        # Create agent from the config; only non-streaming agents are pooled
+        if event_stream is not None:
+            agent = Agent(**agent_kwargs, **streaming_kwargs)
+        else:
+            agent = acquire_pooled_agent(
+                agent_kwargs, routing_models(agent_completion.agent_config)
             )
+    except ValueError as ve:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid agent configuration: {str(ve)}",
+        )
 
+    try:
         try:
             # Run the agent with the provided task
             result = agent.run(task=agent_completion.task)
@@ -1470,10 +2258,15 @@ async def run_agent(
             logger.error(f"Failed to generate unique ID: {str(key_error)}")
             unique_id = str(uuid4())  # Fallback to UUID if key generation fails
 
-        # Calculate tokens once and reuse
-        input_text = agent_completion.task + agent.system_prompt + agent.name
-        input_tokens = count_tokens(input_text)
-        output_tokens = count_tokens(any_to_str(result))
+        # Prefer the usage the provider reported; tokenize only as a fallback
+        usage = reported_usage(agent)
+        if usage is not None:
+            input_tokens, output_tokens = usage["input_tokens"], usage["output_tokens"]
+        else:
+            input_text = agent_completion.task + agent.system_prompt + agent.name
+            input_tokens, output_tokens = token_counter.count_many(
+                [input_text, any_to_str(result)], agent.model_name
+            )
 
         usage_data = {
             "input_tokens": input_tokens,
@@ -1481,7 +2274,7 @@ async def run_agent(
             "total_tokens": input_tokens + output_tokens,
         }
 
-        output = {
+        return {
             "id": unique_id,
             "success": True,
             "name": agent.name,
@@ -1491,16 +2284,115 @@ async def run_agent(
             "usage": usage_data,
             "timestamp": datetime.now(UTC).isoformat(),
         }
+    finally:
+        agent_pool.release(agent)
+
+
+def execute_and_cache_agent(
+    agent_completion: AgentCompletion,
+    cache_key: str,
+    event_stream: Optional[EventStream] = None,
+) -> Dict[str, Any]:
+    """
+    Runs the agent and caches the response under ``cache_key``.
+    """
+    output = execute_agent_completion(agent_completion, event_stream)
+    response_cache.set("agent", cache_key, output)
+    return output
+
+
+def run_and_cache_agent(
+    agent_completion: AgentCompletion,
+    cache_key: str,
+    x_api_key: str,
+    event_stream: Optional[EventStream] = None,
+) -> Dict[str, Any]:
+    """
+    Worker entry point for agent runs.
+
+    If an identical request with the same API key is already running, waits
+    for its result instead of running the agent again.
+    """
+    return request_flights.do(
+        flight_key(cache_key, x_api_key),
+        execute_and_cache_agent,
+        agent_completion,
+        cache_key,
+        event_stream,
+    )
+
+
+async def stream_agent_completion(
+    agent_completion: AgentCompletion, cache_key: str, x_api_key: str
+):
+    """
+    Run an agent and yield its tokens and final response as SSE frames.
+    """
+    event_stream = EventStream(executor=get_executor("swarm_run"))
+    outputs = []
+
+    # Keep the response for logging without reading it back from the cache
+    def run_and_keep() -> Dict[str, Any]:
+        outputs.append(
+            run_and_cache_agent(agent_completion, cache_key, x_api_key, event_stream)
+        )
+        return outputs[0]
+
+    async for frame in event_stream.run(run_and_keep):
+        yield frame
+
+    if outputs:
+        await log_api_request(api_key=x_api_key, data=outputs[0])
+
+
+@app.post(
+    "/v1/agent/completions",
+    dependencies=[
+        Depends(verify_api_key),
+        Depends(rate_limiter),
+    ],
+)
+async def run_agent(
+    agent_completion: AgentCompletion, x_api_key=Header(...)
+) -> Dict[str, Any]:
+    """
+    Run an agent with the specified task.
+
+    When ``stream`` is set the response is a Server-Sent Events stream of
+    tokens, ending with the full agent response.
+    """
+    try:
+        # Check cache first
+        cache_key = generate_agent_cache_key(agent_completion)
+        cached_data = await response_cache.aget("agent", cache_key)
+        if cached_data is not None:
+            logger.debug("Returning cached agent result")
+            if agent_completion.stream:
+                return StreamingResponse(
+                    stream_result(cached_data),
+                    media_type=SSE_MEDIA_TYPE,
+                    headers=SSE_HEADERS,
+                )
+            return cached_data
 
-        # Cache the result
-        agent_cache[cache_key] = {"response": output, "timestamp": current_time}
+        if agent_completion.stream:
+            return StreamingResponse(
+                stream_agent_completion(agent_completion, cache_key, x_api_key),
+                media_type=SSE_MEDIA_TYPE,
+                headers=SSE_HEADERS,
+            )
 
-        # Clean up cache periodically
-        if current_time % CACHE_CLEANUP_INTERVAL < 1:
-            cleanup_agent_cache()
+        # Run the blocking agent off the event loop, joining an identical run
+        # that is already in flight
+        output = await request_flights.do_async(
+            flight_key(cache_key, x_api_key),
+            execute_and_cache_agent,
+            agent_completion,
+            cache_key,
+        )
 
         try:
-            log_api_request(api_key=x_api_key, data=output)
+            await log_api_request(api_key=x_api_key, data=output)
         except Exception as log_error:
             logger.error(f"Failed to log API request: {str(log_error)}")
             # Continue execution even if logging fails
@@ -1509,6 +2401,8 @@ async def run_agent(
     except HTTPException:
         # Re-raise HTTP exceptions as they're already properly formatted
         raise
+    except ExecutorSaturatedError as e:
+        raise service_busy(e)
     except Exception as e:
         logger.error(f"Unexpected error running agent: {str(e)}")
         logger.exception(e)  # Log full traceback
@@ -1518,6 +2412,104 @@ async def run_agent(
         )
 
 
+def process_batch_swarm(swarm: SwarmSpec, x_api_key: str) -> Dict[str, Any]:
+    """Run one swarm of a batch, reporting failures in the result."""
+    try:
+        # Create and run the swarm directly; it was admitted before it got
+        # its batch worker
+        result = create_swarm(swarm, x_api_key)
+        return {"status": "success", "swarm_name": swarm.name, "result": result}
+    except HTTPException as http_exc:
+        logger.error("HTTPException occurred: {}", http_exc.detail)
+        return {
+            "status": "error",
+            "swarm_name": swarm.name,
+            "detail": http_exc.detail,
+        }
+    except Exception as e:
+        logger.error("Error running swarm {}: {}", swarm.name, str(e))
+        logger.exception(e)
+        return {
+            "status": "error",
+            "swarm_name": swarm.name,
+            "detail": f"Failed to run swarm: {str(e)}",
+        }
+
+
+# Shares the batch executor fairly between the batches of different API keys.
+# Each item is admitted by its swarm's service tier before it takes a worker
+batch_scheduler = FairBatchScheduler(
+    admission.executor(
+        get_executor("batch"), lambda run, index: run.items[index].service_tier
+    )
+)
+
+
+async def iter_batch_results(
+    swarms: List[SwarmSpec],
+    x_api_key: str,
+    concurrency: int,
+    heartbeat: Optional[float] = None,
+):
+    """
+    Yield each swarm's result, tagged with its index, as soon as it finishes.
+
+    Identical swarms in the batch run once; their result is yielded for every
+    index they appear at.
+    """
+    indices_by_key: Dict[str, List[int]] = {}
+    for index, swarm in enumerate(swarms):
+        key = make_cache_key("batch_swarm", swarm.model_dump(mode="json"))
+        indices_by_key.setdefault(key, []).append(index)
+    groups = list(indices_by_key.values())
+    if len(groups) < len(swarms):
+        logger.info(
+            "Batch of {} swarms has {} distinct swarms", len(swarms), len(groups)
+        )
+
+    async for outcome in iter_batch(
+        batch_scheduler,
+        x_api_key,
+        lambda swarm: process_batch_swarm(swarm, x_api_key),
+        [swarms[indices[0]] for indices in groups],
+        concurrency,
+        heartbeat=heartbeat,
+    ):
+        if outcome is None:
+            yield None
+            continue
+        unique_index, result, error = outcome
+        indices = groups[unique_index]
+        if error is not None:
+            result = {
+                "status": "error",
+                "swarm_name": swarms[indices[0]].name,
+                "detail": f"Failed to run swarm: {str(error)}",
+            }
+        for index in indices:
+            yield {"index": index, **result}
+
+
+async def stream_batch_completions(
+    swarms: List[SwarmSpec], x_api_key: str, concurrency: int
+):
+    """
+    Yield batch results as NDJSON lines.
+
+    Every line has an ``event``: ``result`` lines carry one swarm's result and
+    its input ``index``, ``heartbeat`` lines keep idle connections open and a
+    final ``done`` line closes the stream.
+    """
+    async for result in iter_batch_results(
+        swarms, x_api_key, concurrency, heartbeat=BATCH_HEARTBEAT_INTERVAL
+    ):
+        if result is None:
+            yield json.dumps({"event": "heartbeat"}) + "\n"
+        else:
+            yield json.dumps({"event": "result", **result}, default=str) + "\n"
+    yield json.dumps({"event": "done", "count": len(swarms)}) + "\n"
+
+
 @app.post(
     "/v1/swarm/batch/completions",
     dependencies=[
@@ -1525,51 +2517,33 @@ async def run_agent(
         Depends(rate_limiter),
     ],
 )
-def run_batch_completions(
-    swarms: List[SwarmSpec], x_api_key=Header(...)
-) -> List[Dict[str, Any]]:
+async def run_batch_completions(
+    swarms: List[SwarmSpec],
+    x_api_key=Header(...),
+    stream: bool = False,
+    concurrency: Optional[int] = Query(default=None, ge=1),
+):
     """
-    Run a batch of swarms with the specified tasks using a thread pool.
-    """
-    results = []
-
-    def process_swarm(swarm):
-        try:
-            # Create and run the swarm directly
-            result = create_swarm(swarm, x_api_key)
-            return {"status": "success", "swarm_name": swarm.name, "result": result}
-        except HTTPException as http_exc:
-            logger.error("HTTPException occurred: {}", http_exc.detail)
-            return {
-                "status": "error",
-                "swarm_name": swarm.name,
-                "detail": http_exc.detail,
-            }
-        except Exception as e:
-            logger.error("Error running swarm {}: {}", swarm.name, str(e))
-            logger.exception(e)
-            return {
-                "status": "error",
-                "swarm_name": swarm.name,
-                "detail": f"Failed to run swarm: {str(e)}",
-            }
+    Run a batch of swarms with the specified tasks.
 
-    # Use ThreadPoolExecutor for concurrent execution
-    with ThreadPoolExecutor(max_workers=min(len(swarms), 10)) as executor:
-        # Submit all swarms to the thread pool
-        future_to_swarm = {
-            executor.submit(process_swarm, swarm): swarm for swarm in swarms
-        }
-
-        # Collect results as they complete
-        for future in as_completed(future_to_swarm):
-            result = future.result()
-            results.append(result)
+    Up to ``concurrency`` swarms of the batch run at once (capped by the
+    server). With ``stream`` set, results are streamed as NDJSON as each swarm
+    finishes; otherwise they are returned together, in input order.
+    """
+    concurrency = batch_concurrency(concurrency)
+    if stream:
+        return StreamingResponse(
+            stream_batch_completions(swarms, x_api_key, concurrency),
+            media_type=NDJSON_MEDIA_TYPE,
+            headers=SSE_HEADERS,
+        )
 
-    return results
+    results = [
+        result async for result in iter_batch_results(swarms, x_api_key, concurrency)
+    ]
+    return sorted(results, key=lambda result: result["index"])
 
 
-# Add this new endpoint
 @app.get(
     "/v1/swarm/logs",
     dependencies=[
@@ -1577,24 +2551,54 @@ def run_batch_completions(
         Depends(rate_limiter),
     ],
 )
-async def get_logs(x_api_key: str = Header(...)) -> Dict[str, Any]:
+async def get_logs(
+    x_api_key: str = Header(...),
+    limit: int = Query(default=100, ge=1, le=LOG_PAGE_MAX),
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    path: Optional[str] = None,
+    fields: Optional[str] = None,
+    stream: bool = False,
+):
     """
-    Get all API request logs for the provided API key.
+    Get API request logs for the provided API key, newest first.
+
+    Returns ``limit`` entries and a ``next_cursor`` to pass as ``cursor`` for
+    the following page. ``since``/``until`` and ``path`` filter the entries
+    and ``fields`` (comma-separated, e.g. ``created_at,data->path``) selects
+    columns. With ``stream`` set, every matching entry is streamed as NDJSON.
     """
     try:
-        logs = await get_api_key_logs(x_api_key)
-        return {
-            "status": "success",
-            "count": len(logs),
-            "logs": logs,
-            "timestamp": datetime.now(UTC).isoformat(),
-        }
-    except Exception as e:
-        logger.error(f"Error in get_logs endpoint: {str(e)}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)
+        query = LogQuery(
+            limit=limit,
+            cursor=cursor,
+            since=since,
+            until=until,
+            path=path,
+            fields=parse_fields(fields),
+        )
+        if cursor is not None:
+            decode_cursor(cursor)
+    except InvalidLogQueryError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    if stream:
+        return StreamingResponse(
+            stream_api_key_logs(x_api_key, query),
+            media_type=NDJSON_MEDIA_TYPE,
+            headers=SSE_HEADERS,
         )
 
+    logs, next_cursor = await get_api_key_logs(x_api_key, query)
+    return {
+        "status": "success",
+        "count": len(logs),
+        "logs": logs,
+        "next_cursor": next_cursor,
+        "timestamp": datetime.now(UTC).isoformat(),
+    }
+
 
 @app.get(
     "/v1/models/available",
@@ -1609,10 +2613,151 @@ async def get_available_models() -> Dict[str, Any]:
     out = {
         "success": True,
         "models": model_list,
+        # Live measurements used to route agents with routing_models
+        "routing": llm_guard.router.stats()["models"],
     }
     return out
 
 
+def collect_component_metrics() -> List[MetricFamily]:
+    """Turn the stats of caches, executors and LLM guards into metric families."""
+    caches = {
+        f"response_{namespace}": (
+            counters["hits"] + counters["disk_hits"],
+            counters["misses"],
+        )
+        for namespace, counters in response_cache.stats()["namespaces"].items()
+    }
+    for name, component in (
+        ("agent_pool", agent_pool),
+        ("auth", auth_cache),
+        ("token_count", token_counter),
+    ):
+        stats = component.stats()
+        caches[name] = (stats["hits"] + stats.get("stale_hits", 0), stats["misses"])
+
+    executors = executor_stats()
+    governor = llm_governor.stats()["models"]
+    breakers = llm_guard.stats()["breakers"]
+    admission_stats = admission.stats()
+    return [
+        MetricFamily(
+            "cache_hits_total",
+            "counter",
+            "Cache lookups that found an entry",
+            [({"cache": name}, hits) for name, (hits, _) in caches.items()],
+        ),
+        MetricFamily(
+            "cache_misses_total",
+            "counter",
+            "Cache lookups that found no entry",
+            [({"cache": name}, misses) for name, (_, misses) in caches.items()],
+        ),
+        MetricFamily(
+            "cache_hit_ratio",
+            "gauge",
+            "Share of cache lookups since startup that were hits",
+            [
+                ({"cache": name}, hit_ratio(hits, misses))
+                for name, (hits, misses) in caches.items()
+            ],
+        ),
+        MetricFamily(
+            "executor_queue_depth",
+            "gauge",
+            "Tasks waiting for a worker",
+            [({"executor": name}, s["queued"]) for name, s in executors.items()],
+        ),
+        MetricFamily(
+            "executor_active_workers",
+            "gauge",
+            "Workers running a task",
+            [({"executor": name}, s["active"]) for name, s in executors.items()],
+        ),
+        MetricFamily(
+            "executor_rejected_total",
+            "counter",
+            "Tasks rejected because the queue was full",
+            [({"executor": name}, s["rejected"]) for name, s in executors.items()],
+        ),
+        MetricFamily(
+            "swarm_runs_in_progress",
+            "gauge",
+            "Swarm runs holding an admission slot",
+            [({}, admission_stats["running"])],
+        ),
+        MetricFamily(
+            "llm_governor_queued",
+            "gauge",
+            "LLM calls waiting for rate limit budget",
+            [({"model": model}, s["queued"]) for model, s in governor.items()],
+        ),
+        MetricFamily(
+            "llm_governor_wait_seconds_total",
+            "counter",
+            "Time LLM calls spent waiting for rate limit budget",
+            [
+                ({"model": model}, s["wait_seconds_total"])
+                for model, s in governor.items()
+            ],
+        ),
+        MetricFamily(
+            "llm_circuit_breaker_open",
+            "gauge",
+            "Whether calls to a provider are being rejected (1) or let through (0)",
+            [
+                ({"provider": provider}, float(s["state"] == "open"))
+                for provider, s in breakers.items()
+            ],
+        ),
+    ]
+
+
+metrics.add_collector(collect_component_metrics)
+
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics() -> Response:
+    """Serve every metric in the Prometheus text format."""
+    return Response(content=metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+# Samples every thread on request; costs nothing while no profile runs
+profiler = SamplingProfiler()
+
+
+@app.get(
+    "/v1/admin/profile",
+    dependencies=[Depends(verify_admin_token)],
+    include_in_schema=False,
+)
+async def profile_process(
+    seconds: float = Query(10, gt=0, le=PROFILE_MAX_SECONDS),
+    interval: float = Query(PROFILE_DEFAULT_INTERVAL, ge=PROFILE_MIN_INTERVAL),
+    idle: bool = Query(False, description="Include threads waiting for work"),
+) -> Response:
+    """
+    Profile this worker for ``seconds`` and return flamegraph-ready stacks.
+
+    Every thread is sampled, including the executors running swarms, so the
+    output shows where requests spend their wall-clock time.
+    """
+    try:
+        result = await asyncio.to_thread(profiler.profile, seconds, interval, idle)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return Response(
+        content=result.collapsed(),
+        media_type="text/plain; charset=utf-8",
+        headers={
+            "X-Profile-Samples": str(result.samples),
+            "X-Profile-Duration": f"{result.duration:.3f}",
+        },
+    )
+
+
 @app.get("/healthz/")
 async def health_check():
     """Health check endpoint."""
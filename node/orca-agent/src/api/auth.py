@@ -0,0 +1,231 @@
+"""Cached API key authentication.
+
+Every authenticated request needs to know whether its API key is valid and who
+owns it. :class:`AuthCache` answers both from one cached lookup per key:
+
+- Entries expire after ``ttl`` seconds, so revoked keys stop working without a
+  restart.
+- Unknown keys are cached too (for ``negative_ttl``) so repeated bad keys do
+  not hit the database.
+- A valid entry that has just expired is still served for up to ``stale_ttl``
+  seconds while a background refresh fetches the new value.
+- Concurrent misses for the same key share a single database lookup.
+- :meth:`AuthCache.aget` serves async callers; its misses await
+  ``async_loader`` instead of blocking a thread.
+
+Operator endpoints (e.g. profiling) are not tied to API keys; they take the
+shared ``ADMIN_TOKEN`` instead, checked by :func:`is_admin_token`.
+"""
+
+import asyncio
+import hmac
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+from time import time
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional
+
+from dotenv import load_dotenv
+from loguru import logger
+
+load_dotenv()
+
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_NEGATIVE_TTL = float(os.getenv("AUTH_CACHE_NEGATIVE_TTL", "30"))
+AUTH_CACHE_STALE_TTL = float(os.getenv("AUTH_CACHE_STALE_TTL", "300"))
+AUTH_CACHE_MAX_SIZE = int(os.getenv("AUTH_CACHE_MAX_SIZE", "10000"))
+# Token for operator endpoints; they are disabled while it is unset
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+
+class AuthInfo(NamedTuple):
+    """Result of an API key lookup."""
+
+    valid: bool
+    user_id: Optional[str] = None
+    tier: Optional[str] = None
+
+
+INVALID_KEY = AuthInfo(valid=False)
+
+
+class _Entry(NamedTuple):
+    info: AuthInfo
+    expires_at: float
+
+
+class AuthCache:
+    """
+    TTL cache of API key lookups with stale-while-revalidate and single-flight.
+
+    Args:
+        loader: Blocking function returning the AuthInfo for a key; raises on
+            backend errors (errors are never cached)
+        ttl: Seconds a valid key is served without revalidation
+        negative_ttl: Seconds an invalid key is remembered
+        stale_ttl: Extra seconds an expired valid key is served while refreshing
+        max_size: Maximum number of cached keys (least recently used are dropped)
+        async_loader: Coroutine function used by :meth:`aget` misses; stale
+            entries are still refreshed in the background with ``loader``
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[str], AuthInfo],
+        ttl: float = AUTH_CACHE_TTL,
+        negative_ttl: float = AUTH_CACHE_NEGATIVE_TTL,
+        stale_ttl: float = AUTH_CACHE_STALE_TTL,
+        max_size: int = AUTH_CACHE_MAX_SIZE,
+        clock: Callable[[], float] = time,
+        async_loader: Optional[Callable[[str], Awaitable[AuthInfo]]] = None,
+    ):
+        self.loader = loader
+        self.async_loader = async_loader
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stale_ttl = stale_ttl
+        self.max_size = max_size
+        self._clock = clock
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(
+            max_workers=4, thread_name_prefix="auth-refresh"
+        )
+        self._stats = {"hits": 0, "stale_hits": 0, "misses": 0, "loads": 0}
+
+    def _lookup(self, api_key: str) -> tuple[Optional[AuthInfo], Optional[Future], bool]:
+        """
+        Serve ``api_key`` from the cache or join or start its load.
+
+        Returns the cached info (None on a miss), the load's future and
+        whether the caller must run the load.
+        """
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(api_key)
+            if entry is not None:
+                self._entries.move_to_end(api_key)
+                if now < entry.expires_at:
+                    self._stats["hits"] += 1
+                    return entry.info, None, False
+                if entry.info.valid and now < entry.expires_at + self.stale_ttl:
+                    self._stats["stale_hits"] += 1
+                    self._start_load(api_key, background=True)
+                    return entry.info, None, False
+            self._stats["misses"] += 1
+            future, owner = self._start_load(api_key, background=False)
+        return None, future, owner
+
+    def get(self, api_key: str) -> AuthInfo:
+        """Return the AuthInfo for a key, loading it if necessary."""
+        info, future, owner = self._lookup(api_key)
+        if info is not None:
+            return info
+        if owner:
+            self._load(api_key, future)
+        return future.result()
+
+    async def aget(self, api_key: str) -> AuthInfo:
+        """Return the AuthInfo for a key without blocking the event loop."""
+        if self.async_loader is None:
+            return await asyncio.to_thread(self.get, api_key)
+        info, future, owner = self._lookup(api_key)
+        if info is not None:
+            return info
+        if owner:
+            try:
+                info = await self.async_loader(api_key)
+            except BaseException as e:
+                # Settle the load even if we are cancelled, so followers and
+                # later callers do not wait on it forever
+                if not isinstance(e, Exception):
+                    e = RuntimeError("API key lookup was cancelled")
+                self._fail(api_key, future, e)
+                raise
+            self._store(api_key, future, info)
+            return info
+        # Shielded: a cancelled follower must not cancel the shared lookup
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    def _start_load(self, api_key: str, background: bool) -> tuple[Future, bool]:
+        """
+        Join or start a load for ``api_key``. Caller holds the lock.
+
+        Returns the load's future and whether the caller must run it.
+        """
+        future = self._inflight.get(api_key)
+        if future is not None:
+            return future, False
+
+        future = Future()
+        # A running future cannot be cancelled by one of its waiters
+        future.set_running_or_notify_cancel()
+        self._inflight[api_key] = future
+        if background:
+            self._refresher.submit(self._load, api_key, future)
+            return future, False
+        return future, True
+
+    def _load(self, api_key: str, future: Future) -> None:
+        try:
+            info = self.loader(api_key)
+        except Exception as e:
+            self._fail(api_key, future, e)
+            return
+        self._store(api_key, future, info)
+
+    def _fail(self, api_key: str, future: Future, error: Exception) -> None:
+        logger.error(f"Failed to look up API key: {str(error)}")
+        with self._lock:
+            if self._inflight.get(api_key) is future:
+                del self._inflight[api_key]
+        self._settle(future, error=error)
+
+    def _store(self, api_key: str, future: Future, info: AuthInfo) -> None:
+        ttl = self.ttl if info.valid else self.negative_ttl
+        with self._lock:
+            self._stats["loads"] += 1
+            self._entries[api_key] = _Entry(info, self._clock() + ttl)
+            self._entries.move_to_end(api_key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            if self._inflight.get(api_key) is future:
+                del self._inflight[api_key]
+        self._settle(future, info)
+
+    @staticmethod
+    def _settle(
+        future: Future,
+        info: Optional[AuthInfo] = None,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        """Resolve a load unless it is already done."""
+        try:
+            if error is None:
+                future.set_result(info)
+            else:
+                future.set_exception(error)
+        except InvalidStateError:
+            logger.warning("API key lookup was already settled")
+
+    def invalidate(self, api_key: Optional[str] = None) -> None:
+        """Forget one key, or every key when called without arguments."""
+        with self._lock:
+            if api_key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(api_key, None)
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit, stale hit, miss and load counters."""
+        with self._lock:
+            return {**self._stats, "size": len(self._entries)}
+
+
+def is_admin_token(token: Optional[str]) -> bool:
+    """Return whether ``token`` is the configured admin token."""
+    if not ADMIN_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
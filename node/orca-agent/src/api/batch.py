@@ -0,0 +1,297 @@
+"""Fair, concurrency-limited execution of batch requests.
+
+A batch request runs many swarms. Running them all at once, or strictly in
+arrival order, lets one large batch starve every other client.
+:class:`FairBatchScheduler` runs the items of all batches on the shared
+``batch`` executor:
+
+- each batch has its own concurrency limit, chosen per request up to a server
+  maximum;
+- free workers go to API keys in round-robin order, and to the batches of one
+  key in turn, so a small batch is not stuck behind a large one;
+- every result is handed to a callback, tagged with its input index, as soon
+  as it is ready; :func:`iter_batch` turns that into an async iterator so
+  results can be streamed instead of collected.
+"""
+
+import asyncio
+import os
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from dotenv import load_dotenv
+from loguru import logger
+
+from src.api.executors import ExecutorSaturatedError, NamedExecutor
+
+load_dotenv()
+
+# Items of one batch that may run at once, unless the request asks otherwise
+BATCH_DEFAULT_CONCURRENCY = int(os.getenv("BATCH_DEFAULT_CONCURRENCY", "10"))
+# Upper bound on the concurrency a request may ask for
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "32"))
+# Seconds without a result before a streamed batch sends a heartbeat line
+BATCH_HEARTBEAT_INTERVAL = float(os.getenv("BATCH_HEARTBEAT_INTERVAL", "15"))
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# (index, result, error) callback; exactly one of result and error is set
+ResultCallback = Callable[[int, Any, Optional[BaseException]], None]
+
+
+def batch_concurrency(requested: Optional[int]) -> int:
+    """Return the concurrency for a batch, capped at the server maximum."""
+    if requested is None:
+        requested = BATCH_DEFAULT_CONCURRENCY
+    return max(1, min(requested, BATCH_MAX_CONCURRENCY))
+
+
+class BatchRun:
+    """
+    Progress of one batch inside a :class:`FairBatchScheduler`.
+
+    Args:
+        owner: API key the batch belongs to
+        fn: Function run for each item
+        items: Items of the batch, in input order
+        concurrency: Maximum number of items running at once
+        on_result: Called with each item's outcome as soon as it finishes
+    """
+
+    def __init__(
+        self,
+        owner: str,
+        fn: Callable[[Any], Any],
+        items: Sequence[Any],
+        concurrency: int,
+        on_result: ResultCallback,
+    ):
+        self.owner = owner
+        self.fn = fn
+        self.items = items
+        self.concurrency = concurrency
+        self.on_result = on_result
+        self.next_index = 0
+        self.inflight = 0
+        self.completed = 0
+        self.cancelled = False
+
+    @property
+    def dispatchable(self) -> bool:
+        """Whether an item can start now."""
+        return (
+            not self.cancelled
+            and self.next_index < len(self.items)
+            and self.inflight < self.concurrency
+        )
+
+    @property
+    def exhausted(self) -> bool:
+        """Whether no more items will be started."""
+        return self.cancelled or self.next_index >= len(self.items)
+
+    def cancel(self) -> None:
+        """Stop starting new items; items already running still finish."""
+        self.cancelled = True
+
+
+class FairBatchScheduler:
+    """
+    Runs batch items on an executor, interleaving fairly across API keys.
+
+    Args:
+        executor: Executor the items run on; an item whose future fails
+            without running (e.g. it was not admitted) completes with that
+            error
+        max_running: Maximum number of items running at once across all
+            batches; the executor's worker count by default
+    """
+
+    def __init__(self, executor: NamedExecutor, max_running: Optional[int] = None):
+        self.executor = executor
+        self.max_running = max_running or executor.max_workers
+        # owner -> batches with items left to start; owners in round-robin order
+        self._owners: "OrderedDict[str, Deque[BatchRun]]" = OrderedDict()
+        self._running = 0
+        self._lock = threading.Lock()
+        self._stats = {"batches": 0, "completed": 0}
+
+    def submit(
+        self,
+        owner: str,
+        fn: Callable[[Any], Any],
+        items: Sequence[Any],
+        concurrency: int,
+        on_result: ResultCallback,
+    ) -> BatchRun:
+        """
+        Queue a batch; ``fn(item)`` is run for every item.
+
+        Returns:
+            BatchRun: Handle that can cancel the remaining items
+        """
+        run = BatchRun(owner, fn, items, concurrency, on_result)
+        with self._lock:
+            self._stats["batches"] += 1
+            if items:
+                if owner not in self._owners:
+                    # Keys that have not been served go to the front of the line
+                    self._owners[owner] = deque()
+                    self._owners.move_to_end(owner, last=False)
+                self._owners[owner].append(run)
+            started = self._dispatch()
+        self._watch(started)
+        return run
+
+    def _next_run(self) -> Optional[BatchRun]:
+        """Pick the batch to start an item from. Caller holds the lock."""
+        for owner in list(self._owners):
+            runs = self._owners[owner]
+            for _ in range(len(runs)):
+                run = runs[0]
+                if run.exhausted:
+                    runs.popleft()
+                    continue
+                runs.rotate(-1)
+                if run.dispatchable:
+                    # This key goes to the back of the line
+                    self._owners.move_to_end(owner)
+                    return run
+            if not runs:
+                del self._owners[owner]
+        return None
+
+    def _dispatch(self) -> List[Tuple[Future, BatchRun, int]]:
+        """
+        Start items while workers are free. Caller holds the lock.
+
+        Returns:
+            The futures of the started items, for :meth:`_watch`
+        """
+        started: List[Tuple[Future, BatchRun, int]] = []
+        while self._running < self.max_running:
+            run = self._next_run()
+            if run is None:
+                break
+            index = run.next_index
+            try:
+                future = self.executor.submit(self._execute, run, index)
+            except ExecutorSaturatedError:
+                # Retried when one of our items finishes
+                break
+            except RuntimeError as e:
+                logger.error(f"Batch executor unavailable: {str(e)}")
+                break
+            run.next_index += 1
+            run.inflight += 1
+            self._running += 1
+            started.append((future, run, index))
+        return started
+
+    def _watch(self, started: List[Tuple[Future, BatchRun, int]]) -> None:
+        """Complete items whose future fails before they run.
+
+        Called without the lock, since callbacks of done futures run at once.
+        """
+        for future, run, index in started:
+            future.add_done_callback(
+                lambda future, run=run, index=index: self._not_run(future, run, index)
+            )
+
+    def _not_run(self, future: Future, run: BatchRun, index: int) -> None:
+        # _execute reports its own errors, so a failed future never ran it
+        if future.cancelled():
+            self._finish(run, index, None, RuntimeError("Batch item was cancelled"))
+        elif future.exception() is not None:
+            self._finish(run, index, None, future.exception())
+
+    def _execute(self, run: BatchRun, index: int) -> None:
+        result, error = None, None
+        try:
+            result = run.fn(run.items[index])
+        except Exception as e:
+            error = e
+        self._finish(run, index, result, error)
+
+    def _finish(
+        self,
+        run: BatchRun,
+        index: int,
+        result: Any,
+        error: Optional[BaseException],
+    ) -> None:
+        with self._lock:
+            self._running -= 1
+            run.inflight -= 1
+            run.completed += 1
+            self._stats["completed"] += 1
+            started = self._dispatch()
+        self._watch(started)
+
+        try:
+            run.on_result(index, result, error)
+        except Exception as e:
+            logger.error(f"Batch result callback failed: {str(e)}")
+
+    def stats(self) -> Dict[str, int]:
+        """Return running and queued item counts and batch counters."""
+        with self._lock:
+            queued = sum(
+                len(run.items) - run.next_index
+                for runs in self._owners.values()
+                for run in runs
+                if not run.cancelled
+            )
+            return {
+                **self._stats,
+                "running": self._running,
+                "queued": queued,
+                "owners": len(self._owners),
+            }
+
+
+async def iter_batch(
+    scheduler: FairBatchScheduler,
+    owner: str,
+    fn: Callable[[Any], Any],
+    items: Sequence[Any],
+    concurrency: int,
+    heartbeat: Optional[float] = None,
+) -> AsyncIterator[Optional[tuple]]:
+    """
+    Run a batch and yield ``(index, result, error)`` as each item finishes.
+
+    Yields None whenever ``heartbeat`` seconds pass without a result. If the
+    consumer stops early (e.g. the client disconnected), items that have not
+    started are cancelled.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    def on_result(index: int, result: Any, error: Optional[BaseException]) -> None:
+        loop.call_soon_threadsafe(queue.put_nowait, (index, result, error))
+
+    run = scheduler.submit(owner, fn, items, concurrency, on_result)
+    try:
+        for _ in range(len(items)):
+            while True:
+                try:
+                    outcome = await asyncio.wait_for(queue.get(), heartbeat)
+                    break
+                except asyncio.TimeoutError:
+                    yield None
+            yield outcome
+    finally:
+        run.cancel()
@@ -0,0 +1,565 @@
+"""Credit ledger with pre-authorization holds and batched settlement.
+
+Charging credits used to take four sequential database round trips after every
+swarm run, and concurrent runs raced on a read-modify-write of the balance.
+:class:`CreditLedger` keeps a cached balance per user and does all accounting
+in-process under a lock:
+
+1. :meth:`CreditLedger.hold` reserves the estimated cost before execution and
+   fails fast with :class:`InsufficientCreditsError` if it is not available.
+   Holds count against the balance, so concurrent runs cannot overspend.
+2. :meth:`CreditLedger.capture` converts the hold into a charge for the actual
+   cost (or :meth:`CreditLedger.release` drops it if the run failed). Work
+   that has run is always billed, even if it takes the balance below zero.
+3. A background thread periodically settles pending charges to the backing
+   :class:`CreditStore` in one batch per user. Charges being settled keep
+   counting against the balance until the new balance is known.
+
+Every API worker runs its own ledger, so settlement must be safe to run
+concurrently for the same user: each store records a batch and deducts it
+from the balance in one transaction. Charges carry an id and a charge
+already recorded is skipped, so a batch retried after a failure is never
+billed twice.
+
+Free credit is always spent before regular credit.
+"""
+
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import UTC, datetime
+from decimal import Decimal
+from itertools import count
+from time import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+from uuid import uuid4
+
+from dotenv import load_dotenv
+from loguru import logger
+
+load_dotenv()
+
+CREDIT_SETTLE_INTERVAL = float(os.getenv("CREDIT_SETTLE_INTERVAL", "5.0"))
+CREDIT_BALANCE_TTL = float(os.getenv("CREDIT_BALANCE_TTL", "60.0"))
+CREDIT_STORE = os.getenv("CREDIT_STORE", "supabase")
+CREDIT_DB_PATH = os.getenv("CREDIT_DB_PATH", "credits.db")
+
+# Postgres function SupabaseCreditStore.settle calls. It records a batch of
+# charges and deducts them in one transaction, skipping charge ids that are
+# already recorded. Apply it once, with the unique index, in the SQL editor.
+SETTLE_CREDIT_CHARGES_SQL = """
+alter table swarms_cloud_services add column if not exists charge_id text;
+create unique index if not exists swarms_cloud_services_charge_id_key
+    on swarms_cloud_services (charge_id);
+
+create or replace function settle_credit_charges(p_user_id uuid, p_charges jsonb)
+returns table (credit numeric, free_credit numeric)
+language plpgsql
+as $$
+declare
+    v_total numeric;
+begin
+    with inserted as (
+        insert into swarms_cloud_services
+            (charge_id, user_id, api_key, charge_credit, product_name)
+        select c->>'charge_id', p_user_id, c->>'api_key',
+               (c->>'charge_credit')::bigint, c->>'product_name'
+        from jsonb_array_elements(p_charges) as c
+        on conflict (charge_id) do nothing
+        returning charge_id
+    )
+    select coalesce(sum((c->>'amount')::numeric), 0) into v_total
+    from jsonb_array_elements(p_charges) as c
+    where c->>'charge_id' in (select charge_id from inserted);
+
+    -- Free credit first; the row lock serializes concurrent settlements
+    return query
+    update swarms_cloud_users_credits as u
+    set free_credit = greatest(u.free_credit - v_total, 0),
+        credit = u.credit - greatest(v_total - u.free_credit, 0)
+    where u.user_id = p_user_id
+    returning u.credit, u.free_credit;
+    if not found then
+        raise exception 'User credits record not found.';
+    end if;
+end;
+$$;
+"""
+
+
+class InsufficientCreditsError(Exception):
+    """Raised when a user cannot cover a hold or charge."""
+
+
+class CreditAccountNotFoundError(LookupError):
+    """Raised when a user has no credit record."""
+
+
+class Charge(NamedTuple):
+    """A captured charge waiting to be settled."""
+
+    user_id: str
+    api_key: str
+    amount: Decimal
+    product_name: str
+    # Settling a charge id twice records and deducts it once
+    charge_id: str
+
+
+class Balance(NamedTuple):
+    """A user's credit balance."""
+
+    credit: Decimal
+    free_credit: Decimal
+
+
+def apply_charge(balance: Balance, amount: Decimal) -> Balance:
+    """Deduct ``amount`` from a balance, using free credit first."""
+    if balance.free_credit >= amount:
+        return Balance(balance.credit, balance.free_credit - amount)
+    remainder = amount - balance.free_credit
+    return Balance(balance.credit - remainder, Decimal("0"))
+
+
+class CreditStore(ABC):
+    """Backing store interface for credit balances and transactions."""
+
+    @abstractmethod
+    def load_balance(self, user_id: str) -> Balance:
+        """
+        Return the stored balance for a user.
+
+        Raises:
+            CreditAccountNotFoundError: If the user has no credit record
+        """
+
+    @abstractmethod
+    def settle(self, user_id: str, charges: List[Charge]) -> Balance:
+        """
+        Record ``charges``, deduct their total and return the new balance.
+
+        Both happen in one transaction, and charges whose id is already
+        recorded are neither recorded nor deducted again.
+        """
+
+
+class SupabaseCreditStore(CreditStore):
+    """
+    Credit store backed by the Supabase credit and service tables.
+
+    Args:
+        client_factory: Returns a Supabase client
+    """
+
+    def __init__(self, client_factory: Callable):
+        self.client_factory = client_factory
+
+    def load_balance(self, user_id: str) -> Balance:
+        response = (
+            self.client_factory()
+            .table("swarms_cloud_users_credits")
+            .select("credit, free_credit")
+            .eq("user_id", user_id)
+            .execute()
+        )
+        if not response.data:
+            raise CreditAccountNotFoundError("User credits record not found.")
+        record = response.data[0]
+        return Balance(
+            Decimal(str(record["credit"])),
+            Decimal(str(record.get("free_credit") or "0")),
+        )
+
+    def settle(self, user_id: str, charges: List[Charge]) -> Balance:
+        # One call to settle_credit_charges (SETTLE_CREDIT_CHARGES_SQL)
+        response = (
+            self.client_factory()
+            .rpc(
+                "settle_credit_charges",
+                {
+                    "p_user_id": user_id,
+                    "p_charges": [
+                        {
+                            "charge_id": charge.charge_id,
+                            "api_key": charge.api_key,
+                            # Assuming credits are stored as integers
+                            "charge_credit": int(charge.amount),
+                            "amount": str(charge.amount),
+                            "product_name": charge.product_name,
+                        }
+                        for charge in charges
+                    ],
+                },
+            )
+            .execute()
+        )
+        if not response.data:
+            raise RuntimeError("Failed to update credits.")
+        record = response.data[0]
+        return Balance(
+            Decimal(str(record["credit"])),
+            Decimal(str(record.get("free_credit") or "0")),
+        )
+
+
+class SQLiteCreditStore(CreditStore):
+    """
+    Local SQLite stand-in for the Supabase credit tables.
+
+    Settlement of a batch runs in a single transaction.
+
+    Args:
+        db_path: Path of the SQLite database file (``:memory:`` for tests)
+    """
+
+    def __init__(self, db_path: str = ":memory:"):
+        self._conn = sqlite3.connect(
+            db_path, check_same_thread=False, isolation_level=None
+        )
+        self._lock = threading.Lock()
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS swarms_cloud_users_credits (
+                user_id TEXT PRIMARY KEY,
+                credit TEXT NOT NULL,
+                free_credit TEXT NOT NULL DEFAULT '0'
+            );
+            CREATE TABLE IF NOT EXISTS swarms_cloud_services (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                api_key TEXT NOT NULL,
+                charge_credit TEXT NOT NULL,
+                product_name TEXT,
+                created_at TEXT NOT NULL
+            );
+            """
+        )
+        columns = {
+            row[1]
+            for row in self._conn.execute("PRAGMA table_info(swarms_cloud_services)")
+        }
+        if "charge_id" not in columns:
+            self._conn.execute(
+                "ALTER TABLE swarms_cloud_services ADD COLUMN charge_id TEXT"
+            )
+        self._conn.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS swarms_cloud_services_charge_id_key "
+            "ON swarms_cloud_services (charge_id)"
+        )
+
+    def set_balance(self, user_id: str, balance: Balance) -> None:
+        """Create or overwrite a user's balance."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO swarms_cloud_users_credits "
+                "(user_id, credit, free_credit) VALUES (?, ?, ?)",
+                (user_id, str(balance.credit), str(balance.free_credit)),
+            )
+
+    def load_balance(self, user_id: str) -> Balance:
+        with self._lock:
+            return self._load_balance(user_id)
+
+    def _load_balance(self, user_id: str) -> Balance:
+        row = self._conn.execute(
+            "SELECT credit, free_credit FROM swarms_cloud_users_credits "
+            "WHERE user_id = ?",
+            (user_id,),
+        ).fetchone()
+        if row is None:
+            raise CreditAccountNotFoundError("User credits record not found.")
+        return Balance(Decimal(row[0]), Decimal(row[1]))
+
+    def transactions(self, user_id: str) -> List[Tuple[str, Decimal, str]]:
+        """Return (api_key, amount, product_name) for a user's settled charges."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT api_key, charge_credit, product_name "
+                "FROM swarms_cloud_services WHERE user_id = ? ORDER BY id",
+                (user_id,),
+            ).fetchall()
+        return [(api_key, Decimal(amount), name) for api_key, amount, name in rows]
+
+    def settle(self, user_id: str, charges: List[Charge]) -> Balance:
+        now = datetime.now(UTC).isoformat()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                total = Decimal("0")
+                for c in charges:
+                    cursor = self._conn.execute(
+                        "INSERT OR IGNORE INTO swarms_cloud_services "
+                        "(charge_id, user_id, api_key, charge_credit, product_name, "
+                        "created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                        (
+                            c.charge_id,
+                            c.user_id,
+                            c.api_key,
+                            str(c.amount),
+                            c.product_name,
+                            now,
+                        ),
+                    )
+                    if cursor.rowcount:
+                        total += c.amount
+                balance = apply_charge(self._load_balance(user_id), total)
+                self._conn.execute(
+                    "UPDATE swarms_cloud_users_credits "
+                    "SET credit = ?, free_credit = ? WHERE user_id = ?",
+                    (str(balance.credit), str(balance.free_credit), user_id),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return balance
+
+
+def create_credit_store(
+    client_factory: Callable, backend: str = CREDIT_STORE
+) -> CreditStore:
+    """
+    Build the configured credit store.
+
+    Args:
+        client_factory: Returns a Supabase client (used by the default backend)
+        backend: "supabase" or "sqlite"
+
+    Returns:
+        CreditStore: The credit store
+    """
+    if backend == "sqlite":
+        return SQLiteCreditStore(CREDIT_DB_PATH)
+    if backend != "supabase":
+        logger.warning(f"Unknown credit store {backend!r}, using supabase")
+    return SupabaseCreditStore(client_factory)
+
+
+class _Account:
+    """In-process view of a user's credits."""
+
+    __slots__ = ("balance", "loaded_at", "held", "pending", "lock")
+
+    def __init__(self):
+        self.balance: Optional[Balance] = None
+        self.loaded_at = 0.0
+        self.held = Decimal("0")
+        self.pending: List[Charge] = []
+        self.lock = threading.Lock()
+
+    @property
+    def pending_total(self) -> Decimal:
+        return sum((c.amount for c in self.pending), Decimal("0"))
+
+    @property
+    def available(self) -> Decimal:
+        return (
+            self.balance.credit
+            + self.balance.free_credit
+            - self.pending_total
+            - self.held
+        )
+
+
+class Hold(NamedTuple):
+    """A reservation of credits for a run in progress."""
+
+    hold_id: int
+    user_id: str
+    amount: Decimal
+
+
+class CreditLedger:
+    """
+    In-process credit accounting with holds and periodic batched settlement.
+
+    Args:
+        store: Backing store for balances and transactions
+        settle_interval: Seconds between settlement passes
+        balance_ttl: Seconds a cached balance is trusted before reloading
+    """
+
+    def __init__(
+        self,
+        store: CreditStore,
+        settle_interval: float = CREDIT_SETTLE_INTERVAL,
+        balance_ttl: float = CREDIT_BALANCE_TTL,
+        clock: Callable[[], float] = time,
+    ):
+        self.store = store
+        self.settle_interval = settle_interval
+        self.balance_ttl = balance_ttl
+        self._clock = clock
+        self._accounts: Dict[str, _Account] = {}
+        self._holds: Dict[int, Hold] = {}
+        self._hold_ids = count(1)
+        self._lock = threading.Lock()
+        self._settle_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _account(self, user_id: str) -> _Account:
+        with self._lock:
+            account = self._accounts.get(user_id)
+            if account is None:
+                account = self._accounts[user_id] = _Account()
+            return account
+
+    def _ensure_balance(self, user_id: str, account: _Account) -> None:
+        """Load the balance if missing or stale. Caller holds account.lock."""
+        now = self._clock()
+        if account.balance is None or now - account.loaded_at > self.balance_ttl:
+            account.balance = self.store.load_balance(user_id)
+            account.loaded_at = now
+
+    def available(self, user_id: str) -> Decimal:
+        """Return the credits a user can still spend."""
+        account = self._account(user_id)
+        with account.lock:
+            self._ensure_balance(user_id, account)
+            return account.available
+
+    def hold(self, user_id: str, amount: float) -> Hold:
+        """
+        Reserve credits before running a billable operation.
+
+        Raises:
+            InsufficientCreditsError: If the user cannot cover ``amount``
+            CreditAccountNotFoundError: If the user has no credit record
+        """
+        amount = Decimal(str(amount))
+        account = self._account(user_id)
+        with account.lock:
+            self._ensure_balance(user_id, account)
+            if account.available < amount:
+                raise InsufficientCreditsError("Insufficient credits.")
+            account.held += amount
+            hold = Hold(next(self._hold_ids), user_id, amount)
+        with self._lock:
+            self._holds[hold.hold_id] = hold
+        return hold
+
+    def release(self, hold: Hold) -> None:
+        """Drop a hold without charging, e.g. when the run failed."""
+        with self._lock:
+            if self._holds.pop(hold.hold_id, None) is None:
+                return
+        account = self._account(hold.user_id)
+        with account.lock:
+            account.held -= hold.amount
+
+    def capture(
+        self, hold: Hold, amount: float, api_key: str, product_name: str
+    ) -> None:
+        """
+        Replace a hold with a charge for the actual cost.
+
+        The work has already been done, so the charge is always recorded:
+        when the actual cost exceeds what is left, the balance goes negative
+        and later holds are refused until the user tops up.
+        """
+        self.release(hold)
+        amount = Decimal(str(amount))
+        account = self._account(hold.user_id)
+        with account.lock:
+            if account.balance is not None and account.available < amount:
+                logger.warning(
+                    f"Charge of {amount} overdraws the credits of {hold.user_id}"
+                )
+            account.pending.append(
+                Charge(hold.user_id, api_key, amount, product_name, uuid4().hex)
+            )
+
+        if self._thread is None:
+            self.start()
+
+    def charge(
+        self, user_id: str, api_key: str, amount: float, product_name: str
+    ) -> None:
+        """
+        Charge credits immediately, without a prior hold.
+
+        Raises:
+            InsufficientCreditsError: If the user cannot cover ``amount``
+            CreditAccountNotFoundError: If the user has no credit record
+        """
+        amount = Decimal(str(amount))
+        account = self._account(user_id)
+        with account.lock:
+            self._ensure_balance(user_id, account)
+            if account.available < amount:
+                raise InsufficientCreditsError("Insufficient credits.")
+            account.pending.append(
+                Charge(user_id, api_key, amount, product_name, uuid4().hex)
+            )
+
+        if self._thread is None:
+            self.start()
+
+    def settle(self) -> None:
+        """Write all pending charges to the store, one batch per user."""
+        with self._settle_lock:
+            with self._lock:
+                accounts = list(self._accounts.items())
+
+            for user_id, account in accounts:
+                # Charges stay pending, and counted, until the balance that
+                # includes them replaces the cached one. Only settle removes
+                # pending charges, so the first len(charges) are these.
+                with account.lock:
+                    charges = list(account.pending)
+                if not charges:
+                    continue
+
+                try:
+                    balance = self.store.settle(user_id, charges)
+                except Exception as e:
+                    logger.error(
+                        f"Failed to settle {len(charges)} charges for {user_id}: {str(e)}"
+                    )
+                    continue
+
+                with account.lock:
+                    account.pending = account.pending[len(charges) :]
+                    account.balance = balance
+                    account.loaded_at = self._clock()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return account, hold and pending charge counts."""
+        with self._lock:
+            accounts = list(self._accounts.values())
+            holds = len(self._holds)
+        return {
+            "accounts": len(accounts),
+            "holds": holds,
+            "pending_charges": sum(len(a.pending) for a in accounts),
+        }
+
+    def start(self) -> None:
+        """Start the settlement thread if it is not already running."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(
+                target=self._settle_loop, name="credit-settlement", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Settle everything pending and stop the settlement thread."""
+        thread = self._thread
+        if thread is not None:
+            self._stopping.set()
+            self._wakeup.set()
+            thread.join(timeout)
+            self._thread = None
+        self.settle()
+
+    def _settle_loop(self) -> None:
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.settle_interval)
+            self._wakeup.clear()
+            self.settle()
@@ -0,0 +1,673 @@
+"""Memory-bounded response cache for swarm and agent completions.
+
+Responses are stored as JSON bytes under a SHA-256 hash of the canonical JSON of
+everything that affects the output, so keys stay small no matter how long the
+prompts are. :class:`ResponseCache` is shared by the event loop and worker
+threads:
+
+- The total size of stored responses is capped at ``max_bytes``; the least
+  recently used entries are evicted first.
+- Each namespace ("swarm", "agent", ...) has its own TTL. Expired entries are
+  dropped when they are read, and a full sweep runs at most once per
+  ``purge_interval`` seconds on writes.
+- Large responses are compressed with zstd when the optional ``zstandard``
+  package is installed.
+- Hit, miss, expiration and eviction counters are kept per namespace.
+
+Every :meth:`ResponseCache.get` returns a fresh copy, so callers may mutate it.
+Code on the event loop uses :meth:`ResponseCache.aget`, which reads the disk
+tier on a worker thread.
+
+An optional :class:`DiskCache` tier (SQLite in WAL mode) sits behind the
+memory tier. Writes go through to it, so every API worker on the host can reuse
+a response; memory misses are promoted from disk. The disk tier has its own TTL
+expiry and size budget, receives a snapshot of the memory tier on shutdown and
+warms it on startup.
+
+Because the cache is only filled once a run completes, :class:`SingleFlight`
+makes identical requests that arrive during a run wait for it instead of
+starting their own.
+"""
+
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, InvalidStateError
+from time import time
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional
+
+from dotenv import load_dotenv
+from loguru import logger
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+load_dotenv()
+
+RESPONSE_CACHE_MAX_BYTES = int(
+    os.getenv("RESPONSE_CACHE_MAX_BYTES", str(256 * 1024 * 1024))
+)
+RESPONSE_CACHE_COMPRESSION = os.getenv("RESPONSE_CACHE_COMPRESSION", "zstd")
+RESPONSE_CACHE_COMPRESS_MIN_BYTES = int(
+    os.getenv("RESPONSE_CACHE_COMPRESS_MIN_BYTES", "1024")
+)
+RESPONSE_CACHE_DISK_PATH = os.getenv(
+    "RESPONSE_CACHE_DISK_PATH",
+    os.path.join(tempfile.gettempdir(), "orca_response_cache.db"),
+)
+RESPONSE_CACHE_DISK_MAX_BYTES = int(
+    os.getenv("RESPONSE_CACHE_DISK_MAX_BYTES", str(1024 * 1024 * 1024))
+)
+SWARM_CACHE_TTL = float(os.getenv("SWARM_CACHE_TTL", "3600"))
+AGENT_CACHE_TTL = float(os.getenv("AGENT_CACHE_TTL", "300"))
+
+
+def canonical_json(payload: Any) -> bytes:
+    """Serialize ``payload`` deterministically (sorted keys, no whitespace)."""
+    return json.dumps(
+        payload, sort_keys=True, separators=(",", ":"), default=str
+    ).encode("utf-8")
+
+
+def make_cache_key(namespace: str, payload: Any) -> str:
+    """
+    Build a fixed-size cache key for a request payload.
+
+    Args:
+        namespace: Cache namespace, e.g. "swarm" or "agent"
+        payload: JSON-serializable description of the request
+
+    Returns:
+        str: ``"<namespace>:<sha256 hex digest>"``
+    """
+    return f"{namespace}:{hashlib.sha256(canonical_json(payload)).hexdigest()}"
+
+
+class _Entry(NamedTuple):
+    namespace: str
+    blob: bytes
+    compressed: bool
+    expires_at: float
+
+
+class DiskCache:
+    """
+    SQLite-backed cache tier shared by all processes on a host.
+
+    Stores the already-encoded blobs of :class:`ResponseCache`. Reads skip
+    expired rows; every ``compact_every`` writes, expired rows are deleted and
+    the least recently used rows are dropped until the total size fits
+    ``max_bytes``.
+
+    Args:
+        db_path: Path of the SQLite database file
+        max_bytes: Maximum total size of stored blobs
+        compact_every: Number of writes between compactions
+    """
+
+    def __init__(
+        self,
+        db_path: str = RESPONSE_CACHE_DISK_PATH,
+        max_bytes: int = RESPONSE_CACHE_DISK_MAX_BYTES,
+        compact_every: int = 100,
+        clock: Callable[[], float] = time,
+    ):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.compact_every = compact_every
+        self._clock = clock
+        self._local = threading.local()
+        self._writes = 0
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache ("
+            "key TEXT PRIMARY KEY, namespace TEXT NOT NULL, blob BLOB NOT NULL, "
+            "compressed INTEGER NOT NULL, size INTEGER NOT NULL, "
+            "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS response_cache_accessed_at "
+            "ON response_cache (accessed_at)"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[_Entry]:
+        """Return the live entry for ``key``, or None."""
+        now = self._clock()
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT namespace, blob, compressed, expires_at FROM response_cache "
+            "WHERE key = ? AND expires_at > ?",
+            (key, now),
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            "UPDATE response_cache SET accessed_at = ? WHERE key = ?", (now, key)
+        )
+        namespace, blob, compressed, expires_at = row
+        return _Entry(namespace, bytes(blob), bool(compressed), expires_at)
+
+    def set_many(self, entries: Iterable[tuple[str, _Entry]]) -> None:
+        """Insert or replace entries in one transaction."""
+        now = self._clock()
+        rows = [
+            (
+                key,
+                entry.namespace,
+                entry.blob,
+                int(entry.compressed),
+                len(entry.blob),
+                entry.expires_at,
+                now,
+            )
+            for key, entry in entries
+        ]
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO response_cache (key, namespace, blob, "
+                "compressed, size, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        self._writes += len(rows)
+        if self._writes >= self.compact_every:
+            self._writes = 0
+            self.compact()
+
+    def set(self, key: str, entry: _Entry) -> None:
+        """Insert or replace one entry."""
+        self.set_many([(key, entry)])
+
+    def delete(self, key: str) -> None:
+        """Delete one entry."""
+        self._connection().execute("DELETE FROM response_cache WHERE key = ?", (key,))
+
+    def load(self, max_bytes: int) -> List[tuple[str, _Entry]]:
+        """Return live entries, most recently used first, up to ``max_bytes``."""
+        entries, total = [], 0
+        cursor = self._connection().execute(
+            "SELECT key, namespace, blob, compressed, expires_at "
+            "FROM response_cache WHERE expires_at > ? ORDER BY accessed_at DESC",
+            (self._clock(),),
+        )
+        for key, namespace, blob, compressed, expires_at in cursor:
+            if total + len(blob) > max_bytes:
+                break
+            total += len(blob)
+            entries.append(
+                (key, _Entry(namespace, bytes(blob), bool(compressed), expires_at))
+            )
+        return entries
+
+    def compact(self) -> int:
+        """Delete expired rows, then LRU rows over budget; return the count."""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            removed = conn.execute(
+                "DELETE FROM response_cache WHERE expires_at <= ?", (self._clock(),)
+            ).rowcount
+            total = conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM response_cache"
+            ).fetchone()[0]
+            if total > self.max_bytes:
+                victims = []
+                for key, size in conn.execute(
+                    "SELECT key, size FROM response_cache ORDER BY accessed_at"
+                ):
+                    if total <= self.max_bytes:
+                        break
+                    victims.append((key,))
+                    total -= size
+                conn.executemany("DELETE FROM response_cache WHERE key = ?", victims)
+                removed += len(victims)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+        """Return the number of rows and their total size."""
+        entries, size = (
+            self._connection()
+            .execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM response_cache")
+            .fetchone()
+        )
+        return {"entries": entries, "bytes": size, "max_bytes": self.max_bytes}
+
+
+def create_disk_cache(db_path: str = RESPONSE_CACHE_DISK_PATH) -> Optional[DiskCache]:
+    """
+    Open the disk tier, or return None if it is disabled or unavailable.
+
+    Setting RESPONSE_CACHE_DISK_PATH to an empty string disables it.
+    """
+    if not db_path:
+        return None
+    try:
+        return DiskCache(db_path)
+    except sqlite3.Error as e:
+        logger.warning(f"Disk cache unavailable at {db_path}: {str(e)}")
+        return None
+
+
+class ResponseCache:
+    """
+    Thread-safe LRU cache of JSON responses with a byte budget.
+
+    Args:
+        ttls: Seconds entries live, per namespace
+        max_bytes: Maximum total size of stored (possibly compressed) responses
+        compression: "zstd" to compress large responses, anything else to
+            store them as is
+        compress_min_bytes: Responses smaller than this are never compressed
+        default_ttl: TTL for namespaces missing from ``ttls``
+        purge_interval: Minimum seconds between sweeps for expired entries
+        disk: Optional shared disk tier behind the memory tier
+    """
+
+    def __init__(
+        self,
+        ttls: Optional[Dict[str, float]] = None,
+        max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+        compression: str = RESPONSE_CACHE_COMPRESSION,
+        compress_min_bytes: int = RESPONSE_CACHE_COMPRESS_MIN_BYTES,
+        default_ttl: float = 300.0,
+        purge_interval: float = 60.0,
+        disk: Optional[DiskCache] = None,
+        clock: Callable[[], float] = time,
+    ):
+        self.ttls = dict(ttls or {})
+        self.max_bytes = max_bytes
+        self.compress_min_bytes = compress_min_bytes
+        self.default_ttl = default_ttl
+        self.purge_interval = purge_interval
+        self.disk = disk
+        self._clock = clock
+        self._last_purge = clock()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+        self.compression = None
+        if compression == "zstd":
+            if zstandard is None:
+                logger.info("zstandard is not installed, caching uncompressed")
+            else:
+                self.compression = "zstd"
+        # zstd contexts are not thread-safe, so keep one per thread
+        self._local = threading.local()
+
+    def _counters(self, namespace: str) -> Dict[str, int]:
+        """Return the counters for a namespace. Caller holds the lock."""
+        counters = self._stats.get(namespace)
+        if counters is None:
+            counters = self._stats[namespace] = {
+                "hits": 0,
+                "disk_hits": 0,
+                "misses": 0,
+                "sets": 0,
+                "expirations": 0,
+                "evictions": 0,
+            }
+        return counters
+
+    def _encode(self, value: Any) -> tuple[bytes, bool]:
+        blob = json.dumps(value, default=str).encode("utf-8")
+        if self.compression is None or len(blob) < self.compress_min_bytes:
+            return blob, False
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            compressor = self._local.compressor = zstandard.ZstdCompressor()
+        return compressor.compress(blob), True
+
+    def _decode(self, entry: _Entry) -> Any:
+        blob = entry.blob
+        if entry.compressed:
+            if zstandard is None:
+                raise ValueError("Cached response is zstd-compressed")
+            decompressor = getattr(self._local, "decompressor", None)
+            if decompressor is None:
+                decompressor = self._local.decompressor = (
+                    zstandard.ZstdDecompressor()
+                )
+            blob = decompressor.decompress(blob)
+        return json.loads(blob)
+
+    def _remove(self, key: str) -> None:
+        """Drop an entry and its bytes. Caller holds the lock."""
+        entry = self._entries.pop(key)
+        self._bytes -= len(entry.blob)
+
+    def _store(self, key: str, entry: _Entry) -> None:
+        """Insert an entry and evict LRU entries over budget. Caller holds the lock."""
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = entry
+        self._bytes += len(entry.blob)
+
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted.blob)
+            self._counters(evicted.namespace)["evictions"] += 1
+
+    def _disk_call(self, method: Callable, *args) -> Any:
+        """Call a disk tier method; disk errors are logged, never raised."""
+        try:
+            return method(*args)
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"Disk cache {method.__name__} failed: {str(e)}")
+            return None
+
+    def _lookup(self, namespace: str, key: str) -> Optional[_Entry]:
+        """Return the live memory entry for ``key``, counting a hit."""
+        with self._lock:
+            counters = self._counters(namespace)
+            entry = self._entries.get(key)
+            if entry is not None and self._clock() >= entry.expires_at:
+                self._remove(key)
+                counters["expirations"] += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                counters["hits"] += 1
+            return entry
+
+    def _promote(self, namespace: str, key: str) -> Optional[_Entry]:
+        """Read ``key`` from the disk tier into memory. Blocks on SQLite."""
+        # Another worker may have cached it
+        entry = self._disk_call(self.disk.get, key)
+        if entry is not None:
+            with self._lock:
+                self._store(key, entry)
+                self._counters(namespace)["disk_hits"] += 1
+        return entry
+
+    def _response(
+        self, namespace: str, key: str, entry: Optional[_Entry]
+    ) -> Optional[Any]:
+        """Decode a looked-up entry, counting a miss if there is none."""
+        if entry is None:
+            with self._lock:
+                self._counters(namespace)["misses"] += 1
+            return None
+
+        # Decompress and parse outside the lock
+        try:
+            return self._decode(entry)
+        except ValueError as e:
+            logger.warning(f"Dropping undecodable cache entry: {str(e)}")
+            self.delete(key)
+            return None
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        """Return a copy of the cached response, or None on a miss."""
+        entry = self._lookup(namespace, key)
+        if entry is None and self.disk is not None:
+            entry = self._promote(namespace, key)
+        return self._response(namespace, key, entry)
+
+    async def aget(self, namespace: str, key: str) -> Optional[Any]:
+        """
+        Like :meth:`get`, for the event loop.
+
+        Memory hits are served inline; a memory miss reads the disk tier on a
+        worker thread so the SQLite query never blocks the loop.
+        """
+        entry = self._lookup(namespace, key)
+        if entry is None and self.disk is not None:
+            entry = await asyncio.to_thread(self._promote, namespace, key)
+        return self._response(namespace, key, entry)
+
+    def set(self, namespace: str, key: str, value: Any) -> None:
+        """Store a JSON-serializable response, evicting LRU entries if needed."""
+        blob, compressed = self._encode(value)
+        if len(blob) > self.max_bytes:
+            logger.debug(f"Response of {len(blob)} bytes is too large to cache")
+            return
+
+        now = self._clock()
+        if now - self._last_purge >= self.purge_interval:
+            self._last_purge = now
+            self.purge_expired()
+
+        ttl = self.ttls.get(namespace, self.default_ttl)
+        entry = _Entry(namespace, blob, compressed, now + ttl)
+        with self._lock:
+            self._store(key, entry)
+            self._counters(namespace)["sets"] += 1
+
+        if self.disk is not None:
+            self._disk_call(self.disk.set, key, entry)
+
+    def delete(self, key: str) -> None:
+        """Forget one entry in both tiers."""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+        if self.disk is not None:
+            self._disk_call(self.disk.delete, key)
+
+    def clear(self) -> None:
+        """Forget every entry in the memory tier."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def purge_expired(self) -> int:
+        """Drop all expired entries and return how many were removed."""
+        now = self._clock()
+        with self._lock:
+            expired = [
+                key for key, entry in self._entries.items() if now >= entry.expires_at
+            ]
+            for key in expired:
+                namespace = self._entries[key].namespace
+                self._remove(key)
+                self._counters(namespace)["expirations"] += 1
+        return len(expired)
+
+    def snapshot(self) -> None:
+        """Write all live memory entries to the disk tier and compact it."""
+        if self.disk is None:
+            return
+        now = self._clock()
+        with self._lock:
+            entries = [
+                (key, entry)
+                for key, entry in self._entries.items()
+                if entry.expires_at > now
+            ]
+        self._disk_call(self.disk.set_many, entries)
+        self._disk_call(self.disk.compact)
+        logger.info(f"Snapshotted {len(entries)} cached responses to disk")
+
+    def warm_load(self) -> int:
+        """Fill the memory tier from the disk tier; return the entries loaded."""
+        if self.disk is None:
+            return 0
+        entries = self._disk_call(self.disk.load, self.max_bytes) or []
+        with self._lock:
+            # Least recently used first, so the hottest entries end up newest
+            for key, entry in reversed(entries):
+                if key not in self._entries:
+                    self._store(key, entry)
+        logger.info(f"Warmed response cache with {len(entries)} entries from disk")
+        return len(entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return size totals and per-namespace counters."""
+        with self._lock:
+            stats = {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "compression": self.compression,
+                "namespaces": {
+                    namespace: dict(counters)
+                    for namespace, counters in self._stats.items()
+                },
+            }
+        if self.disk is not None:
+            stats["disk"] = self._disk_call(self.disk.stats)
+        return stats
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into one execution.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is still running wait for the leader's result instead of
+    running it again. Followers receive a deep copy. Since an error may be
+    specific to the leader (e.g. its credits), followers of a failed leader
+    retry once as a new coalesced run; only a second failure is shared.
+    Works from worker threads (:meth:`do`) and from the event loop
+    (:meth:`do_async`), which waits without tying up a thread.
+
+    Args:
+        executor: Executor with a ``submit`` method that runs :meth:`do_async`
+            leaders; the default executor of the running loop if None
+    """
+
+    def __init__(self, executor: Optional[Any] = None):
+        self.executor = executor
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._stats = {"leaders": 0, "followers": 0}
+
+    def _join(self, key: str) -> tuple[Future, bool]:
+        """Return the in-flight future for ``key`` and whether we lead it."""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self._stats["followers"] += 1
+                return future, False
+            future = self._inflight[key] = Future()
+            # A running future cannot be cancelled by one of its waiters
+            future.set_running_or_notify_cancel()
+            self._stats["leaders"] += 1
+            return future, True
+
+    @staticmethod
+    def _settle(
+        future: Future, result: Any = None, error: Optional[BaseException] = None
+    ) -> None:
+        """Resolve the flight unless it is already done."""
+        try:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+        except InvalidStateError:
+            logger.warning("Flight was already settled, dropping its outcome")
+
+    def _lead(self, key: str, future: Future, fn: Callable, args, kwargs) -> Any:
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            self._settle(future, error=e)
+            raise
+        with self._lock:
+            self._inflight.pop(key, None)
+        self._settle(future, result)
+        return result
+
+    def do(self, key: str, fn: Callable, *args, **kwargs) -> Any:
+        """Run ``fn`` once for all concurrent callers of ``key`` (blocking)."""
+        for attempt in range(2):
+            future, leader = self._join(key)
+            if leader:
+                return self._lead(key, future, fn, args, kwargs)
+            if future.exception() is None or attempt:
+                return copy.deepcopy(future.result())
+
+    async def do_async(self, key: str, fn: Callable, *args, **kwargs) -> Any:
+        """Like :meth:`do`, running the leader's ``fn`` on a worker thread."""
+        return await self.do_async_on(self.executor, key, fn, *args, **kwargs)
+
+    async def do_async_on(
+        self, executor: Optional[Any], key: str, fn: Callable, *args, **kwargs
+    ) -> Any:
+        """
+        Like :meth:`do_async`, running the leader's ``fn`` on ``executor``.
+
+        If ``executor`` fails or cancels the run before ``fn`` starts (e.g.
+        it was not admitted), the leader gets that error and followers retry.
+        """
+        for attempt in range(2):
+            future, leader = self._join(key)
+            if leader:
+                if executor is None:
+                    return await asyncio.to_thread(
+                        self._lead, key, future, fn, args, kwargs
+                    )
+                try:
+                    run = executor.submit(self._lead, key, future, fn, args, kwargs)
+                except BaseException as e:
+                    # Never started: fail the flight so followers do not hang
+                    self._abandon(key, future, e)
+                    raise
+                run.add_done_callback(
+                    lambda run, future=future, key=key: self._unstarted(
+                        key, future, run
+                    )
+                )
+                return await asyncio.wrap_future(run)
+            try:
+                # Shielded: a follower that is cancelled (e.g. its client
+                # disconnected) must not cancel the run everyone shares
+                result = await asyncio.shield(asyncio.wrap_future(future))
+                return copy.deepcopy(result)
+            except Exception:
+                if attempt:
+                    raise
+
+    def _abandon(self, key: str, future: Future, error: BaseException) -> None:
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+        self._settle(future, error=error)
+
+    def _unstarted(self, key: str, future: Future, run: Future) -> None:
+        # _lead always settles the flight, so an open one never started
+        if future.done():
+            return
+        error = None if run.cancelled() else run.exception()
+        self._abandon(
+            key, future, error or RuntimeError("Leader was cancelled before it ran")
+        )
+
+    def stats(self) -> Dict[str, int]:
+        """Return leader and follower counts and the number of in-flight keys."""
+        with self._lock:
+            return {**self._stats, "inflight": len(self._inflight)}
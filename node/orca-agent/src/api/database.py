@@ -0,0 +1,243 @@
+"""Async, pooled access to the Supabase REST API.
+
+The supabase client returned by ``get_supabase_client`` is synchronous, so a
+query made from an ``async def`` handler blocks the event loop until the
+database answers. :class:`AsyncDatabase` runs the same PostgREST queries on an
+async HTTP client instead:
+
+- one pooled ``httpx.AsyncClient`` is shared by every call (HTTP/2 when the
+  optional ``h2`` package is installed), so calls reuse connections;
+- each call has a timeout covering the wait for a slot and every attempt;
+- at most ``max_concurrency`` calls are in flight at once, so a slow database
+  cannot exhaust the connection pool;
+- transient failures are retried with exponential backoff and full jitter.
+  Writes are retried only when the request never reached the server.
+"""
+
+import asyncio
+import os
+import random
+from itertools import count
+from typing import Any, Dict, Optional
+
+import httpx
+from dotenv import load_dotenv
+from loguru import logger
+from postgrest import AsyncPostgrestClient
+from postgrest.exceptions import APIError
+
+try:
+    import h2
+except ImportError:
+    h2 = None
+
+load_dotenv()
+
+# Seconds a call may take, waiting for a slot and retries included
+DB_TIMEOUT = float(os.getenv("DB_TIMEOUT", "10"))
+# Calls in flight at once
+DB_MAX_CONCURRENCY = int(os.getenv("DB_MAX_CONCURRENCY", "32"))
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "64"))
+DB_MAX_RETRIES = int(os.getenv("DB_MAX_RETRIES", "3"))
+DB_RETRY_BASE_DELAY = float(os.getenv("DB_RETRY_BASE_DELAY", "0.1"))
+DB_RETRY_MAX_DELAY = float(os.getenv("DB_RETRY_MAX_DELAY", "2"))
+
+# APIError codes worth retrying: HTTP statuses of errors without a JSON body
+# and the PostgREST codes for a database it could not reach
+RETRYABLE_CODES = frozenset(
+    {"408", "429", "500", "502", "503", "504", "520"}
+    | {"PGRST000", "PGRST001", "PGRST002", "PGRST003"}
+)
+# Transport errors raised before the request was sent
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class DatabaseUnavailableError(RuntimeError):
+    """Raised when a call times out or keeps failing transiently."""
+
+
+def is_transient(error: Exception) -> bool:
+    """Whether retrying the call that raised ``error`` may succeed."""
+    if isinstance(error, httpx.TransportError):
+        return True
+    return isinstance(error, APIError) and str(error.code) in RETRYABLE_CODES
+
+
+class AsyncDatabase:
+    """
+    Async PostgREST client with pooling, timeouts, a concurrency limit and
+    retries.
+
+    Queries are built with :meth:`table` exactly as with the sync client and
+    run with :meth:`execute`. The HTTP client is created on first use and
+    belongs to the event loop that created it.
+
+    Args:
+        url: Supabase project URL; ``SUPABASE_URL`` if None
+        key: Supabase API key; ``SUPABASE_KEY`` if None
+        timeout: Default seconds per call
+        max_concurrency: Maximum calls in flight
+        max_connections: Size of the HTTP connection pool
+        max_retries: Retries of a transient failure
+        retry_base_delay: Backoff ceiling of the first retry, doubled per retry
+        retry_max_delay: Maximum backoff ceiling
+        transport: Optional httpx transport
+    """
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        key: Optional[str] = None,
+        timeout: float = DB_TIMEOUT,
+        max_concurrency: int = DB_MAX_CONCURRENCY,
+        max_connections: int = DB_MAX_CONNECTIONS,
+        max_retries: int = DB_MAX_RETRIES,
+        retry_base_delay: float = DB_RETRY_BASE_DELAY,
+        retry_max_delay: float = DB_RETRY_MAX_DELAY,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.url = url
+        self.key = key
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.transport = transport
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._http: Optional[httpx.AsyncClient] = None
+        self._rest: Optional[AsyncPostgrestClient] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._in_flight = 0
+        self._stats = {
+            "calls": 0,
+            "retries": 0,
+            "failures": 0,
+            "timeouts": 0,
+            "peak_in_flight": 0,
+        }
+
+    def _connect(self) -> AsyncPostgrestClient:
+        """Return the client of the running event loop, creating it if needed."""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return self._rest
+
+        url = self.url or os.getenv("SUPABASE_URL")
+        key = self.key or os.getenv("SUPABASE_KEY")
+        if not url or not key:
+            raise DatabaseUnavailableError("SUPABASE_URL and SUPABASE_KEY must be set")
+        rest_url = f"{url.rstrip('/')}/rest/v1"
+        headers = {"apikey": key, "Authorization": f"Bearer {key}"}
+        self._http = httpx.AsyncClient(
+            base_url=rest_url,
+            headers=headers,
+            timeout=self.timeout,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+            ),
+            http2=h2 is not None,
+            follow_redirects=True,
+            transport=self.transport,
+        )
+        self._rest = AsyncPostgrestClient(
+            rest_url, headers=headers, http_client=self._http
+        )
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._loop = loop
+        return self._rest
+
+    def table(self, name: str) -> Any:
+        """Start a query on ``name``; must be called inside the event loop."""
+        return self._connect().table(name)
+
+    async def _attempt(self, query: Any) -> Any:
+        async with self._slots:
+            self._in_flight += 1
+            self._stats["peak_in_flight"] = max(
+                self._stats["peak_in_flight"], self._in_flight
+            )
+            try:
+                return await query.execute()
+            finally:
+                self._in_flight -= 1
+
+    async def execute(
+        self, query: Any, idempotent: bool = True, timeout: Optional[float] = None
+    ) -> Any:
+        """
+        Run a query built with :meth:`table`.
+
+        Args:
+            query: PostgREST request builder
+            idempotent: Whether the query may be retried after it reached the
+                server; pass False for inserts and other writes
+            timeout: Seconds for the call; the database default if None
+
+        Returns:
+            The PostgREST response
+
+        Raises:
+            DatabaseUnavailableError: If the call timed out or transient
+                failures outlasted the retries
+            APIError: If PostgREST rejected the query
+        """
+        self._connect()
+        # The builder's own retries would bypass the timeout and the limit
+        if hasattr(query, "retry"):
+            query.retry(False)
+        self._stats["calls"] += 1
+        limit = self.timeout if timeout is None else timeout
+        try:
+            async with asyncio.timeout(limit):
+                for attempt in count():
+                    try:
+                        return await self._attempt(query)
+                    except Exception as e:
+                        retryable = is_transient(e) and (
+                            idempotent or isinstance(e, UNSENT_ERRORS)
+                        )
+                        if not retryable:
+                            raise
+                        if attempt >= self.max_retries:
+                            raise DatabaseUnavailableError(
+                                f"Database call failed after {attempt + 1} "
+                                f"attempts: {str(e)}"
+                            ) from e
+                        self._stats["retries"] += 1
+                        # Full jitter spreads out retries of concurrent calls
+                        delay = random.uniform(
+                            0,
+                            min(
+                                self.retry_max_delay,
+                                self.retry_base_delay * 2**attempt,
+                            ),
+                        )
+                        logger.warning(
+                            "Database call failed ({}), retrying in {:.2f}s",
+                            str(e),
+                            delay,
+                        )
+                        await asyncio.sleep(delay)
+        except TimeoutError:
+            self._stats["timeouts"] += 1
+            raise DatabaseUnavailableError(f"Database call timed out after {limit}s")
+        except Exception:
+            self._stats["failures"] += 1
+            raise
+
+    async def aclose(self) -> None:
+        """Close the pooled HTTP client."""
+        if self._http is not None and self._loop is asyncio.get_running_loop():
+            await self._http.aclose()
+        self._loop = self._http = self._rest = self._slots = None
+
+    def stats(self) -> Dict[str, int]:
+        """Return call, retry, failure and timeout counters and calls in flight."""
+        return {
+            **self._stats,
+            "in_flight": self._in_flight,
+            "max_concurrency": self.max_concurrency,
+        }
@@ -0,0 +1,180 @@
+"""Process-wide, named thread pools for blocking work.
+
+Creating a ``ThreadPoolExecutor`` per request churns threads and puts no limit
+on how much work a process runs at once. Instead, each kind of blocking work
+gets one long-lived :class:`NamedExecutor`:
+
+- ``agent_build``: constructing agents for a swarm
+- ``swarm_run``: running swarm and agent completions off the event loop
+- ``batch``: fanning out the swarms of a batch request
+- ``llm_call``: LLM calls run under a deadline, and their hedges
+
+Every executor has a fixed number of workers and a limit on how many tasks may
+wait for one; submissions beyond that raise :class:`ExecutorSaturatedError`
+instead of queueing without bound. :meth:`NamedExecutor.stats` reports queue
+depth, active workers and rejections so saturation is visible.
+"""
+
+import asyncio
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Tuple
+
+from dotenv import load_dotenv
+from loguru import logger
+
+load_dotenv()
+
+EXECUTOR_AGENT_BUILD_WORKERS = int(os.getenv("EXECUTOR_AGENT_BUILD_WORKERS", "16"))
+EXECUTOR_AGENT_BUILD_MAX_QUEUE = int(
+    os.getenv("EXECUTOR_AGENT_BUILD_MAX_QUEUE", "256")
+)
+EXECUTOR_SWARM_RUN_WORKERS = int(os.getenv("EXECUTOR_SWARM_RUN_WORKERS", "64"))
+EXECUTOR_SWARM_RUN_MAX_QUEUE = int(os.getenv("EXECUTOR_SWARM_RUN_MAX_QUEUE", "1000"))
+EXECUTOR_BATCH_WORKERS = int(os.getenv("EXECUTOR_BATCH_WORKERS", "32"))
+EXECUTOR_BATCH_MAX_QUEUE = int(os.getenv("EXECUTOR_BATCH_MAX_QUEUE", "512"))
+EXECUTOR_LLM_CALL_WORKERS = int(os.getenv("EXECUTOR_LLM_CALL_WORKERS", "128"))
+EXECUTOR_LLM_CALL_MAX_QUEUE = int(os.getenv("EXECUTOR_LLM_CALL_MAX_QUEUE", "1024"))
+
+# name -> (max_workers, max_queue)
+EXECUTOR_CONFIG: Dict[str, Tuple[int, int]] = {
+    "agent_build": (EXECUTOR_AGENT_BUILD_WORKERS, EXECUTOR_AGENT_BUILD_MAX_QUEUE),
+    "swarm_run": (EXECUTOR_SWARM_RUN_WORKERS, EXECUTOR_SWARM_RUN_MAX_QUEUE),
+    "batch": (EXECUTOR_BATCH_WORKERS, EXECUTOR_BATCH_MAX_QUEUE),
+    "llm_call": (EXECUTOR_LLM_CALL_WORKERS, EXECUTOR_LLM_CALL_MAX_QUEUE),
+}
+
+
+class ExecutorSaturatedError(RuntimeError):
+    """Raised when an executor's queue cannot accept more tasks."""
+
+
+class NamedExecutor:
+    """
+    Thread pool with a bounded queue and saturation counters.
+
+    Args:
+        name: Name used for worker threads, logs and stats
+        max_workers: Number of tasks that may run concurrently
+        max_queue: Number of tasks allowed to wait for a worker
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=name
+        )
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "rejected": 0,
+            "peak_queued": 0,
+        }
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        """
+        Schedule ``fn(*args, **kwargs)`` on a worker.
+
+        Raises:
+            ExecutorSaturatedError: If ``max_queue`` tasks are already waiting
+        """
+        with self._lock:
+            # Tasks in flight beyond the workers are the ones waiting
+            if self._queued + self._active >= self.max_workers + self.max_queue:
+                self._stats["rejected"] += 1
+                logger.warning(
+                    "Executor {} is saturated ({} queued)", self.name, self._queued
+                )
+                raise ExecutorSaturatedError(
+                    f"Server is busy: {self.name} queue is full "
+                    f"({self.max_queue} waiting tasks)"
+                )
+            self._queued += 1
+            self._stats["submitted"] += 1
+            self._stats["peak_queued"] = max(self._stats["peak_queued"], self._queued)
+
+        try:
+            future = self._executor.submit(self._run, fn, args, kwargs)
+        except RuntimeError:
+            # Shut down
+            with self._lock:
+                self._queued -= 1
+            raise
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _run(self, fn: Callable[..., Any], args, kwargs) -> Any:
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._stats["completed"] += 1
+
+    def _on_done(self, future: Future) -> None:
+        # Tasks cancelled before they started never reached _run
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Await ``fn(*args, **kwargs)`` on a worker without blocking the loop."""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stats(self) -> Dict[str, int]:
+        """Return worker and queue limits, current usage and counters."""
+        with self._lock:
+            return {
+                **self._stats,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "active": self._active,
+                "queued": self._queued,
+            }
+
+    def shutdown(self, wait: bool = False) -> None:
+        """Stop accepting tasks and cancel anything still queued."""
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+_executors: Dict[str, NamedExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(name: str) -> NamedExecutor:
+    """
+    Return the process-wide executor called ``name``, creating it on first use.
+
+    Raises:
+        KeyError: If ``name`` is not in :data:`EXECUTOR_CONFIG`
+    """
+    with _executors_lock:
+        executor = _executors.get(name)
+        if executor is None:
+            max_workers, max_queue = EXECUTOR_CONFIG[name]
+            executor = _executors[name] = NamedExecutor(name, max_workers, max_queue)
+        return executor
+
+
+def executor_stats() -> Dict[str, Dict[str, int]]:
+    """Return the stats of every executor created so far, by name."""
+    with _executors_lock:
+        executors = list(_executors.values())
+    return {executor.name: executor.stats() for executor in executors}
+
+
+def shutdown_executors() -> None:
+    """Shut down every executor created so far."""
+    with _executors_lock:
+        executors = list(_executors.values())
+    for executor in executors:
+        executor.shutdown()
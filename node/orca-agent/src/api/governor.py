@@ -0,0 +1,475 @@
+"""Process-wide pacing of outbound LLM calls.
+
+Swarms fan out into many concurrent LLM calls, and bursts above a provider's
+limits come back as 429s that agents retry, which only makes the burst worse.
+:class:`LLMGovernor` paces calls before they leave the process instead:
+
+- every model has a requests-per-minute and a tokens-per-minute token bucket.
+  A bucket holds ``burst_seconds`` worth of budget, so short bursts go through
+  immediately and longer ones are spread out at the model's rate;
+- calls that would overdraw a bucket wait their turn in FIFO order; a call
+  that would have to wait more than ``max_wait`` seconds is rejected;
+- a per-model cap bounds how many calls are in flight at once;
+- token reservations are estimated up front (prompt plus ``max_tokens``) and
+  corrected with the usage the provider reports.
+
+:class:`GovernorCallback` applies the governor to every litellm call in the
+process, which covers the agents of every swarm, streaming or not. litellm
+ignores errors raised from callbacks, so the callback cannot reject a call:
+one over budget is held for ``max_wait`` and still counted. Rejection happens
+earlier, in :class:`~src.api.resilience.LLMGuard`, which calls
+:meth:`LLMGovernor.check` before an agent's call is attempted.
+"""
+
+import asyncio
+import json
+import os
+import threading
+from time import monotonic, sleep
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from dotenv import load_dotenv
+from litellm.integrations.custom_logger import CustomLogger
+from loguru import logger
+
+load_dotenv()
+
+# Budgets of models without an entry in LLM_MODEL_LIMITS; 0 disables a limit
+LLM_DEFAULT_RPM = int(os.getenv("LLM_DEFAULT_RPM", "500"))
+LLM_DEFAULT_TPM = int(os.getenv("LLM_DEFAULT_TPM", "200000"))
+LLM_DEFAULT_CONCURRENCY = int(os.getenv("LLM_DEFAULT_CONCURRENCY", "64"))
+# JSON object of model (or "prefix*") to {"rpm", "tpm", "concurrency"}
+LLM_MODEL_LIMITS = os.getenv("LLM_MODEL_LIMITS", "{}")
+# Seconds of budget a bucket may spend at once
+LLM_BURST_SECONDS = float(os.getenv("LLM_BURST_SECONDS", "6"))
+# Seconds a call may be held back before it is rejected
+LLM_GOVERNOR_MAX_WAIT = float(os.getenv("LLM_GOVERNOR_MAX_WAIT", "120"))
+# Seconds after which a call that never reported completion frees its slot
+LLM_GOVERNOR_TICKET_TTL = float(os.getenv("LLM_GOVERNOR_TICKET_TTL", "900"))
+
+
+class LLMBudgetExceededError(RuntimeError):
+    """Raised when a call cannot be admitted within the maximum wait."""
+
+
+class ModelLimits(NamedTuple):
+    """Budgets of one model; 0 disables a limit."""
+
+    rpm: int = LLM_DEFAULT_RPM
+    tpm: int = LLM_DEFAULT_TPM
+    concurrency: int = LLM_DEFAULT_CONCURRENCY
+
+
+def parse_model_limits(raw: str) -> Dict[str, ModelLimits]:
+    """Parse ``LLM_MODEL_LIMITS``; invalid configuration is logged and ignored."""
+    try:
+        return {
+            model: ModelLimits(**limits) for model, limits in json.loads(raw).items()
+        }
+    except Exception as e:
+        logger.error(f"Invalid LLM_MODEL_LIMITS, using defaults: {str(e)}")
+        return {}
+
+
+class TokenBucket:
+    """
+    Token bucket that lets reservations run into debt.
+
+    A reservation is always taken; the caller waits until the refill has paid
+    off the debt, which queues callers in arrival order.
+    """
+
+    def __init__(self, per_minute: float, burst_seconds: float, now: float):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.tokens = self.capacity
+        self.updated = now
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated) * self.rate
+        )
+        self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Take ``amount`` and return the seconds until it is paid for."""
+        self._refill(now)
+        self.tokens -= amount
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def wait_for(self, amount: float, now: float) -> float:
+        """Return the seconds :meth:`reserve` would wait, without reserving."""
+        self._refill(now)
+        missing = amount - self.tokens
+        return 0.0 if missing <= 0 else missing / self.rate
+
+    def refund(self, amount: float, now: float) -> None:
+        """Give back ``amount``; a negative amount takes more."""
+        self._refill(now)
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class Ticket(NamedTuple):
+    """An admitted call, handed back to :meth:`LLMGovernor.release`."""
+
+    model: str
+    tokens: int
+    waited: float
+    has_slot: bool
+
+
+class _ModelBudget:
+    def __init__(self, limits: ModelLimits, burst_seconds: float, now: float):
+        self.limits = limits
+        self.requests = (
+            TokenBucket(limits.rpm, burst_seconds, now) if limits.rpm else None
+        )
+        self.tokens = (
+            TokenBucket(limits.tpm, burst_seconds, now) if limits.tpm else None
+        )
+        self.slots = (
+            threading.Semaphore(limits.concurrency) if limits.concurrency else None
+        )
+        self.stats = {
+            "calls": 0,
+            "delayed": 0,
+            "rejected": 0,
+            "over_budget": 0,
+            "queued": 0,
+            "in_flight": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+            "tokens_reserved": 0,
+            "tokens_used": 0,
+        }
+
+    def reserve(self, tokens: int, now: float) -> float:
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.reserve(1, now))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.reserve(tokens, now))
+        return wait
+
+    def wait_for(self, tokens: int, now: float) -> float:
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_for(1, now))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_for(tokens, now))
+        return wait
+
+    def refund(self, tokens: int, now: float) -> None:
+        if self.requests is not None:
+            self.requests.refund(1, now)
+        if self.tokens is not None:
+            self.tokens.refund(tokens, now)
+
+
+class LLMGovernor:
+    """
+    Per-model RPM, TPM and concurrency budgets for outbound LLM calls.
+
+    Args:
+        limits: Budgets by model name; names ending in ``*`` match prefixes
+        default: Budgets of models without an entry
+        burst_seconds: Seconds of budget that may be spent at once
+        max_wait: Seconds a call may be held back before it is rejected
+    """
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, ModelLimits]] = None,
+        default: ModelLimits = ModelLimits(),
+        burst_seconds: float = LLM_BURST_SECONDS,
+        max_wait: float = LLM_GOVERNOR_MAX_WAIT,
+        clock: Callable[[], float] = monotonic,
+        sleep: Callable[[float], None] = sleep,
+    ):
+        self.limits = (
+            parse_model_limits(LLM_MODEL_LIMITS) if limits is None else limits
+        )
+        self.default = default
+        self.burst_seconds = burst_seconds
+        self.max_wait = max_wait
+        self._clock = clock
+        self._sleep = sleep
+        self._budgets: Dict[str, _ModelBudget] = {}
+        self._lock = threading.Lock()
+
+    def limits_for(self, model: str) -> ModelLimits:
+        """Return the budgets of ``model``: exact entry, longest prefix, default."""
+        if model in self.limits:
+            return self.limits[model]
+        prefixes = [
+            name
+            for name in self.limits
+            if name.endswith("*") and model.startswith(name[:-1])
+        ]
+        if prefixes:
+            return self.limits[max(prefixes, key=len)]
+        return self.default
+
+    def _budget(self, model: str) -> _ModelBudget:
+        """Return the budget of ``model``. Caller holds the lock."""
+        budget = self._budgets.get(model)
+        if budget is None:
+            budget = self._budgets[model] = _ModelBudget(
+                self.limits_for(model), self.burst_seconds, self._clock()
+            )
+        return budget
+
+    def check(self, model: str, tokens: int = 0) -> None:
+        """
+        Reject a call to ``model`` up front if it could not start in time.
+
+        Nothing is reserved; :meth:`acquire` does that when the call is sent.
+
+        Raises:
+            LLMBudgetExceededError: If the call would wait more than max_wait
+        """
+        with self._lock:
+            budget = self._budget(model)
+            wait = budget.wait_for(tokens, self._clock())
+            if wait > self.max_wait:
+                budget.stats["rejected"] += 1
+                raise LLMBudgetExceededError(
+                    f"{model} is over its rate limits for the next {int(wait)}s"
+                )
+
+    def acquire(
+        self, model: str, tokens: int, block: bool = True, reject: bool = True
+    ) -> Ticket:
+        """
+        Wait until a call to ``model`` using about ``tokens`` tokens may start.
+
+        Args:
+            model: Model the call goes to
+            tokens: Estimated prompt and completion tokens
+            block: When False the call is recorded against the budgets but
+                never waits, for callers running on an event loop
+            reject: When False a call that would wait more than max_wait is
+                held for max_wait and then sent, still counted, instead of
+                being rejected
+
+        Raises:
+            LLMBudgetExceededError: If ``reject`` is set and the call would
+                wait more than max_wait
+        """
+        with self._lock:
+            budget = self._budget(model)
+            now = self._clock()
+            wait = budget.reserve(tokens, now)
+            if not block:
+                wait = 0.0
+            if wait > self.max_wait:
+                if reject:
+                    budget.refund(tokens, now)
+                    budget.stats["rejected"] += 1
+                    raise LLMBudgetExceededError(
+                        f"{model} is over its rate limits for the next {int(wait)}s"
+                    )
+                budget.stats["over_budget"] += 1
+                wait = self.max_wait
+            budget.stats["queued"] += 1
+
+        started = self._clock()
+        delayed = wait > 0
+        has_slot = False
+        try:
+            if delayed:
+                self._sleep(wait)
+            if budget.slots is not None:
+                has_slot = budget.slots.acquire(blocking=False)
+                if not has_slot and block:
+                    delayed = True
+                    has_slot = budget.slots.acquire(
+                        timeout=max(0.0, self.max_wait - wait)
+                    )
+                if not has_slot and block and reject:
+                    with self._lock:
+                        budget.refund(tokens, self._clock())
+                        budget.stats["rejected"] += 1
+                    raise LLMBudgetExceededError(
+                        f"{model} has {budget.limits.concurrency} calls in flight"
+                    )
+                if not has_slot and block:
+                    with self._lock:
+                        budget.stats["over_budget"] += 1
+        finally:
+            with self._lock:
+                budget.stats["queued"] -= 1
+
+        waited = self._clock() - started if delayed else 0.0
+        with self._lock:
+            stats = budget.stats
+            stats["calls"] += 1
+            stats["in_flight"] += 1
+            stats["tokens_reserved"] += tokens
+            stats["wait_seconds_total"] += waited
+            stats["wait_seconds_max"] = max(stats["wait_seconds_max"], waited)
+            if delayed:
+                stats["delayed"] += 1
+        return Ticket(model, tokens, waited, has_slot)
+
+    def release(self, ticket: Ticket, used_tokens: Optional[int] = None) -> None:
+        """
+        Mark a call finished.
+
+        Args:
+            ticket: Ticket returned by :meth:`acquire`
+            used_tokens: Tokens the provider reported; corrects the estimate
+        """
+        with self._lock:
+            budget = self._budget(ticket.model)
+            budget.stats["in_flight"] -= 1
+            if used_tokens is not None:
+                budget.stats["tokens_used"] += used_tokens
+                if budget.tokens is not None:
+                    budget.tokens.refund(ticket.tokens - used_tokens, self._clock())
+        if ticket.has_slot:
+            budget.slots.release()
+
+    def queued(self, model: str) -> int:
+        """Return the calls to ``model`` currently held back."""
+        with self._lock:
+            budget = self._budgets.get(model)
+            return budget.stats["queued"] if budget is not None else 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return per-model counters, queue wait times and calls queued."""
+        with self._lock:
+            models = {
+                model: {
+                    **budget.stats,
+                    "rpm": budget.limits.rpm,
+                    "tpm": budget.limits.tpm,
+                    "concurrency": budget.limits.concurrency,
+                }
+                for model, budget in self._budgets.items()
+            }
+        return {
+            "calls": sum(m["calls"] for m in models.values()),
+            "queued": sum(m["queued"] for m in models.values()),
+            "rejected": sum(m["rejected"] for m in models.values()),
+            "over_budget": sum(m["over_budget"] for m in models.values()),
+            "wait_seconds_total": sum(
+                m["wait_seconds_total"] for m in models.values()
+            ),
+            "models": models,
+        }
+
+
+def messages_text(messages: Any) -> str:
+    """Flatten chat messages (or a prompt) into text for token estimation."""
+    if isinstance(messages, str):
+        return messages
+    parts: List[str] = []
+    for message in messages or []:
+        content = message.get("content") if isinstance(message, dict) else message
+        parts.append(content if isinstance(content, str) else str(content or ""))
+    return "\n".join(parts)
+
+
+def estimate_tokens(model: str, messages: Any) -> int:
+    """Rough prompt size, about four characters per token."""
+    return len(messages_text(messages)) // 4 + 1
+
+
+def reported_tokens(response: Any) -> Optional[int]:
+    """Return the total tokens a litellm response reports, if any."""
+    usage = getattr(response, "usage", None)
+    if usage is None and isinstance(response, dict):
+        usage = response.get("usage")
+    if isinstance(usage, dict):
+        return usage.get("total_tokens")
+    return getattr(usage, "total_tokens", None)
+
+
+def _in_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class GovernorCallback(CustomLogger):
+    """
+    litellm callback that routes every LLM call through an :class:`LLMGovernor`.
+
+    litellm runs the pre-call hook in the calling thread just before the
+    provider request, so waiting there holds the call back. Calls made from an
+    event loop are only recorded, never delayed. litellm ignores errors raised
+    from callbacks, so a call over budget is held for the governor's
+    ``max_wait`` and then sent, and still counted against the budgets.
+
+    Args:
+        governor: Governor that paces the calls
+        estimate: Returns the prompt tokens of ``(model, messages)``
+        ticket_ttl: Seconds after which a call that never reported completion
+            frees its slot
+    """
+
+    def __init__(
+        self,
+        governor: LLMGovernor,
+        estimate: Callable[[str, Any], int] = estimate_tokens,
+        ticket_ttl: float = LLM_GOVERNOR_TICKET_TTL,
+    ):
+        super().__init__()
+        self.governor = governor
+        self.estimate = estimate
+        self.ticket_ttl = ticket_ttl
+        # Call id to ticket and admission time
+        self._tickets: Dict[str, Tuple[Ticket, float]] = {}
+        self._lock = threading.Lock()
+
+    def _expire(self) -> None:
+        """Free the slots of calls whose completion was never reported."""
+        cutoff = monotonic() - self.ticket_ttl
+        with self._lock:
+            expired = [
+                call_id
+                for call_id, (_, admitted_at) in self._tickets.items()
+                if admitted_at < cutoff
+            ]
+            tickets = [self._tickets.pop(call_id)[0] for call_id in expired]
+        for ticket in tickets:
+            self.governor.release(ticket)
+
+    def _finish(self, kwargs: Dict[str, Any], response: Any = None) -> None:
+        with self._lock:
+            entry = self._tickets.pop(kwargs.get("litellm_call_id"), None)
+        if entry is not None:
+            self.governor.release(entry[0], reported_tokens(response))
+
+    def log_pre_api_call(self, model, messages, kwargs):
+        call_id = kwargs.get("litellm_call_id")
+        if call_id is None:
+            return
+        # A retry reuses the call id; it is a new request for the budgets
+        self._finish(kwargs)
+        self._expire()
+        model = kwargs.get("model") or model
+        optional_params = kwargs.get("optional_params") or {}
+        tokens = self.estimate(model, messages) + int(
+            optional_params.get("max_tokens") or 0
+        )
+        ticket = self.governor.acquire(
+            model, tokens, block=not _in_event_loop(), reject=False
+        )
+        with self._lock:
+            self._tickets[call_id] = (ticket, monotonic())
+
+    def log_success_event(self, kwargs, response_obj, start_time, end_time):
+        self._finish(kwargs, response_obj)
+
+    def log_failure_event(self, kwargs, response_obj, start_time, end_time):
+        self._finish(kwargs)
+
+    async def async_log_success_event(self, kwargs, response_obj, start_time, end_time):
+        self._finish(kwargs, response_obj)
+
+    async def async_log_failure_event(self, kwargs, response_obj, start_time, end_time):
+        self._finish(kwargs)
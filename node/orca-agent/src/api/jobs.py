@@ -0,0 +1,305 @@
+"""Background execution of swarm completion jobs.
+
+Swarm runs are long and fully synchronous, so instead of executing them inside
+an ``async def`` handler the API hands them to a :class:`SwarmJobManager`. The
+manager owns a bounded worker pool, tracks every job with the ``SwarmJob``,
+``SwarmStatus`` and ``SwarmResult`` models and lets clients poll for results.
+With an :class:`AdmissionController`, a flex job waits for admission before
+it is handed to the pool, so waiting jobs do not hold workers.
+"""
+
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import UTC, datetime
+from typing import Any, Callable, Dict, Optional
+
+from dotenv import load_dotenv
+from loguru import logger
+
+from src.api.admission import AdmissionController
+from src.server.models.swarm import (
+    SwarmJob,
+    SwarmResult,
+    SwarmStatus,
+    SwarmStatusEnum,
+)
+
+load_dotenv()
+
+# Worker pool sizing; swarm runs are I/O bound (LLM calls) so threads are cheap
+SWARM_JOB_WORKERS = int(os.getenv("SWARM_JOB_WORKERS", "64"))
+# Maximum number of jobs waiting for a worker before new submissions are refused
+SWARM_JOB_MAX_PENDING = int(os.getenv("SWARM_JOB_MAX_PENDING", "1000"))
+# How long finished jobs are kept around for polling (seconds)
+SWARM_JOB_RESULT_TTL = int(os.getenv("SWARM_JOB_RESULT_TTL", "3600"))
+
+
+class JobQueueFullError(RuntimeError):
+    """Raised when the job queue cannot accept more submissions."""
+
+
+class _JobRecord:
+    """Internal bookkeeping for a single job."""
+
+    __slots__ = ("job", "status", "result", "owner", "future", "on_abandon")
+
+    def __init__(
+        self,
+        job: SwarmJob,
+        status: SwarmStatus,
+        owner: Optional[str],
+        on_abandon: Optional[Callable[[Optional[str]], None]] = None,
+    ):
+        self.job = job
+        self.status = status
+        self.result: Optional[SwarmResult] = None
+        self.owner = owner
+        self.future: Optional[Future] = None
+        self.on_abandon = on_abandon
+
+
+class SwarmJobManager:
+    """
+    Runs swarm jobs on a managed thread pool and tracks their lifecycle.
+
+    Args:
+        max_workers: Number of jobs that may execute concurrently
+        max_pending: Number of queued jobs allowed before submissions are refused
+        result_ttl: Seconds to keep finished jobs before they are purged
+        admission: Admits each job by its service tier before it is handed to
+            the pool; jobs start at once if None
+    """
+
+    def __init__(
+        self,
+        max_workers: int = SWARM_JOB_WORKERS,
+        max_pending: int = SWARM_JOB_MAX_PENDING,
+        result_ttl: int = SWARM_JOB_RESULT_TTL,
+        admission: Optional[AdmissionController] = None,
+    ):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.admission = admission
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="swarm-job"
+        )
+        self._jobs: Dict[str, _JobRecord] = {}
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        job_id: str,
+        swarm_spec: Dict[str, Any],
+        fn: Callable[..., Dict[str, Any]],
+        *args,
+        owner: Optional[str] = None,
+        tier: Optional[str] = None,
+        on_abandon: Optional[Callable[[Optional[str]], None]] = None,
+        **kwargs,
+    ) -> SwarmJob:
+        """
+        Queue a job for execution.
+
+        Args:
+            job_id: Identifier clients use to poll the job
+            swarm_spec: Serialized swarm specification stored with the job
+            fn: Blocking callable that executes the job and returns its output
+            owner: User that owns the job; only they may read the job back
+            tier: Service tier the job is admitted under
+            on_abandon: Called if the job ends without running: with None
+                when it is cancelled, or with the error when it is not
+                admitted
+
+        Returns:
+            SwarmJob: The newly created job record
+
+        Raises:
+            JobQueueFullError: If too many jobs are already waiting
+        """
+        now = datetime.now(UTC)
+        job = SwarmJob(
+            job_id=job_id,
+            status=SwarmStatusEnum.PENDING,
+            swarm_spec=swarm_spec,
+            created_at=now,
+            updated_at=now,
+        )
+        status = SwarmStatus(
+            job_id=job_id,
+            status=SwarmStatusEnum.PENDING,
+            progress=0.0,
+            started_at=now,
+            updated_at=now,
+        )
+
+        with self._lock:
+            self._purge_expired(now)
+            if self._pending_count() >= self.max_pending:
+                raise JobQueueFullError(
+                    f"Job queue is full ({self.max_pending} pending jobs)"
+                )
+            record = _JobRecord(job, status, owner, on_abandon)
+            self._jobs[job_id] = record
+            if self.admission is None:
+                record.future = self._executor.submit(
+                    self._run, record, fn, *args, **kwargs
+                )
+            else:
+                record.future = self.admission.submit(
+                    tier, self._executor, self._run, record, fn, *args, **kwargs
+                )
+
+        # _run records every outcome, so an error here means it never ran.
+        # Registered outside the lock: it runs at once for a rejected job
+        record.future.add_done_callback(
+            lambda future: self._not_admitted(record, future)
+        )
+        logger.info("Queued swarm job {}", job_id)
+        return job
+
+    def _not_admitted(self, record: _JobRecord, future: Future) -> None:
+        """Fail a job whose run was refused before it started."""
+        if future.cancelled() or future.exception() is None:
+            return
+        error = str(future.exception())
+        logger.info("Swarm job {} was not admitted: {}", record.job.job_id, error)
+        self._finish(record, SwarmStatusEnum.FAILED, {"error": error}, error)
+        self._abandon(record, error)
+
+    def _abandon(self, record: _JobRecord, error: Optional[str]) -> None:
+        if record.on_abandon is not None:
+            try:
+                record.on_abandon(error)
+            except Exception as e:
+                logger.error(
+                    f"Abandon hook of swarm job {record.job.job_id} failed: {str(e)}"
+                )
+
+    def _run(self, record: _JobRecord, fn: Callable[..., Dict[str, Any]], *args, **kwargs):
+        """Execute a job on a worker thread and record its outcome."""
+        job_id = record.job.job_id
+        started_at = datetime.now(UTC)
+        self._set_status(record, SwarmStatusEnum.IN_PROGRESS, started_at=started_at)
+
+        try:
+            output = fn(*args, **kwargs)
+        except Exception as e:
+            error = getattr(e, "detail", None) or str(e)
+            logger.error("Swarm job {} failed: {}", job_id, error)
+            self._finish(record, SwarmStatusEnum.FAILED, {"error": error}, error)
+            return
+
+        logger.info("Swarm job {} completed", job_id)
+        self._finish(record, SwarmStatusEnum.COMPLETED, output)
+
+    def _set_status(
+        self,
+        record: _JobRecord,
+        status: SwarmStatusEnum,
+        progress: Optional[float] = None,
+        started_at: Optional[datetime] = None,
+        error: Optional[str] = None,
+    ) -> None:
+        now = datetime.now(UTC)
+        with self._lock:
+            record.job = record.job.model_copy(
+                update={"status": status, "updated_at": now}
+            )
+            update: Dict[str, Any] = {"status": status, "updated_at": now}
+            if progress is not None:
+                update["progress"] = progress
+            if started_at is not None:
+                update["started_at"] = started_at
+            if error is not None:
+                update["error"] = error
+            record.status = record.status.model_copy(update=update)
+
+    def _finish(
+        self,
+        record: _JobRecord,
+        status: SwarmStatusEnum,
+        output: Any,
+        error: Optional[str] = None,
+    ) -> None:
+        if not isinstance(output, dict):
+            output = {"output": output}
+        self._set_status(record, status, progress=1.0, error=error)
+        with self._lock:
+            record.result = SwarmResult(
+                job_id=record.job.job_id,
+                status=status,
+                output=output,
+                completed_at=record.status.updated_at,
+            )
+
+    def _get(self, job_id: str, owner: Optional[str]) -> Optional[_JobRecord]:
+        record = self._jobs.get(job_id)
+        if record is None or (owner is not None and record.owner != owner):
+            return None
+        return record
+
+    def get_status(
+        self, job_id: str, owner: Optional[str] = None
+    ) -> Optional[SwarmStatus]:
+        """Return the current status of a job."""
+        record = self._get(job_id, owner)
+        return record.status if record else None
+
+    def get_result(
+        self, job_id: str, owner: Optional[str] = None
+    ) -> Optional[SwarmResult]:
+        """Return the result of a finished job, or None if it is not finished."""
+        record = self._get(job_id, owner)
+        return record.result if record else None
+
+    def cancel(self, job_id: str, owner: Optional[str] = None) -> bool:
+        """
+        Cancel a job that has not started yet.
+
+        Returns:
+            bool: True if the job was cancelled, False if it is unknown or running
+        """
+        record = self._get(job_id, owner)
+        if record is None or record.future is None or not record.future.cancel():
+            return False
+        self._set_status(record, SwarmStatusEnum.CANCELLED)
+        logger.info("Cancelled swarm job {}", job_id)
+        self._abandon(record, None)
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        """Return job counts grouped by status."""
+        counts = {status.value: 0 for status in SwarmStatusEnum}
+        with self._lock:
+            for record in self._jobs.values():
+                counts[record.status.status.value] += 1
+        return counts
+
+    def _pending_count(self) -> int:
+        return sum(
+            1
+            for record in self._jobs.values()
+            if record.status.status == SwarmStatusEnum.PENDING
+        )
+
+    def _purge_expired(self, now: datetime) -> None:
+        """Drop finished jobs older than the result TTL. Caller holds the lock."""
+        terminal = (
+            SwarmStatusEnum.COMPLETED,
+            SwarmStatusEnum.FAILED,
+            SwarmStatusEnum.CANCELLED,
+        )
+        expired = [
+            job_id
+            for job_id, record in self._jobs.items()
+            if record.status.status in terminal
+            and (now - record.status.updated_at).total_seconds() > self.result_ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def shutdown(self, wait: bool = False) -> None:
+        """Stop accepting jobs and cancel anything still queued."""
+        self._executor.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,142 @@
+"""Paginated queries over the swarms_api_logs table.
+
+Heavy users have tens of thousands of log rows with large telemetry blobs, so
+logs are never read in one query:
+
+- pages are ordered newest first and fetched by keyset on
+  ``(created_at, id)``; the opaque cursor returned with a page resumes right
+  after its last row, so deep pages cost the same as the first;
+- ``since``/``until`` bound ``created_at`` and ``path`` matches the request
+  path recorded in ``data``;
+- ``fields`` projects columns from an allowlist, so callers that only need
+  timestamps or paths do not transfer the telemetry blobs;
+- streaming walks the pages one at a time, so only one page is in memory.
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+LOGS_TABLE = "swarms_api_logs"
+LOG_PAGE_MAX = 1000
+# Page size used when streaming every matching row
+LOG_STREAM_PAGE_SIZE = 500
+# Columns callers may project; the keyset columns are always selected
+LOG_FIELDS = ("id", "created_at", "api_key", "data", "data->path", "data->telemetry")
+KEYSET_FIELDS = ("id", "created_at")
+
+
+class InvalidLogQueryError(ValueError):
+    """Raised for malformed cursors or unknown fields."""
+
+
+class LogQuery(NamedTuple):
+    """Filters, projection and position of a log query."""
+
+    limit: int = 100
+    cursor: Optional[str] = None
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+    path: Optional[str] = None
+    fields: Optional[Tuple[str, ...]] = None
+
+
+def parse_fields(fields: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """
+    Parse a comma-separated projection, e.g. ``"created_at,data->path"``.
+
+    Raises:
+        InvalidLogQueryError: If a field is not in :data:`LOG_FIELDS`
+    """
+    if not fields:
+        return None
+    parsed = tuple(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [f for f in parsed if f not in LOG_FIELDS]
+    if unknown:
+        raise InvalidLogQueryError(
+            f"Unknown log fields {unknown}; choose from {list(LOG_FIELDS)}"
+        )
+    return parsed
+
+
+def select_clause(fields: Optional[Tuple[str, ...]]) -> str:
+    """Return the PostgREST select for a projection, keyset columns included."""
+    if not fields:
+        return "*"
+    return ",".join(dict.fromkeys(KEYSET_FIELDS + fields))
+
+
+def encode_cursor(row: Dict[str, Any]) -> str:
+    """Return the cursor that resumes after ``row``."""
+    position = json.dumps([row["created_at"], row["id"]], default=str)
+    return base64.urlsafe_b64encode(position.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, Any]:
+    """
+    Return the ``(created_at, id)`` a cursor points at.
+
+    Raises:
+        InvalidLogQueryError: If the cursor was not produced by this module
+    """
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise InvalidLogQueryError("Invalid cursor")
+    # Cursor values end up inside a PostgREST filter string
+    if not isinstance(created_at, str) or not isinstance(row_id, (int, str)):
+        raise InvalidLogQueryError("Invalid cursor")
+    if any(c in f"{created_at}{row_id}" for c in ',()"'):
+        raise InvalidLogQueryError("Invalid cursor")
+    return created_at, row_id
+
+
+def build_log_query(client: Any, api_key: str, query: LogQuery, limit: int) -> Any:
+    """Build the PostgREST request for one page of an API key's logs."""
+    request = (
+        client.table(LOGS_TABLE)
+        .select(select_clause(query.fields))
+        .eq("api_key", api_key)
+    )
+    if query.since is not None:
+        request = request.gte("created_at", query.since.isoformat())
+    if query.until is not None:
+        request = request.lt("created_at", query.until.isoformat())
+    if query.path is not None:
+        request = request.eq("data->>path", query.path)
+    if query.cursor is not None:
+        created_at, row_id = decode_cursor(query.cursor)
+        request = request.or_(
+            f"created_at.lt.{created_at},"
+            f"and(created_at.eq.{created_at},id.lt.{row_id})"
+        )
+    return (
+        request.order("created_at", desc=True).order("id", desc=True).limit(limit)
+    )
+
+
+async def fetch_log_page(
+    database: Any, api_key: str, query: LogQuery
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Fetch one page of logs, newest first.
+
+    Args:
+        database: :class:`~src.api.database.AsyncDatabase` to query
+        api_key: API key whose logs are read
+        query: Filters, projection and cursor of the page
+
+    Returns:
+        The rows and the cursor of the next page (None on the last page)
+    """
+    limit = max(1, min(query.limit, LOG_PAGE_MAX))
+    # One extra row tells whether another page exists
+    response = await database.execute(
+        build_log_query(database, api_key, query, limit + 1)
+    )
+    rows = response.data or []
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1])
@@ -0,0 +1,367 @@
+"""Prometheus metrics in the text exposition format.
+
+:class:`MetricsRegistry` holds counters, gauges and histograms that are
+updated as requests, swarms and LLM calls happen, plus collectors that turn
+the ``stats()`` of long-lived components (caches, executors, the LLM governor
+and guard) into metric families when ``/metrics`` is scraped. Scraping only
+takes locks briefly and never touches the network.
+
+Values are kept per process; with several workers, Prometheus scrapes each
+one and sums them. Label values that come from requests (routes, models) are
+bounded by ``max_series`` per metric so a misbehaving client cannot grow the
+registry without limit.
+"""
+
+import math
+import os
+import threading
+from bisect import bisect_left
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from dotenv import load_dotenv
+from litellm.integrations.custom_logger import CustomLogger
+from loguru import logger
+
+load_dotenv()
+
+# Most label combinations a single metric keeps before dropping new ones
+METRICS_MAX_SERIES = int(os.getenv("METRICS_MAX_SERIES", "1000"))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upper bounds in seconds, from fast API calls to long swarm runs
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+    300.0,
+)
+
+Labels = Dict[str, str]
+
+
+class MetricFamily(NamedTuple):
+    """A metric and its samples, as produced by a collector at scrape time."""
+
+    name: str
+    type: str
+    help: str
+    samples: List[Tuple[Labels, float]]
+
+
+def _format_value(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels.items())
+    return "{" + pairs + "}"
+
+
+def _header(name: str, type_: str, help_: str) -> List[str]:
+    help_ = help_.replace("\\", "\\\\").replace("\n", "\\n")
+    return [f"# HELP {name} {help_}", f"# TYPE {name} {type_}"]
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        max_series: int = METRICS_MAX_SERIES,
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self.max_series = max_series
+        self._series: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+        self._dropped = False
+
+    def _key(self, labels: Labels) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"{self.name} takes labels {list(self.labelnames)}, got {sorted(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _get(self, labels: Labels, factory: Callable[[], Any]) -> Optional[Any]:
+        """Return the series for ``labels``, or None when the cap is reached.
+
+        Caller holds the lock.
+        """
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            if len(self._series) >= self.max_series:
+                if not self._dropped:
+                    self._dropped = True
+                    logger.warning(
+                        f"Metric {self.name} reached {self.max_series} series, "
+                        "dropping new label values"
+                    )
+                return None
+            series = self._series[key] = factory()
+        return series
+
+    def _labels(self, key: Tuple[str, ...]) -> Labels:
+        return dict(zip(self.labelnames, key))
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """A value that only goes up."""
+
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        if amount < 0:
+            raise ValueError("Counters can only be incremented")
+        with self._lock:
+            value = self._get(labels, lambda: [0.0])
+            if value is not None:
+                value[0] += amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = [(key, value[0]) for key, value in self._series.items()]
+        lines = _header(self.name, self.type, self.help)
+        for key, value in series:
+            lines.append(
+                f"{self.name}{_format_labels(self._labels(key))} {_format_value(value)}"
+            )
+        return lines
+
+
+class Gauge(Counter):
+    """A value that goes up and down."""
+
+    type = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            current = self._get(labels, lambda: [0.0])
+            if current is not None:
+                current[0] = value
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        with self._lock:
+            value = self._get(labels, lambda: [0.0])
+            if value is not None:
+                value[0] += amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """Counts observations into cumulative buckets, with their sum and count."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+        max_series: int = METRICS_MAX_SERIES,
+    ):
+        super().__init__(name, help, labels, max_series)
+        self.buckets = tuple(sorted(float(b) for b in buckets if not math.isinf(b)))
+
+    def observe(self, value: float, **labels: str) -> None:
+        # Counts per bucket, then +Inf, sum and count
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._get(labels, lambda: [0] * (len(self.buckets) + 1) + [0.0])
+            if series is not None:
+                series[index] += 1
+                series[-1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = [(key, list(counts)) for key, counts in self._series.items()]
+        lines = _header(self.name, self.type, self.help)
+        bounds = [*self.buckets, math.inf]
+        for key, counts in series:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                bucket_labels = _format_labels({**labels, "le": _format_value(bound)})
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            suffix = _format_labels(labels)
+            lines.append(f"{self.name}_sum{suffix} {_format_value(counts[-1])}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Process-wide set of metrics rendered together on ``/metrics``.
+
+    Args:
+        prefix: Prepended to the name of every metric and collected family
+    """
+
+    def __init__(self, prefix: str = ""):
+        self.prefix = prefix
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[MetricFamily]]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> Any:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or (
+                    existing.labelnames != metric.labelnames
+                ):
+                    raise ValueError(f"Metric {metric.name} is already registered")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(self.prefix + name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(self.prefix + name, help, labels))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(self.prefix + name, help, labels, buckets))
+
+    def add_collector(self, collector: Callable[[], Iterable[MetricFamily]]) -> None:
+        """Register a function that returns metric families at scrape time."""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Return every metric in the Prometheus text format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collector in collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                # One broken component must not take the whole scrape down
+                logger.error(f"Metrics collector {collector!r} failed: {str(e)}")
+                continue
+            for family in families:
+                name = self.prefix + family.name
+                lines.extend(_header(name, family.type, family.help))
+                for labels, value in family.samples:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def hit_ratio(hits: float, misses: float) -> float:
+    """Return the share of lookups that were hits, 0 before the first lookup."""
+    total = hits + misses
+    return hits / total if total else 0.0
+
+
+def _usage_tokens(response: Any) -> Dict[str, int]:
+    usage = getattr(response, "usage", None)
+    if usage is None and isinstance(response, dict):
+        usage = response.get("usage")
+    if usage is None:
+        return {}
+    get = usage.get if isinstance(usage, dict) else lambda key: getattr(usage, key, None)
+    return {
+        kind: int(get(f"{kind}_tokens") or 0) for kind in ("prompt", "completion")
+    }
+
+
+class LLMMetricsCallback(CustomLogger):
+    """
+    litellm callback that records the latency and token usage of LLM calls.
+
+    Records ``llm_call_duration_seconds{model,status}`` and
+    ``llm_tokens_total{model,kind}`` in ``registry``. Streaming calls are
+    recorded once, when the stream completes.
+    """
+
+    def __init__(self, registry: MetricsRegistry):
+        super().__init__()
+        self.duration = registry.histogram(
+            "llm_call_duration_seconds",
+            "Latency of outbound LLM calls",
+            ["model", "status"],
+        )
+        self.tokens = registry.counter(
+            "llm_tokens_total",
+            "Tokens used by outbound LLM calls, by prompt and completion",
+            ["model", "kind"],
+        )
+
+    def _record(self, kwargs, response_obj, start_time, end_time, status: str) -> None:
+        model = str(kwargs.get("model") or "unknown")
+        try:
+            seconds = (end_time - start_time).total_seconds()
+        except Exception:
+            seconds = None
+        if seconds is not None and seconds >= 0:
+            self.duration.observe(seconds, model=model, status=status)
+        for kind, count in _usage_tokens(response_obj).items():
+            if count:
+                self.tokens.inc(count, model=model, kind=kind)
+
+    def log_success_event(self, kwargs, response_obj, start_time, end_time):
+        self._record(kwargs, response_obj, start_time, end_time, "success")
+
+    def log_failure_event(self, kwargs, response_obj, start_time, end_time):
+        self._record(kwargs, None, start_time, end_time, "error")
+
+    async def async_log_success_event(self, kwargs, response_obj, start_time, end_time):
+        self._record(kwargs, response_obj, start_time, end_time, "success")
+
+    async def async_log_failure_event(self, kwargs, response_obj, start_time, end_time):
+        self._record(kwargs, None, start_time, end_time, "error")
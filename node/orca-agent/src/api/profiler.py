@@ -0,0 +1,202 @@
+"""On-demand sampling profiler for live processes.
+
+:class:`SamplingProfiler` answers "where is this worker spending its time?"
+without restarting it under a profiler. While a profile runs, the calling
+thread wakes every ``interval`` seconds, reads the current stack of every
+other thread with :func:`sys._current_frames` and counts identical stacks.
+The result is a wall-clock profile in the collapsed-stack format that
+flamegraph.pl, speedscope and similar tools read::
+
+    swarm_run;_worker;run;create_swarm (api.py:830);... 42
+
+Each stack is rooted at its thread's name with the worker number dropped
+(``swarm_run_3`` becomes ``swarm_run``), so pools show up as one tower.
+Threads parked waiting for work (idle pool workers, event loops in
+``select``) are left out unless ``include_idle`` is set.
+
+Nothing is installed in the profiled process: no trace hooks and no
+background thread. A process that is not being profiled pays nothing, and
+only one profile runs at a time.
+"""
+
+import os
+import re
+import sys
+import threading
+from collections import Counter
+from time import monotonic, sleep
+from types import FrameType
+from typing import Callable, Dict, List, NamedTuple, Tuple
+
+from dotenv import load_dotenv
+from loguru import logger
+
+load_dotenv()
+
+# Longest profile a request may ask for, in seconds
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+# Seconds between samples; 0.01 samples each thread 100 times a second
+PROFILE_DEFAULT_INTERVAL = float(os.getenv("PROFILE_DEFAULT_INTERVAL", "0.01"))
+# Shortest interval a request may ask for
+PROFILE_MIN_INTERVAL = 0.001
+
+# (file name, function) of leaf frames where a thread is waiting for work
+IDLE_FRAMES = frozenset(
+    {
+        ("thread.py", "_worker"),
+        ("selectors.py", "select"),
+        ("queue.py", "get"),
+    }
+)
+# Blocking primitives whose caller decides whether the wait is idle
+WAIT_FRAMES = frozenset({("threading.py", "wait")})
+
+# "swarm_run_3" and "Thread-7 (process_request_thread)" style numbers
+_WORKER_NUMBER = re.compile(r"[-_]\d+(?=( \(\w+\))?$)")
+
+
+class ProfilerBusyError(RuntimeError):
+    """Raised when a profile is requested while another one is running."""
+
+
+class Profile(NamedTuple):
+    """Collapsed stacks of one profiling run."""
+
+    stacks: Dict[str, int]
+    samples: int
+    duration: float
+    interval: float
+
+    def collapsed(self) -> str:
+        """Return one ``frame;frame;... count`` line per stack, heaviest first."""
+        lines = [
+            f"{stack} {count}"
+            for stack, count in sorted(self.stacks.items(), key=lambda s: -s[1])
+        ]
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    filename = os.path.basename(code.co_filename)
+    # The definition line keeps every sample of a function in one frame
+    return f"{code.co_qualname} ({filename}:{code.co_firstlineno})"
+
+
+def _frame_key(frame: FrameType) -> Tuple[str, str]:
+    return os.path.basename(frame.f_code.co_filename), frame.f_code.co_name
+
+
+def _is_idle(frame: FrameType) -> bool:
+    """Whether the thread whose innermost frame is ``frame`` waits for work."""
+    key = _frame_key(frame)
+    if key in WAIT_FRAMES and frame.f_back is not None:
+        key = _frame_key(frame.f_back)
+    return key in IDLE_FRAMES
+
+
+def thread_label(name: str) -> str:
+    """Return a thread's name without its worker number."""
+    return _WORKER_NUMBER.sub("", name) or name
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of every thread in the process on request.
+
+    Args:
+        max_seconds: Longest profile :meth:`profile` accepts
+        clock: Monotonic clock, for tests
+        sleep: Sleep function, for tests
+    """
+
+    def __init__(
+        self,
+        max_seconds: float = PROFILE_MAX_SECONDS,
+        clock: Callable[[], float] = monotonic,
+        sleep: Callable[[float], None] = sleep,
+    ):
+        self.max_seconds = max_seconds
+        self._clock = clock
+        self._sleep = sleep
+        self._running = threading.Lock()
+        self._lock = threading.Lock()
+        self._stats = {"profiles": 0, "busy": 0, "samples": 0}
+
+    @property
+    def active(self) -> bool:
+        """Whether a profile is running."""
+        return self._running.locked()
+
+    def sample(self, include_idle: bool = False) -> List[str]:
+        """Return the collapsed stack of every other thread, right now."""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        own = threading.get_ident()
+        stacks = []
+        for ident, frame in sys._current_frames().items():
+            if ident == own or (not include_idle and _is_idle(frame)):
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            labels.append(thread_label(names.get(ident, f"thread-{ident}")))
+            stacks.append(";".join(reversed(labels)))
+        return stacks
+
+    def profile(
+        self,
+        seconds: float,
+        interval: float = PROFILE_DEFAULT_INTERVAL,
+        include_idle: bool = False,
+    ) -> Profile:
+        """
+        Sample every thread for ``seconds``, blocking the calling thread.
+
+        Args:
+            seconds: How long to sample, at most ``max_seconds``
+            interval: Seconds between samples
+            include_idle: Whether to keep threads waiting for work
+
+        Raises:
+            ValueError: If ``seconds`` or ``interval`` is out of range
+            ProfilerBusyError: If another profile is running
+        """
+        if not 0 < seconds <= self.max_seconds:
+            raise ValueError(f"seconds must be in (0, {self.max_seconds:g}]")
+        if not PROFILE_MIN_INTERVAL <= interval <= seconds:
+            raise ValueError(
+                f"interval must be between {PROFILE_MIN_INTERVAL:g} and seconds"
+            )
+        if not self._running.acquire(blocking=False):
+            with self._lock:
+                self._stats["busy"] += 1
+            raise ProfilerBusyError("A profile is already running")
+        try:
+            logger.info(f"Profiling all threads for {seconds:g}s every {interval:g}s")
+            stacks: Counter = Counter()
+            samples = 0
+            started = next_sample = self._clock()
+            deadline = started + seconds
+            while True:
+                stacks.update(self.sample(include_idle))
+                samples += 1
+                # Keep a fixed schedule, skipping ticks a slow sample overran
+                now = self._clock()
+                next_sample = max(next_sample + interval, now)
+                if next_sample >= deadline:
+                    break
+                if next_sample > now:
+                    self._sleep(next_sample - now)
+            duration = self._clock() - started
+            with self._lock:
+                self._stats["profiles"] += 1
+                self._stats["samples"] += samples
+            return Profile(dict(stacks), samples, duration, interval)
+        finally:
+            self._running.release()
+
+    def stats(self) -> Dict[str, int]:
+        """Return profile, busy rejection and sample counters."""
+        with self._lock:
+            return {**self._stats, "active": self.active}
@@ -0,0 +1,259 @@
+"""Token-bucket rate limiting for the API.
+
+Each client (verified API key, falling back to IP address) owns a bucket holding up to
+``capacity`` tokens that refills continuously at ``capacity / window`` tokens
+per second; every request takes one token. Two backends are provided:
+
+- :class:`MemoryRateLimiter` keeps buckets in-process. Limits are per worker.
+- :class:`SQLiteRateLimiter` keeps buckets in a local SQLite file, so every
+  uvicorn worker on the host shares the same limits.
+
+Both evict buckets that have been idle long enough to refill completely, which
+loses no information, so memory stays bounded by the number of active clients.
+"""
+
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+from time import time
+from typing import Callable, NamedTuple, Optional, Union
+
+from dotenv import load_dotenv
+from loguru import logger
+
+load_dotenv()
+
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "sqlite")
+RATE_LIMIT_DB_PATH = os.getenv(
+    "RATE_LIMIT_DB_PATH", os.path.join(tempfile.gettempdir(), "orca_rate_limit.db")
+)
+# Hard cap on in-memory buckets, reached only if clients are never idle
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+
+class RateLimitDecision(NamedTuple):
+    """Outcome of a rate limit check."""
+
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after: float  # Seconds until a token is available (0 if allowed)
+    reset_after: float  # Seconds until the bucket is full again
+
+    def headers(self) -> dict:
+        """Quota headers to return to the client."""
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": str(int(self.reset_after + 0.999)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(int(self.retry_after + 0.999))
+        return headers
+
+
+def client_key(api_key: Optional[str], client_ip: Optional[str]) -> str:
+    """
+    Build the bucket key for a request.
+
+    Only pass ``api_key`` once it has been verified; unverified keys are free
+    to make up, so keying on them would hand out a fresh bucket per request.
+    API keys are hashed so raw keys are never written to the shared store.
+    """
+    if api_key:
+        return "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:32]
+    return f"ip:{client_ip or 'unknown'}"
+
+
+class _TokenBucketLimiter:
+    """Shared token-bucket arithmetic for the limiter backends."""
+
+    def __init__(
+        self, capacity: int, window: float, clock: Callable[[], float] = time
+    ):
+        self.capacity = capacity
+        self.window = window
+        self.refill_rate = capacity / window
+        # A bucket idle this long is full again, so forgetting it is lossless
+        self.idle_ttl = window
+        self._clock = clock
+
+    def _refill(self, tokens: float, updated_at: float, now: float) -> float:
+        return min(self.capacity, tokens + (now - updated_at) * self.refill_rate)
+
+    def _decide(self, tokens: float, cost: float) -> tuple[float, RateLimitDecision]:
+        """Take ``cost`` tokens if possible; return the new token count and decision."""
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+            retry_after = 0.0
+        else:
+            retry_after = (cost - tokens) / self.refill_rate
+        decision = RateLimitDecision(
+            allowed=allowed,
+            limit=self.capacity,
+            remaining=int(tokens),
+            retry_after=retry_after,
+            reset_after=(self.capacity - tokens) / self.refill_rate,
+        )
+        return tokens, decision
+
+
+class MemoryRateLimiter(_TokenBucketLimiter):
+    """
+    In-process token-bucket limiter with idle eviction.
+
+    Args:
+        capacity: Maximum burst size (tokens per window)
+        window: Seconds for an empty bucket to refill completely
+        max_keys: Hard cap on tracked buckets; least recently used are dropped
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        window: float,
+        max_keys: int = RATE_LIMIT_MAX_KEYS,
+        clock: Callable[[], float] = time,
+    ):
+        super().__init__(capacity, window, clock)
+        self.max_keys = max_keys
+        # key -> (tokens, updated_at), ordered by last update
+        self._buckets: "OrderedDict[str, tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str, cost: float = 1.0) -> RateLimitDecision:
+        now = self._clock()
+        with self._lock:
+            self._evict(now)
+            bucket = self._buckets.pop(key, None)
+            tokens = (
+                self.capacity if bucket is None else self._refill(*bucket, now)
+            )
+            tokens, decision = self._decide(tokens, cost)
+            self._buckets[key] = (tokens, now)
+        return decision
+
+    def _evict(self, now: float) -> None:
+        """Drop idle buckets and enforce the key cap. Caller holds the lock."""
+        while self._buckets:
+            oldest_key, (_, updated_at) = next(iter(self._buckets.items()))
+            if now - updated_at < self.idle_ttl and len(self._buckets) < self.max_keys:
+                break
+            del self._buckets[oldest_key]
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class SQLiteRateLimiter(_TokenBucketLimiter):
+    """
+    Token-bucket limiter stored in SQLite and shared by all local processes.
+
+    Each check runs in an ``IMMEDIATE`` transaction, so concurrent workers
+    serialize on the bucket update and never over-admit.
+
+    Args:
+        capacity: Maximum burst size (tokens per window)
+        window: Seconds for an empty bucket to refill completely
+        db_path: Path of the SQLite database file
+        cleanup_every: Number of checks between idle-bucket sweeps
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        window: float,
+        db_path: str = RATE_LIMIT_DB_PATH,
+        cleanup_every: int = 1000,
+        clock: Callable[[], float] = time,
+    ):
+        super().__init__(capacity, window, clock)
+        self.db_path = db_path
+        self.cleanup_every = cleanup_every
+        self._local = threading.local()
+        self._calls = 0
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit_buckets ("
+            "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS rate_limit_buckets_updated_at "
+            "ON rate_limit_buckets (updated_at)"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.db_path, timeout=5.0, isolation_level=None
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def acquire(self, key: str, cost: float = 1.0) -> RateLimitDecision:
+        now = self._clock()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT tokens, updated_at FROM rate_limit_buckets WHERE key = ?",
+                (key,),
+            ).fetchone()
+            tokens = self.capacity if row is None else self._refill(*row, now)
+            tokens, decision = self._decide(tokens, cost)
+            conn.execute(
+                "INSERT INTO rate_limit_buckets (key, tokens, updated_at) "
+                "VALUES (?, ?, ?) ON CONFLICT(key) DO UPDATE SET "
+                "tokens = excluded.tokens, updated_at = excluded.updated_at",
+                (key, tokens, now),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        self._calls += 1
+        if self._calls % self.cleanup_every == 0:
+            self.evict_idle(now)
+        return decision
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        """Delete buckets that have been idle long enough to be full again."""
+        now = self._clock() if now is None else now
+        cursor = self._connection().execute(
+            "DELETE FROM rate_limit_buckets WHERE updated_at < ?",
+            (now - self.idle_ttl,),
+        )
+        return cursor.rowcount
+
+
+RateLimiter = Union[MemoryRateLimiter, SQLiteRateLimiter]
+
+
+def create_rate_limiter(
+    capacity: int, window: float, backend: str = RATE_LIMIT_BACKEND
+) -> RateLimiter:
+    """
+    Create the configured rate limiter, falling back to memory if SQLite fails.
+
+    Args:
+        capacity: Maximum burst size (tokens per window)
+        window: Seconds for an empty bucket to refill completely
+        backend: ``"sqlite"`` (shared across workers) or ``"memory"``
+    """
+    if backend == "sqlite":
+        try:
+            return SQLiteRateLimiter(capacity, window)
+        except sqlite3.Error as e:
+            logger.error(
+                f"Failed to open rate limit database, using in-memory limits: {str(e)}"
+            )
+    return MemoryRateLimiter(capacity, window)
@@ -0,0 +1,604 @@
+"""Deadlines, circuit breakers and hedging for LLM provider calls.
+
+A slow or failing provider used to hold agent threads for as long as it
+liked, and every swarm using it slowed down with it. :class:`LLMGuard` wraps
+each agent LLM call:
+
+- every call has a deadline. The caller stops waiting when it passes, and the
+  same deadline is passed to litellm as the request timeout so the abandoned
+  attempt cannot hold its thread for longer;
+- each provider has a :class:`CircuitBreaker`. After ``failure_threshold``
+  consecutive provider failures it opens and calls fail fast, or go straight
+  to the model's fallback, until a probe call succeeds after
+  ``reset_timeout`` seconds;
+- when hedging is on and the model has a fallback (another model, endpoint or
+  both), a call still running after the model's p95 latency gets a duplicate
+  sent to the fallback and whichever answers first wins. Hedges are capped at
+  ``hedge_max_fraction`` of calls so a slow provider cannot double the load.
+
+Errors caused by the request itself (bad request, authentication, unknown
+model) do not count against a provider.
+
+A hedge that loses, or an attempt abandoned at the deadline, keeps running
+after the call returns. :class:`GuardedLLM` gives every call its own usage
+sink: tokens of attempts that finish while the call is open are added to
+the agent, and tokens that arrive later are counted as ``orphaned_tokens``
+instead of landing on whoever uses the agent next.
+
+With a :class:`~src.api.governor.LLMGovernor`, a call to a model whose rate
+limit backlog is longer than the governor's ``max_wait`` is rejected before
+any attempt is made, with :class:`~src.api.governor.LLMBudgetExceededError`.
+
+For agents that accept several models, a :class:`~src.api.routing.ModelRouter`
+fed by every attempt routes each call to the model expected to answer first,
+skipping models whose provider breaker is open.
+"""
+
+import json
+import os
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from time import monotonic
+from typing import Any, Callable, Deque, Dict, List, NamedTuple, Optional
+
+import litellm
+from dotenv import load_dotenv
+from loguru import logger
+
+from src.api.executors import ExecutorSaturatedError, NamedExecutor
+from src.api.governor import LLMBudgetExceededError, LLMGovernor
+from src.api.routing import ModelRouter
+
+load_dotenv()
+
+# Seconds an LLM call may take, hedges included
+LLM_CALL_DEADLINE = float(os.getenv("LLM_CALL_DEADLINE", "120"))
+# Consecutive provider failures that open a breaker
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+# Seconds an open breaker waits before letting a probe call through
+LLM_BREAKER_RESET_TIMEOUT = float(os.getenv("LLM_BREAKER_RESET_TIMEOUT", "30"))
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+# JSON object of model to fallback: a model name or {"model", "base_url"}
+LLM_HEDGE_FALLBACKS = os.getenv("LLM_HEDGE_FALLBACKS", "{}")
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+# Latency samples needed before the quantile is trusted
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+# Hedge delay used until a model has enough samples
+LLM_HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "10"))
+# Largest fraction of calls that may be hedged
+LLM_HEDGE_MAX_FRACTION = float(os.getenv("LLM_HEDGE_MAX_FRACTION", "0.1"))
+# Latency samples kept per model
+LLM_LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", "200"))
+
+# Errors caused by the request rather than the provider
+CLIENT_ERRORS = (
+    litellm.BadRequestError,
+    litellm.AuthenticationError,
+    litellm.NotFoundError,
+    litellm.UnprocessableEntityError,
+)
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when a provider's breaker is open and there is no fallback."""
+
+
+class LLMDeadlineExceededError(TimeoutError):
+    """Raised when no attempt of an LLM call answered before its deadline."""
+
+
+class Fallback(NamedTuple):
+    """Where a hedge or failover of a model's calls goes."""
+
+    model: Optional[str] = None
+    base_url: Optional[str] = None
+
+    def overrides(self) -> Dict[str, str]:
+        """Completion parameters that send a call to this fallback."""
+        return {
+            key: value
+            for key, value in (("model", self.model), ("base_url", self.base_url))
+            if value is not None
+        }
+
+
+def parse_fallbacks(raw: str) -> Dict[str, Fallback]:
+    """Parse ``LLM_HEDGE_FALLBACKS``; invalid configuration is logged and ignored."""
+    try:
+        return {
+            model: Fallback(model=target)
+            if isinstance(target, str)
+            else Fallback(**target)
+            for model, target in json.loads(raw).items()
+        }
+    except Exception as e:
+        logger.error(f"Invalid LLM_HEDGE_FALLBACKS, hedging disabled: {str(e)}")
+        return {}
+
+
+def provider_of(model: str) -> str:
+    """Return the litellm provider serving ``model``."""
+    try:
+        return litellm.get_llm_provider(model)[1]
+    except Exception:
+        return model.split("/", 1)[0] if "/" in model else "unknown"
+
+
+def is_provider_failure(error: BaseException) -> bool:
+    """Whether ``error`` says something about the provider's health."""
+    return not isinstance(error, CLIENT_ERRORS)
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker with a single half-open probe.
+
+    Args:
+        failure_threshold: Consecutive failures that open the breaker
+        reset_timeout: Seconds before an open breaker lets a probe through
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int = LLM_BREAKER_FAILURE_THRESHOLD,
+        reset_timeout: float = LLM_BREAKER_RESET_TIMEOUT,
+        clock: Callable[[], float] = monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self._stats = {"opened": 0, "rejected": 0, "failures": 0, "successes": 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def available(self) -> bool:
+        """Whether :meth:`allow` could let a call through, without side effects."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                return self._clock() - self._opened_at >= self.reset_timeout
+            return not self._probing
+
+    def allow(self) -> bool:
+        """Whether a call may go to the provider now."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if (
+                self._state == self.OPEN
+                and self._clock() - self._opened_at >= self.reset_timeout
+            ):
+                self._state = self.HALF_OPEN
+            if self._state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self._stats["rejected"] += 1
+            return False
+
+    def cancel_probe(self) -> None:
+        """Give back a probe :meth:`allow` granted to a call that never ran."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._stats["successes"] += 1
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._stats["failures"] += 1
+            self._failures += 1
+            self._probing = False
+            if self._state == self.HALF_OPEN or (
+                self._state == self.CLOSED
+                and self._failures >= self.failure_threshold
+            ):
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+                self._stats["opened"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                "state": self._state,
+                "consecutive_failures": self._failures,
+            }
+
+
+class LatencyTracker:
+    """Sliding window of recent call latencies."""
+
+    def __init__(self, window: int = LLM_LATENCY_WINDOW):
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._samples)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Return the ``q`` quantile of the window, or None when it is empty."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class LLMGuard:
+    """
+    Runs LLM calls under deadlines, per-provider breakers and optional hedging.
+
+    Args:
+        executor: Executor attempts run on; None runs the primary attempt in
+            the calling thread, without a deadline or hedging
+        deadline: Default seconds per call
+        failure_threshold: Consecutive failures that open a provider breaker
+        reset_timeout: Seconds before an open breaker lets a probe through
+        hedge: Whether slow calls are hedged
+        fallbacks: Fallback of each model, used for hedges and failover
+        hedge_quantile: Latency quantile after which a call is hedged
+        hedge_min_samples: Samples needed before the quantile is used
+        hedge_default_delay: Hedge delay used until then
+        hedge_max_fraction: Largest fraction of calls that may be hedged
+        router: Chooses between the models of agents that accept several
+        governor: Rejects calls to models over their rate limits
+    """
+
+    def __init__(
+        self,
+        executor: Optional[NamedExecutor] = None,
+        deadline: float = LLM_CALL_DEADLINE,
+        failure_threshold: int = LLM_BREAKER_FAILURE_THRESHOLD,
+        reset_timeout: float = LLM_BREAKER_RESET_TIMEOUT,
+        hedge: bool = LLM_HEDGE_ENABLED,
+        fallbacks: Optional[Dict[str, Fallback]] = None,
+        hedge_quantile: float = LLM_HEDGE_QUANTILE,
+        hedge_min_samples: int = LLM_HEDGE_MIN_SAMPLES,
+        hedge_default_delay: float = LLM_HEDGE_DEFAULT_DELAY,
+        hedge_max_fraction: float = LLM_HEDGE_MAX_FRACTION,
+        router: Optional[ModelRouter] = None,
+        governor: Optional[LLMGovernor] = None,
+        clock: Callable[[], float] = monotonic,
+    ):
+        self.executor = executor
+        self.deadline = deadline
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.hedge = hedge
+        self.fallbacks = (
+            parse_fallbacks(LLM_HEDGE_FALLBACKS) if fallbacks is None else fallbacks
+        )
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_default_delay = hedge_default_delay
+        self.hedge_max_fraction = hedge_max_fraction
+        self.router = router or ModelRouter()
+        self.governor = governor
+        self._clock = clock
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._latencies: Dict[str, LatencyTracker] = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "calls": 0,
+            "hedged": 0,
+            "hedge_wins": 0,
+            "failovers": 0,
+            "deadline_exceeded": 0,
+            "short_circuited": 0,
+            "over_budget": 0,
+            "orphaned_tokens": 0,
+        }
+
+    def breaker(self, provider: str) -> CircuitBreaker:
+        """Return the breaker of ``provider``, creating it on first use."""
+        with self._lock:
+            breaker = self._breakers.get(provider)
+            if breaker is None:
+                breaker = self._breakers[provider] = CircuitBreaker(
+                    self.failure_threshold, self.reset_timeout, self._clock
+                )
+            return breaker
+
+    def latency(self, model: str) -> LatencyTracker:
+        """Return the latency window of ``model``, creating it on first use."""
+        with self._lock:
+            tracker = self._latencies.get(model)
+            if tracker is None:
+                tracker = self._latencies[model] = LatencyTracker()
+            return tracker
+
+    def hedge_delay(self, model: str) -> float:
+        """Seconds after which a call to ``model`` is hedged."""
+        tracker = self.latency(model)
+        if len(tracker) < self.hedge_min_samples:
+            return self.hedge_default_delay
+        return tracker.quantile(self.hedge_quantile)
+
+    def route(self, models: List[str]) -> str:
+        """Pick the model for a call among ``models``, skipping open providers."""
+        available = [
+            model for model in models if self.breaker(provider_of(model)).available()
+        ]
+        return self.router.choose(available or models)
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def record_orphaned_usage(self, tokens: int) -> None:
+        """Count tokens used by attempts that finished after their call."""
+        with self._lock:
+            self._stats["orphaned_tokens"] += tokens
+
+    def _may_hedge(self) -> bool:
+        """Whether another hedge fits in the budget. Counts it if so."""
+        with self._lock:
+            if self._stats["hedged"] + 1 > self.hedge_max_fraction * self._stats["calls"]:
+                return False
+            self._stats["hedged"] += 1
+            return True
+
+    def _attempt(
+        self, fn: Callable[[Dict[str, Any]], Any], model: str, overrides: Dict[str, Any]
+    ) -> Any:
+        """Run one attempt, recording its latency and outcome."""
+        breaker = self.breaker(provider_of(model))
+        self.router.begin(model)
+        started = self._clock()
+        try:
+            result = fn(overrides)
+        except BaseException as e:
+            failed = is_provider_failure(e)
+            self.router.end(model, None, failed)
+            if failed:
+                breaker.record_failure()
+            else:
+                # The provider answered; only the request was wrong
+                breaker.record_success()
+            raise
+        elapsed = self._clock() - started
+        self.router.end(model, elapsed, False)
+        breaker.record_success()
+        self.latency(model).record(elapsed)
+        return result
+
+    def _submit(
+        self, fn: Callable[[Dict[str, Any]], Any], model: str, overrides: Dict[str, Any]
+    ) -> Optional[Future]:
+        try:
+            return self.executor.submit(self._attempt, fn, model, overrides)
+        except ExecutorSaturatedError:
+            return None
+
+    def call(
+        self,
+        model: str,
+        fn: Callable[[Dict[str, Any]], Any],
+        deadline: Optional[float] = None,
+    ) -> Any:
+        """
+        Run an LLM call to ``model``.
+
+        Args:
+            model: Model of the primary attempt
+            fn: Runs one attempt given completion parameter overrides
+                (``timeout`` and, for a fallback, ``model``/``base_url``)
+            deadline: Seconds for the call; the guard's default if None
+
+        Raises:
+            CircuitOpenError: If the provider is open and there is no fallback
+            LLMBudgetExceededError: If the model is over its rate limits for
+                longer than the governor's max_wait
+            LLMDeadlineExceededError: If no attempt answered in time
+        """
+        self._count("calls")
+        limit = self.deadline if deadline is None else deadline
+        fallback = self.fallbacks.get(model)
+        fallback_model = (fallback.model or model) if fallback else None
+
+        primary_model, primary = model, {"timeout": limit}
+        if not self.breaker(provider_of(model)).allow():
+            if fallback is None or not self.breaker(provider_of(fallback_model)).allow():
+                self._count("short_circuited")
+                raise CircuitOpenError(
+                    f"{provider_of(model)} is failing, calls to {model} are paused"
+                )
+            # Fail over instead of waiting on a provider that is down
+            self._count("failovers")
+            primary_model = fallback_model
+            primary = {**fallback.overrides(), "timeout": limit}
+            fallback = None
+
+        if self.governor is not None:
+            try:
+                self.governor.check(primary_model)
+            except LLMBudgetExceededError:
+                self._count("over_budget")
+                raise
+
+        if self.executor is None:
+            return self._attempt(fn, primary_model, primary)
+        started = self._clock()
+        first = self._submit(fn, primary_model, primary)
+        if first is None:
+            # Saturated: run in the caller's thread, bounded by litellm's timeout
+            return self._attempt(fn, primary_model, primary)
+
+        attempts: List[Future] = [first]
+        hedge_at = self.hedge_delay(model) if self.hedge and fallback else None
+        while True:
+            remaining = limit - (self._clock() - started)
+            if hedge_at is not None and len(attempts) == 1:
+                timeout = min(remaining, max(0.0, hedge_at - (self._clock() - started)))
+            else:
+                timeout = remaining
+            # Failed attempts would end the wait at once; a hedge that has
+            # already answered must end it
+            wait(
+                [a for a in attempts if not a.done() or a.exception() is None]
+                or attempts,
+                timeout=max(0.0, timeout),
+                return_when=FIRST_COMPLETED,
+            )
+            for attempt in attempts:
+                if attempt.done() and attempt.exception() is None:
+                    if attempt is not first:
+                        self._count("hedge_wins")
+                    return attempt.result()
+            if all(a.done() for a in attempts):
+                # Every attempt failed; report the primary's error
+                return first.result()
+            if self._clock() - started >= limit:
+                self._count("deadline_exceeded")
+                raise LLMDeadlineExceededError(
+                    f"{model} did not answer within {limit:.0f}s"
+                )
+            if (
+                hedge_at is not None
+                and len(attempts) == 1
+                and self._clock() - started >= hedge_at
+            ):
+                # allow() may take the fallback's half-open probe, so ask it
+                # last and hand the probe back if the hedge is not sent
+                breaker = self.breaker(provider_of(fallback_model))
+                if self._may_hedge() and breaker.allow():
+                    hedge = self._submit(
+                        fn,
+                        fallback_model,
+                        {**fallback.overrides(), "timeout": remaining},
+                    )
+                    if hedge is None:
+                        breaker.cancel_probe()
+                    else:
+                        logger.info(
+                            "Hedging {} call to {} after {:.1f}s",
+                            model,
+                            fallback_model,
+                            hedge_at,
+                        )
+                        attempts.append(hedge)
+                hedge_at = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Return call, hedge and failover counters, breakers and p95 latencies."""
+        with self._lock:
+            stats = dict(self._stats)
+            breakers = dict(self._breakers)
+            latencies = dict(self._latencies)
+        return {
+            **stats,
+            "breakers": {name: b.stats() for name, b in breakers.items()},
+            "p95_seconds": {
+                model: tracker.quantile(0.95) for model, tracker in latencies.items()
+            },
+        }
+
+
+# Usage sink of the guarded call the current thread runs an attempt for
+_attempt_local = threading.local()
+
+
+class _CallUsage:
+    """Forwards one call's usage to the agent until the call returns."""
+
+    def __init__(self, hook: Callable[[dict], None], guard: LLMGuard):
+        self.hook = hook
+        self.guard = guard
+        self.open = True
+        self._lock = threading.Lock()
+
+    def add(self, call_usage: dict) -> None:
+        with self._lock:
+            if self.open:
+                self.hook(call_usage)
+                return
+        tokens = call_usage.get("total_tokens") or 0
+        logger.info(f"Dropping usage of an abandoned LLM attempt ({tokens} tokens)")
+        self.guard.record_orphaned_usage(tokens)
+
+    def close(self) -> None:
+        with self._lock:
+            self.open = False
+
+
+class GuardedLLM:
+    """
+    Wraps an agent's LiteLLM so its ``run`` calls go through an :class:`LLMGuard`.
+
+    Everything else, including streaming, is passed through to the wrapped
+    LLM unchanged. The LLM's ``usage_hook`` is routed through the call each
+    attempt belongs to, so attempts still running after their call returned
+    do not add to the agent's usage.
+
+    Args:
+        llm: The agent's LiteLLM
+        guard: Guard the calls go through
+        models: Acceptable models; when set, each call is routed among them
+    """
+
+    def __init__(self, llm: Any, guard: LLMGuard, models: Optional[List[str]] = None):
+        object.__setattr__(self, "_llm", llm)
+        object.__setattr__(self, "_guard", guard)
+        object.__setattr__(self, "_models", models)
+        object.__setattr__(self, "_hook", None)
+        self.usage_hook = getattr(llm, "usage_hook", None)
+
+    def _route_usage(self, call_usage: dict) -> None:
+        sink = getattr(_attempt_local, "sink", None)
+        if sink is not None:
+            sink.add(call_usage)
+        elif self._hook is not None:
+            # Not a guarded attempt, e.g. a streaming call
+            self._hook(call_usage)
+
+    def run(self, *args, **kwargs) -> Any:
+        if self._models:
+            kwargs["model"] = self._guard.route(self._models)
+        model = kwargs.get("model") or self._llm.model_name
+        sink = _CallUsage(self._hook, self._guard) if self._hook else None
+
+        def attempt(overrides: Dict[str, Any]) -> Any:
+            _attempt_local.sink = sink
+            try:
+                return self._llm.run(*args, **{**kwargs, **overrides})
+            finally:
+                _attempt_local.sink = None
+
+        try:
+            return self._guard.call(model, attempt)
+        finally:
+            if sink is not None:
+                sink.close()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._llm, name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        if name == "usage_hook":
+            object.__setattr__(self, "_hook", value)
+            self._llm.usage_hook = self._route_usage if value is not None else None
+            return
+        setattr(self._llm, name, value)
@@ -0,0 +1,146 @@
+"""Latency-aware choice between interchangeable models.
+
+An agent may list several acceptable models. :class:`ModelRouter` picks one
+for each LLM call from what this process has measured:
+
+- an exponentially weighted moving average (EWMA) of each model's latency;
+- an EWMA of its provider failure rate;
+- its queue depth: calls routed to it that are still running, plus calls
+  held back by the LLM governor.
+
+A model's score is its expected time to answer, ``latency * (1 + depth)``,
+inflated by its failure rate since failed calls have to be redone. The model
+with the lowest score wins. Models without measurements are scored with the
+best known latency, so new models get tried. A small share of calls goes to a
+random candidate so that the estimates of unused models stay fresh.
+"""
+
+import os
+import random
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Weight of the newest sample in the latency and error EWMAs
+ROUTING_EWMA_ALPHA = float(os.getenv("ROUTING_EWMA_ALPHA", "0.2"))
+# Share of calls routed to a random candidate
+ROUTING_EXPLORE_RATE = float(os.getenv("ROUTING_EXPLORE_RATE", "0.05"))
+# Latency assumed when no model has been measured yet
+ROUTING_DEFAULT_LATENCY = float(os.getenv("ROUTING_DEFAULT_LATENCY", "5"))
+# Highest failure rate used in scores, so a failing model still gets probed
+ROUTING_MAX_ERROR_RATE = 0.95
+
+
+class _ModelState:
+    def __init__(self):
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.in_flight = 0
+        self.calls = 0
+        self.errors = 0
+
+
+class ModelRouter:
+    """
+    Routes each call to the candidate model expected to answer first.
+
+    Args:
+        alpha: Weight of the newest sample in the EWMAs
+        explore_rate: Share of calls sent to a random candidate
+        load: Returns extra queued calls for a model, e.g. governor waits
+    """
+
+    def __init__(
+        self,
+        alpha: float = ROUTING_EWMA_ALPHA,
+        explore_rate: float = ROUTING_EXPLORE_RATE,
+        load: Optional[Callable[[str], int]] = None,
+        rng: Optional[random.Random] = None,
+    ):
+        self.alpha = alpha
+        self.explore_rate = explore_rate
+        self.load = load
+        self._rng = rng or random.Random()
+        self._models: Dict[str, _ModelState] = {}
+        self._lock = threading.Lock()
+        self._stats = {"routed": 0, "explored": 0}
+
+    def _state(self, model: str) -> _ModelState:
+        """Return the state of ``model``. Caller holds the lock."""
+        state = self._models.get(model)
+        if state is None:
+            state = self._models[model] = _ModelState()
+        return state
+
+    def begin(self, model: str) -> None:
+        """Count a call to ``model`` as in flight."""
+        with self._lock:
+            self._state(model).in_flight += 1
+
+    def end(self, model: str, latency: Optional[float], failed: bool) -> None:
+        """
+        Record the outcome of a call started with :meth:`begin`.
+
+        Args:
+            model: Model the call went to
+            latency: Seconds the call took, or None when it says nothing about
+                the model's speed (e.g. the request was rejected)
+            failed: Whether the provider failed the call
+        """
+        with self._lock:
+            state = self._state(model)
+            state.in_flight -= 1
+            state.calls += 1
+            state.errors += failed
+            state.error_rate += self.alpha * (failed - state.error_rate)
+            if latency is not None and not failed:
+                state.latency = (
+                    latency
+                    if state.latency is None
+                    else state.latency + self.alpha * (latency - state.latency)
+                )
+
+    def score(self, model: str) -> float:
+        """Expected seconds until ``model`` answers a new call."""
+        depth = self.load(model) if self.load is not None else 0
+        with self._lock:
+            state = self._models.get(model) or _ModelState()
+            known = [s.latency for s in self._models.values() if s.latency is not None]
+            latency = state.latency
+            if latency is None:
+                latency = min(known) if known else ROUTING_DEFAULT_LATENCY
+            depth += state.in_flight
+            error_rate = min(state.error_rate, ROUTING_MAX_ERROR_RATE)
+        return latency * (1 + depth) / (1 - error_rate)
+
+    def choose(self, models: Iterable[str]) -> str:
+        """Return the candidate to route the next call to."""
+        candidates: List[str] = list(dict.fromkeys(models))
+        if not candidates:
+            raise ValueError("No candidate models to route to")
+        with self._lock:
+            self._stats["routed"] += 1
+            explore = len(candidates) > 1 and self._rng.random() < self.explore_rate
+            if explore:
+                self._stats["explored"] += 1
+                return self._rng.choice(candidates)
+        # min keeps the listed order among equal scores
+        return min(candidates, key=self.score)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return routing counters and each model's live measurements."""
+        with self._lock:
+            models = {
+                model: {
+                    "latency_ewma": state.latency,
+                    "error_rate": state.error_rate,
+                    "in_flight": state.in_flight,
+                    "calls": state.calls,
+                    "errors": state.errors,
+                }
+                for model, state in self._models.items()
+            }
+            return {**self._stats, "models": models}
@@ -0,0 +1,473 @@
+"""Durable scheduling of swarm runs.
+
+Swarms submitted with a ``schedule`` are stored in a :class:`ScheduleStore`
+(SQLite, shared by all workers on a host) and executed by a
+:class:`SwarmScheduler`:
+
+- upcoming jobs are kept in a timer heap, so the scheduler thread sleeps until
+  the next job is due instead of polling every job;
+- due jobs are claimed atomically in the store, so a job runs once even when
+  several workers schedule from the same database, and are dispatched into
+  the execution pool while fewer than ``max_concurrent`` scheduled jobs run;
+- the heap is rebuilt from the store on start and on every sync, so jobs that
+  became due while the server was down are caught up (unless they are older
+  than ``misfire_grace``) and jobs added by other workers are picked up;
+- running jobs are heartbeated; a job whose heartbeat stopped (its worker
+  died mid-run) is marked failed rather than run twice, since runs are billed;
+- a job cancelled or refused by the execution pool before it started is
+  marked cancelled or failed and frees its slot.
+
+Jobs are owned by the user id of the API key that scheduled them; API keys
+themselves are never stored.
+"""
+
+import heapq
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from time import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from dotenv import load_dotenv
+from loguru import logger
+
+load_dotenv()
+
+SCHEDULER_DB_PATH = os.getenv(
+    "SCHEDULER_DB_PATH", os.path.join(tempfile.gettempdir(), "orca_scheduler.db")
+)
+# Scheduled jobs that may run at once in this process
+SCHEDULER_MAX_CONCURRENT = int(os.getenv("SCHEDULER_MAX_CONCURRENT", "8"))
+# Seconds between syncs with the store (new jobs, heartbeats, orphans)
+SCHEDULER_SYNC_INTERVAL = float(os.getenv("SCHEDULER_SYNC_INTERVAL", "30"))
+# Jobs overdue by more than this many seconds are marked missed, not run
+SCHEDULER_MISFIRE_GRACE = float(os.getenv("SCHEDULER_MISFIRE_GRACE", "86400"))
+# Running jobs without a heartbeat for this many seconds are marked failed
+SCHEDULER_LEASE_TIMEOUT = float(os.getenv("SCHEDULER_LEASE_TIMEOUT", "180"))
+# Seconds before retrying a job the execution pool could not accept
+SCHEDULER_RETRY_DELAY = float(os.getenv("SCHEDULER_RETRY_DELAY", "15"))
+
+SCHEDULED = "scheduled"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+MISSED = "missed"
+
+
+class ScheduledSwarm(NamedTuple):
+    """A stored swarm run and its state; times are UNIX timestamps."""
+
+    job_id: str
+    owner: str  # User id
+    run_at: float
+    spec: Dict[str, Any]
+    status: str
+    created_at: float
+    updated_at: float
+    error: Optional[str]
+
+
+class ScheduleStore:
+    """
+    SQLite store of scheduled swarm runs.
+
+    Args:
+        db_path: Path of the SQLite database file
+    """
+
+    _COLUMNS = "job_id, owner, run_at, spec, status, created_at, updated_at, error"
+
+    def __init__(self, db_path: str = SCHEDULER_DB_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS scheduled_swarms ("
+            "job_id TEXT PRIMARY KEY, owner TEXT NOT NULL, run_at REAL NOT NULL, "
+            "spec TEXT NOT NULL, status TEXT NOT NULL, created_at REAL NOT NULL, "
+            "updated_at REAL NOT NULL, heartbeat_at REAL, error TEXT)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS scheduled_swarms_status_run_at "
+            "ON scheduled_swarms (status, run_at)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS scheduled_swarms_owner "
+            "ON scheduled_swarms (owner, run_at)"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row_to_job(row) -> ScheduledSwarm:
+        job_id, owner, run_at, spec, status, created_at, updated_at, error = row
+        return ScheduledSwarm(
+            job_id,
+            owner,
+            run_at,
+            json.loads(spec),
+            status,
+            created_at,
+            updated_at,
+            error,
+        )
+
+    def add(self, job_id: str, owner: str, run_at: float, spec: Dict, now: float):
+        """Store a new scheduled job."""
+        self._connection().execute(
+            "INSERT INTO scheduled_swarms (job_id, owner, run_at, spec, status, "
+            "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job_id, owner, run_at, json.dumps(spec), SCHEDULED, now, now),
+        )
+
+    def get(self, job_id: str, owner: Optional[str] = None) -> Optional[ScheduledSwarm]:
+        """Return a job, or None if unknown or owned by someone else."""
+        row = self._connection().execute(
+            f"SELECT {self._COLUMNS} FROM scheduled_swarms WHERE job_id = ?",
+            (job_id,),
+        ).fetchone()
+        if row is None or (owner is not None and row[1] != owner):
+            return None
+        return self._row_to_job(row)
+
+    def list(self, owner: str, limit: int = 100) -> List[ScheduledSwarm]:
+        """Return an owner's jobs, soonest first."""
+        rows = self._connection().execute(
+            f"SELECT {self._COLUMNS} FROM scheduled_swarms WHERE owner = ? "
+            "ORDER BY run_at LIMIT ?",
+            (owner, limit),
+        ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def pending(self) -> List[tuple[float, str]]:
+        """Return ``(run_at, job_id)`` for every job waiting to run."""
+        return self._connection().execute(
+            "SELECT run_at, job_id FROM scheduled_swarms WHERE status = ?",
+            (SCHEDULED,),
+        ).fetchall()
+
+    def _transition(
+        self,
+        job_id: str,
+        from_status: str,
+        to_status: str,
+        now: float,
+        error: Optional[str] = None,
+        owner: Optional[str] = None,
+    ) -> bool:
+        """Move a job between states; False if it was not in ``from_status``."""
+        query = (
+            "UPDATE scheduled_swarms SET status = ?, updated_at = ?, "
+            "heartbeat_at = ?, error = ? WHERE job_id = ? AND status = ?"
+        )
+        params: list = [to_status, now, now, error, job_id, from_status]
+        if owner is not None:
+            query += " AND owner = ?"
+            params.append(owner)
+        return self._connection().execute(query, params).rowcount == 1
+
+    def claim(self, job_id: str, now: float) -> bool:
+        """Mark a scheduled job running; False if another worker got it first."""
+        return self._transition(job_id, SCHEDULED, RUNNING, now)
+
+    def unclaim(self, job_id: str, now: float) -> bool:
+        """Return a claimed job to the schedule."""
+        return self._transition(job_id, RUNNING, SCHEDULED, now)
+
+    def finish(self, job_id: str, status: str, now: float, error: Optional[str] = None):
+        """Record the outcome of a running job."""
+        self._transition(job_id, RUNNING, status, now, error)
+
+    def miss(self, job_id: str, now: float) -> bool:
+        """Mark a job that is too overdue to run as missed."""
+        return self._transition(
+            job_id, RUNNING, MISSED, now, "Scheduled time passed before the job ran"
+        )
+
+    def cancel(self, job_id: str, owner: str, now: float) -> bool:
+        """Cancel a job that has not started; False if it is not waiting."""
+        return self._transition(job_id, SCHEDULED, CANCELLED, now, owner=owner)
+
+    def heartbeat(self, job_ids: List[str], now: float) -> None:
+        """Refresh the lease of running jobs."""
+        if job_ids:
+            self._connection().executemany(
+                "UPDATE scheduled_swarms SET heartbeat_at = ? "
+                "WHERE job_id = ? AND status = ?",
+                [(now, job_id, RUNNING) for job_id in job_ids],
+            )
+
+    def fail_orphans(self, stale_before: float, now: float) -> int:
+        """Fail running jobs whose worker stopped heartbeating; return how many."""
+        return self._connection().execute(
+            "UPDATE scheduled_swarms SET status = ?, updated_at = ?, error = ? "
+            "WHERE status = ? AND heartbeat_at < ?",
+            (FAILED, now, "Interrupted before completion", RUNNING, stale_before),
+        ).rowcount
+
+
+class SwarmScheduler:
+    """
+    Runs stored swarm schedules from a timer heap on a background thread.
+
+    Args:
+        store: Durable store of scheduled jobs
+        run: Executes a job: ``run(spec, owner, job_id)``
+        dispatch: Starts a job in the execution pool:
+            ``dispatch(job_id, owner, spec, fn, on_abandon)`` must arrange for
+            ``fn()`` to be called, or raise if the pool cannot accept it; if
+            the job ends without running it calls ``on_abandon(error)`` with
+            None when it was cancelled, or the reason it could not run
+        max_concurrent: Scheduled jobs that may run at once
+        sync_interval: Seconds between syncs with the store
+        misfire_grace: Seconds a job may be overdue and still run
+        lease_timeout: Seconds without heartbeat before a running job is failed
+        retry_delay: Seconds before re-dispatching a job the pool refused
+    """
+
+    def __init__(
+        self,
+        store: ScheduleStore,
+        run: Callable[[Dict[str, Any], str, str], Any],
+        dispatch: Callable[
+            [
+                str,
+                str,
+                Dict[str, Any],
+                Callable[[], Any],
+                Callable[[Optional[str]], None],
+            ],
+            Any,
+        ],
+        max_concurrent: int = SCHEDULER_MAX_CONCURRENT,
+        sync_interval: float = SCHEDULER_SYNC_INTERVAL,
+        misfire_grace: float = SCHEDULER_MISFIRE_GRACE,
+        lease_timeout: float = SCHEDULER_LEASE_TIMEOUT,
+        retry_delay: float = SCHEDULER_RETRY_DELAY,
+        clock: Callable[[], float] = time,
+    ):
+        self.store = store
+        self.run = run
+        self.dispatch = dispatch
+        self.max_concurrent = max_concurrent
+        # Heartbeats must land well within the lease
+        self.sync_interval = min(sync_interval, lease_timeout / 3)
+        self.misfire_grace = misfire_grace
+        self.lease_timeout = lease_timeout
+        self.retry_delay = retry_delay
+        self._clock = clock
+        self._heap: List[tuple[float, str]] = []
+        self._queued: set = set()
+        self._running: set = set()
+        self._next_sync = 0.0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {
+            "dispatched": 0,
+            "completed": 0,
+            "failed": 0,
+            "missed": 0,
+            "cancelled": 0,
+        }
+
+    def schedule(
+        self, job_id: str, owner: str, run_at: float, spec: Dict[str, Any]
+    ) -> ScheduledSwarm:
+        """Store a job and wake the scheduler if it is due before the next one."""
+        now = self._clock()
+        self.store.add(job_id, owner, run_at, spec, now)
+        self._push(run_at, job_id)
+        self._wakeup.set()
+        logger.info("Scheduled swarm job {} for {}", job_id, run_at)
+        return self.store.get(job_id)
+
+    def cancel(self, job_id: str, owner: str) -> bool:
+        """Cancel a job that has not started running."""
+        if not self.store.cancel(job_id, owner, self._clock()):
+            return False
+        with self._lock:
+            # Its heap entry is skipped when popped
+            self._queued.discard(job_id)
+        logger.info("Cancelled scheduled swarm job {}", job_id)
+        return True
+
+    def get(self, job_id: str, owner: Optional[str] = None) -> Optional[ScheduledSwarm]:
+        """Return a scheduled job."""
+        return self.store.get(job_id, owner)
+
+    def list(self, owner: str, limit: int = 100) -> List[ScheduledSwarm]:
+        """Return an owner's scheduled jobs, soonest first."""
+        return self.store.list(owner, limit)
+
+    def _push(self, run_at: float, job_id: str) -> None:
+        with self._lock:
+            heapq.heappush(self._heap, (run_at, job_id))
+            self._queued.add(job_id)
+
+    def sync(self, now: Optional[float] = None) -> None:
+        """Load waiting jobs into the heap, heartbeat running jobs, fail orphans."""
+        now = self._clock() if now is None else now
+        with self._lock:
+            running = list(self._running)
+        self.store.heartbeat(running, now)
+        orphans = self.store.fail_orphans(now - self.lease_timeout, now)
+        if orphans:
+            logger.warning("Failed {} interrupted scheduled swarm jobs", orphans)
+        for run_at, job_id in self.store.pending():
+            with self._lock:
+                known = job_id in self._queued or job_id in self._running
+            if not known:
+                self._push(run_at, job_id)
+        self._next_sync = now + self.sync_interval
+
+    def run_pending(self, now: Optional[float] = None) -> int:
+        """
+        Dispatch every due job while under the concurrency cap.
+
+        Returns:
+            int: Number of jobs dispatched
+        """
+        now = self._clock() if now is None else now
+        if now >= self._next_sync:
+            self.sync(now)
+
+        dispatched = 0
+        while True:
+            with self._lock:
+                if len(self._running) >= self.max_concurrent:
+                    break
+                if not self._heap or self._heap[0][0] > now:
+                    break
+                _, job_id = heapq.heappop(self._heap)
+                if job_id not in self._queued:
+                    continue
+                self._queued.discard(job_id)
+                self._running.add(job_id)
+            if self._start(job_id, now):
+                dispatched += 1
+        return dispatched
+
+    def _start(self, job_id: str, now: float) -> bool:
+        if not self.store.claim(job_id, now):
+            # Cancelled, or claimed by another worker
+            self._release(job_id)
+            return False
+
+        job = self.store.get(job_id)
+        if now - job.run_at > self.misfire_grace:
+            self.store.miss(job_id, now)
+            self._release(job_id, "missed")
+            logger.warning("Scheduled swarm job {} missed its run time", job_id)
+            return False
+
+        try:
+            self.dispatch(
+                job_id,
+                job.owner,
+                job.spec,
+                lambda: self._execute(job),
+                lambda error: self._abandoned(job, error),
+            )
+        except Exception as e:
+            logger.warning(f"Could not dispatch scheduled job {job_id}: {str(e)}")
+            self.store.unclaim(job_id, now)
+            self._release(job_id)
+            self._push(now + self.retry_delay, job_id)
+            return False
+
+        with self._lock:
+            self._stats["dispatched"] += 1
+        return True
+
+    def _execute(self, job: ScheduledSwarm) -> Any:
+        try:
+            output = self.run(job.spec, job.owner, job.job_id)
+        except Exception as e:
+            error = getattr(e, "detail", None) or str(e)
+            self.store.finish(job.job_id, FAILED, self._clock(), str(error))
+            self._release(job.job_id, "failed")
+            raise
+        self.store.finish(job.job_id, COMPLETED, self._clock())
+        self._release(job.job_id, "completed")
+        return output
+
+    def _abandoned(self, job: ScheduledSwarm, error: Optional[str]) -> None:
+        """Finish a dispatched job that ended without running."""
+        if error is None:
+            self.store.finish(
+                job.job_id, CANCELLED, self._clock(), "Cancelled before it started"
+            )
+            self._release(job.job_id, "cancelled")
+            logger.info("Cancelled dispatched swarm job {}", job.job_id)
+        else:
+            self.store.finish(job.job_id, FAILED, self._clock(), error)
+            self._release(job.job_id, "failed")
+
+    def _release(self, job_id: str, outcome: Optional[str] = None) -> None:
+        with self._lock:
+            self._running.discard(job_id)
+            if outcome is not None:
+                self._stats[outcome] += 1
+        self._wakeup.set()
+
+    def _next_wakeup(self) -> float:
+        """Seconds until the next due job or sync."""
+        now = self._clock()
+        delay = self._next_sync - now
+        with self._lock:
+            if self._heap and len(self._running) < self.max_concurrent:
+                delay = min(delay, self._heap[0][0] - now)
+        return max(delay, 0.0)
+
+    def start(self) -> None:
+        """Catch up with the store and start the scheduler thread."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(
+                target=self._loop, name="swarm-scheduler", daemon=True
+            )
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Stop dispatching; jobs already running finish in the pool."""
+        thread = self._thread
+        if thread is not None:
+            self._stopping.set()
+            self._wakeup.set()
+            thread.join(timeout)
+            self._thread = None
+
+    def _loop(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                self.run_pending()
+                delay = self._next_wakeup()
+            except Exception as e:
+                logger.error(f"Swarm scheduler iteration failed: {str(e)}")
+                delay = self.retry_delay
+            self._wakeup.wait(delay)
+            self._wakeup.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Return dispatch counters and waiting and running job counts."""
+        with self._lock:
+            return {
+                **self._stats,
+                "scheduled": len(self._queued),
+                "running": len(self._running),
+            }
@@ -0,0 +1,156 @@
+"""Server-Sent Events streaming for swarm and agent completions.
+
+Swarms and agents run synchronously on worker threads. :class:`EventStream`
+bridges the callbacks they fire (one per generated token, one per finished
+agent) onto the event loop so handlers can forward them to clients as SSE
+frames while the run is still in progress.
+"""
+
+import asyncio
+import functools
+import json
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+from fastapi import HTTPException
+from loguru import logger
+from swarms.utils.any_to_str import any_to_str
+
+from src.api.admission import FlexCapacityError
+from src.api.executors import ExecutorSaturatedError
+
+# Headers that stop proxies from buffering the event stream
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",
+}
+
+SSE_MEDIA_TYPE = "text/event-stream"
+
+_DONE = object()
+
+
+def format_sse(event: str, data: Any) -> str:
+    """
+    Format a single Server-Sent Events frame.
+
+    Args:
+        event: The event name
+        data: JSON-serializable payload
+
+    Returns:
+        str: The encoded SSE frame
+    """
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+class EventStream:
+    """
+    Thread-safe bridge from worker-thread callbacks to an async SSE generator.
+
+    Args:
+        loop: Event loop the consumer runs on; defaults to the running loop
+        executor: Executor with a ``submit`` method that :meth:`run` uses; the
+            loop's default executor if None
+    """
+
+    def __init__(
+        self,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+        executor: Optional[Any] = None,
+    ):
+        self._loop = loop or asyncio.get_running_loop()
+        self._executor = executor
+        self._queue: asyncio.Queue = asyncio.Queue()
+
+    def emit(self, event: str, data: Dict[str, Any]) -> None:
+        """Publish an event. Safe to call from any thread."""
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, (event, data))
+
+    def token_callback(self, agent_name: Optional[str]) -> Callable[[str], None]:
+        """Return a streaming callback that tags tokens with the agent name."""
+
+        def on_token(token: str) -> None:
+            self.emit("token", {"agent_name": agent_name, "token": token})
+
+        return on_token
+
+    def instrument_agent(self, agent: Any) -> Any:
+        """
+        Emit an ``agent_completion`` event each time an agent finishes a run.
+
+        Token streaming itself must be enabled when the agent is constructed,
+        by passing ``streaming_on=True`` and :meth:`token_callback`.
+
+        Args:
+            agent: The swarms Agent to instrument
+
+        Returns:
+            The same agent, for chaining
+        """
+        agent_name = getattr(agent, "agent_name", None)
+        run = agent.run
+
+        @functools.wraps(run)
+        def run_and_notify(*args, **kwargs):
+            output = run(*args, **kwargs)
+            if not isinstance(output, str):
+                output_text = any_to_str(output)
+            else:
+                output_text = output
+            self.emit(
+                "agent_completion",
+                {"agent_name": agent_name, "output": output_text},
+            )
+            return output
+
+        agent.run = run_and_notify
+        return agent
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> AsyncIterator[str]:
+        """
+        Run ``fn`` on a worker thread and yield SSE frames as events arrive.
+
+        Emits a final ``completion`` event with the return value of ``fn`` (or
+        an ``error`` event if it raised), followed by ``done``.
+        """
+        call = functools.partial(fn, *args, **kwargs)
+        try:
+            if self._executor is None:
+                future = self._loop.run_in_executor(None, call)
+            else:
+                future = asyncio.wrap_future(
+                    self._executor.submit(call), loop=self._loop
+                )
+        except ExecutorSaturatedError as e:
+            yield format_sse("error", {"status_code": 503, "detail": str(e)})
+            yield format_sse("done", {})
+            return
+        # Done callbacks run on the loop, so this lands after every emitted event
+        future.add_done_callback(lambda _: self._queue.put_nowait(_DONE))
+
+        while True:
+            item = await self._queue.get()
+            if item is _DONE:
+                break
+            yield format_sse(*item)
+
+        try:
+            yield format_sse("completion", future.result())
+        except HTTPException as e:
+            yield format_sse(
+                "error", {"status_code": e.status_code, "detail": e.detail}
+            )
+        except FlexCapacityError as e:
+            yield format_sse("error", {"status_code": 429, "detail": str(e)})
+        except Exception as e:
+            logger.error(f"Streamed run failed: {str(e)}")
+            yield format_sse("error", {"status_code": 500, "detail": str(e)})
+
+        yield format_sse("done", {})
+
+
+async def stream_result(data: Any) -> AsyncIterator[str]:
+    """Yield an already available response as a ``completion`` + ``done`` stream."""
+    yield format_sse("completion", data)
+    yield format_sse("done", {})
@@ -0,0 +1,379 @@
+"""Cheap capture and background batched writing of API request telemetry.
+
+Capturing telemetry must cost a request no more than a few dictionary lookups:
+static host details are collected once at import (:data:`SERVER_INFO`) and rows
+reference them by id, while CPU and memory come from the latest snapshot
+published by :class:`SystemMetricsSampler`. The full host record is written
+once per process, with the first row the backend accepts.
+
+Request handlers must never wait on the logging backend, so
+:class:`TelemetryWriter` only appends rows to a bounded in-memory queue. A
+daemon thread drains the queue and writes rows in bulk whenever
+``batch_size`` rows are waiting or ``flush_interval`` seconds have passed.
+
+Failure and backpressure policy:
+
+- If a bulk write fails, the batch is appended to a local JSONL spool file and
+  replayed once the backend accepts writes again.
+- The spool is capped at ``max_spool_bytes``; batches that would exceed it are
+  dropped. Spooled lines that cannot be parsed are dropped on replay.
+- If the queue is full because the flusher cannot keep up, the oldest queued
+  row is dropped to make room for the new one.
+
+Every drop is counted and visible through :meth:`TelemetryWriter.stats`.
+"""
+
+import hashlib
+import json
+import os
+import platform
+import random
+import socket
+import tempfile
+import threading
+import uuid
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import psutil
+from dotenv import load_dotenv
+from loguru import logger
+
+load_dotenv()
+
+TELEMETRY_BATCH_SIZE = int(os.getenv("TELEMETRY_BATCH_SIZE", "200"))
+TELEMETRY_FLUSH_INTERVAL = float(os.getenv("TELEMETRY_FLUSH_INTERVAL", "2.0"))
+TELEMETRY_MAX_QUEUE = int(os.getenv("TELEMETRY_MAX_QUEUE", "50000"))
+TELEMETRY_SPOOL_PATH = os.getenv(
+    "TELEMETRY_SPOOL_PATH",
+    os.path.join(tempfile.gettempdir(), "orca_telemetry_spool.jsonl"),
+)
+TELEMETRY_MAX_SPOOL_BYTES = int(
+    os.getenv("TELEMETRY_MAX_SPOOL_BYTES", str(100 * 1024 * 1024))
+)
+# Fraction of health/docs requests to log; 0 excludes them entirely
+TELEMETRY_EXCLUDED_SAMPLE_RATE = float(
+    os.getenv("TELEMETRY_EXCLUDED_SAMPLE_RATE", "0.0")
+)
+
+# Seconds between system metric samples
+TELEMETRY_SAMPLE_INTERVAL = float(os.getenv("TELEMETRY_SAMPLE_INTERVAL", "5.0"))
+
+# Endpoints that are polled constantly and carry no billing information
+EXCLUDED_PATHS = frozenset(
+    {
+        "/",
+        "/health",
+        "/healthz",
+        "/healthz/",
+        "/metrics",
+        "/docs",
+        "/redoc",
+        "/openapi.json",
+    }
+)
+
+
+def should_log_path(
+    path: str, sample_rate: float = TELEMETRY_EXCLUDED_SAMPLE_RATE
+) -> bool:
+    """Return whether a request to ``path`` should be logged."""
+    if path not in EXCLUDED_PATHS:
+        return True
+    return sample_rate > 0 and random.random() < sample_rate
+
+
+def _collect_server_info() -> Dict[str, str]:
+    """Collect static host information; this is slow, so it runs once."""
+    info = {
+        "hostname": socket.gethostname(),
+        "platform": platform.platform(),
+        "python_version": platform.python_version(),
+        "processor": platform.processor() or "unknown",
+        "pid": str(os.getpid()),
+    }
+    info["id"] = hashlib.sha256(
+        json.dumps(info, sort_keys=True).encode()
+    ).hexdigest()[:16]
+    return info
+
+
+# Static host information, referenced from telemetry rows by its id
+SERVER_INFO = _collect_server_info()
+SERVER_ID = SERVER_INFO["id"]
+
+
+class SystemMetricsSampler:
+    """
+    Samples CPU and memory usage on a background thread.
+
+    Readers get the latest published snapshot, so a request pays for a
+    dictionary lookup instead of psutil system calls.
+
+    Args:
+        interval: Seconds between samples
+    """
+
+    def __init__(self, interval: float = TELEMETRY_SAMPLE_INTERVAL):
+        self.interval = interval
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # Prime cpu_percent so the next non-blocking call has a baseline
+        psutil.cpu_percent(interval=None)
+        self._latest = self._sample()
+
+    def _sample(self) -> Dict[str, Any]:
+        memory = psutil.virtual_memory()
+        return {
+            "cpu_percent": psutil.cpu_percent(interval=None),
+            "memory_total": memory.total,
+            "memory_available": memory.available,
+            "memory_percent": memory.percent,
+        }
+
+    def latest(self) -> Dict[str, Any]:
+        """Return the most recent snapshot."""
+        return self._latest
+
+    def start(self) -> None:
+        """Start sampling in the background."""
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="system-metrics-sampler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the sampling thread."""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join(self.interval + 1)
+        self._thread = None
+
+    def _run(self) -> None:
+        while not self._stopping.wait(self.interval):
+            try:
+                # Publish a new dict so readers never see a partial update
+                self._latest = self._sample()
+            except Exception as e:
+                logger.error(f"Failed to sample system metrics: {str(e)}")
+
+
+class TelemetryWriter:
+    """
+    Queues telemetry rows and writes them in bulk from a background thread.
+
+    Args:
+        sink: Callable performing one bulk insert; must raise on failure
+        batch_size: Rows per bulk insert; reaching it triggers an early flush
+        flush_interval: Maximum seconds a row waits before being flushed
+        max_queue: Rows held in memory before the oldest are dropped
+        spool_path: JSONL file holding batches the sink rejected
+        max_spool_bytes: Size cap of the spool file
+        server_info: Host record added as ``data["server"]`` to the first row
+            the sink accepts, so the backend can resolve server ids
+    """
+
+    def __init__(
+        self,
+        sink: Callable[[List[Dict[str, Any]]], None],
+        batch_size: int = TELEMETRY_BATCH_SIZE,
+        flush_interval: float = TELEMETRY_FLUSH_INTERVAL,
+        max_queue: int = TELEMETRY_MAX_QUEUE,
+        spool_path: str = TELEMETRY_SPOOL_PATH,
+        max_spool_bytes: int = TELEMETRY_MAX_SPOOL_BYTES,
+        server_info: Optional[Dict[str, Any]] = None,
+    ):
+        self.sink = sink
+        self.server_info = server_info
+        self._server_info_written = server_info is None
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spool_path = spool_path
+        self.max_spool_bytes = max_spool_bytes
+        self._queue: deque = deque(maxlen=max_queue)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {
+            "enqueued": 0,
+            "written": 0,
+            "spooled": 0,
+            "dropped_queue_full": 0,
+            "dropped_spool_full": 0,
+            "dropped_malformed": 0,
+        }
+
+    def enqueue(self, row: Dict[str, Any]) -> None:
+        """Queue a row for writing. Never blocks on I/O."""
+        with self._lock:
+            if len(self._queue) == self._queue.maxlen:
+                self._stats["dropped_queue_full"] += 1
+            self._queue.append(row)
+            self._stats["enqueued"] += 1
+            queued = len(self._queue)
+
+        if self._thread is None:
+            self.start()
+        if queued >= self.batch_size:
+            self._wakeup.set()
+
+    def start(self) -> None:
+        """Start the flush thread if it is not already running."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(
+                target=self._flush_loop, name="telemetry-writer", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Flush everything still queued and stop the flush thread."""
+        thread = self._thread
+        if thread is None:
+            return
+        self._stopping.set()
+        self._wakeup.set()
+        thread.join(timeout)
+        self._thread = None
+
+    def stats(self) -> Dict[str, int]:
+        """Return counters for queued, written, spooled and dropped rows."""
+        with self._lock:
+            return {**self._stats, "queued": len(self._queue)}
+
+    def _drain(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            count = min(self.batch_size, len(self._queue))
+            return [self._queue.popleft() for _ in range(count)]
+
+    def _flush_loop(self) -> None:
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+            if self._stopping.is_set():
+                return
+
+    def flush(self) -> None:
+        """Write all queued rows, spooling any batch the sink rejects."""
+        backend_up = True
+        while True:
+            batch = self._drain()
+            if not batch:
+                break
+            if backend_up:
+                backend_up = self._write(batch)
+            if not backend_up:
+                self._spool(batch)
+
+        if backend_up:
+            self._replay_spool()
+
+    def _write(self, batch: List[Dict[str, Any]]) -> bool:
+        rows = batch
+        if not self._server_info_written:
+            # Only the flush thread writes, so this needs no lock
+            first = rows[0]
+            data = {**first.get("data", {}), "server": self.server_info}
+            rows = [{**first, "data": data}, *rows[1:]]
+        try:
+            self.sink(_to_json_safe(rows))
+        except Exception as e:
+            logger.error(f"Failed to write {len(batch)} telemetry rows: {str(e)}")
+            return False
+        self._server_info_written = True
+        with self._lock:
+            self._stats["written"] += len(batch)
+        return True
+
+    def _spool(self, batch: Iterable[Dict[str, Any]]) -> None:
+        """Append rows to the spool file, dropping them if it is full."""
+        lines = "".join(json.dumps(row, default=str) + "\n" for row in batch)
+        rows = lines.count("\n")
+        try:
+            size = os.path.getsize(self.spool_path)
+        except OSError:
+            size = 0
+
+        if size + len(lines) > self.max_spool_bytes:
+            with self._lock:
+                self._stats["dropped_spool_full"] += rows
+            return
+
+        try:
+            with open(self.spool_path, "a", encoding="utf-8") as f:
+                f.write(lines)
+        except OSError as e:
+            logger.error(f"Failed to spool telemetry rows: {str(e)}")
+            with self._lock:
+                self._stats["dropped_spool_full"] += rows
+            return
+
+        with self._lock:
+            self._stats["spooled"] += rows
+
+    def _replay_spool(self) -> None:
+        """Write spooled rows back to the sink once it is reachable again."""
+        if not os.path.exists(self.spool_path):
+            return
+
+        # Every worker on the host shares the spool; a name of its own keeps
+        # one worker's rotation from overwriting another's pending replay
+        replay_path = f"{self.spool_path}.{os.getpid()}.{uuid.uuid4().hex}.replay"
+        try:
+            os.replace(self.spool_path, replay_path)
+        except OSError as e:
+            # Most likely another worker took the spool first
+            logger.debug(f"Telemetry spool not replayed: {str(e)}")
+            return
+
+        rows, malformed = [], 0
+        try:
+            with open(replay_path, encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        rows.append(json.loads(line))
+                    except ValueError:
+                        malformed += 1
+        except (OSError, UnicodeDecodeError) as e:
+            logger.error(f"Failed to read telemetry spool: {str(e)}")
+            self._restore_spool(replay_path)
+            return
+
+        if malformed:
+            logger.warning(f"Dropped {malformed} malformed telemetry spool lines")
+            with self._lock:
+                self._stats["dropped_malformed"] += malformed
+
+        for start in range(0, len(rows), self.batch_size):
+            if not self._write(rows[start : start + self.batch_size]):
+                self._spool(rows[start:])
+                break
+
+        try:
+            os.remove(replay_path)
+        except OSError as e:
+            logger.error(f"Failed to remove replayed telemetry spool: {str(e)}")
+
+    def _restore_spool(self, replay_path: str) -> None:
+        """Put an unreadable replay file back so a later flush retries it."""
+        try:
+            # link() fails instead of overwriting a spool started meanwhile
+            os.link(replay_path, self.spool_path)
+            os.remove(replay_path)
+        except OSError as e:
+            logger.error(f"Telemetry spool rows left in {replay_path}: {str(e)}")
+
+
+def _to_json_safe(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Round-trip rows through JSON so datetimes and models serialize."""
+    return json.loads(json.dumps(rows, default=str))
@@ -0,0 +1,205 @@
+"""Memoized, model-aware token counting for cost and usage accounting.
+
+Cost calculation counts the same system prompts, tasks and outputs many times
+per request, always with the default tokenizer. :class:`TokenCounter`:
+
+- picks the tokenizer from the agent's model via litellm, so agents on
+  different models are counted with their own encodings;
+- caches counts by (tokenizer, content hash) in a bounded LRU, so repeated
+  texts are only tokenized once per process;
+- counts lists of texts in one batch, tokenizing each distinct text once;
+- sends very large texts to a process pool so tokenizing them does not hold
+  the GIL on the request path.
+
+Billing prefers the usage providers report for each LLM call
+(:func:`reported_usage`); counting is the fallback.
+"""
+
+import hashlib
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence
+
+from dotenv import load_dotenv
+from litellm import encode, token_counter
+from loguru import logger
+
+load_dotenv()
+
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "100000"))
+TOKEN_POOL_THRESHOLD_CHARS = int(os.getenv("TOKEN_POOL_THRESHOLD_CHARS", "200000"))
+TOKEN_POOL_WORKERS = int(os.getenv("TOKEN_POOL_WORKERS", "2"))
+DEFAULT_TOKENIZER_MODEL = "gpt-4o"
+# Text that different encodings split differently, to tell tokenizers apart
+TOKENIZER_PROBE = "Tokenizer probe: Hello, wörld! 12345\n\tdef f(x): return x**2  # 日本語 🙂"
+
+
+@lru_cache(maxsize=1024)
+def resolve_tokenizer(model: Optional[str]) -> str:
+    """
+    Return a stable name for the tokenizer litellm uses for ``model``.
+
+    The name is a digest of how the tokenizer encodes :data:`TOKENIZER_PROBE`,
+    so models sharing an encoding (e.g. every cl100k model) share a name, and
+    so share cached counts.
+    """
+    try:
+        tokens = encode(model=model or DEFAULT_TOKENIZER_MODEL, text=TOKENIZER_PROBE)
+    except Exception as e:
+        logger.warning(f"No tokenizer for model {model!r}, using default: {str(e)}")
+        return resolve_tokenizer(DEFAULT_TOKENIZER_MODEL)
+
+    digest = hashlib.blake2b(repr(list(tokens)).encode(), digest_size=8).hexdigest()
+    return f"encoding:{digest}"
+
+
+def tokenize_count(model: Optional[str], text: str) -> int:
+    """
+    Count tokens in ``text`` with ``model``'s tokenizer.
+
+    Module-level so it can run in the process pool.
+    """
+    return token_counter(model=model or DEFAULT_TOKENIZER_MODEL, text=text)
+
+
+class TokenCounter:
+    """
+    Thread-safe token counter with a content-addressed count cache.
+
+    Args:
+        max_entries: Maximum number of cached counts (least recently used are
+            dropped)
+        pool_threshold: Texts with at least this many characters are
+            tokenized in the process pool
+        pool_workers: Number of worker processes, created on first use
+    """
+
+    def __init__(
+        self,
+        max_entries: int = TOKEN_CACHE_MAX_ENTRIES,
+        pool_threshold: int = TOKEN_POOL_THRESHOLD_CHARS,
+        pool_workers: int = TOKEN_POOL_WORKERS,
+    ):
+        self.max_entries = max_entries
+        self.pool_threshold = pool_threshold
+        self.pool_workers = pool_workers
+        self._counts: "OrderedDict[tuple[str, bytes], int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._stats = {"hits": 0, "misses": 0, "pooled": 0}
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # Spawn rather than fork: the API process runs many threads
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.pool_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._pool
+
+    def count(self, text: str, model: Optional[str] = None) -> int:
+        """Return the number of tokens in ``text`` for ``model``."""
+        return self.count_many([text], model)[0]
+
+    def count_many(
+        self, texts: Sequence[str], model: Optional[str] = None
+    ) -> List[int]:
+        """
+        Count tokens for several texts at once.
+
+        Each distinct text is tokenized at most once; large texts are
+        tokenized in parallel in the process pool.
+
+        Args:
+            texts: Texts to count
+            model: Model whose tokenizer to use (default tokenizer if None)
+
+        Returns:
+            List[int]: Token counts, in the order of ``texts``
+        """
+        tokenizer = resolve_tokenizer(model)
+        keys = [
+            (tokenizer, hashlib.blake2b(text.encode("utf-8")).digest())
+            if text and text.strip()
+            else None
+            for text in texts
+        ]
+
+        results: Dict[tuple[str, bytes], int] = {}
+        missing: Dict[tuple[str, bytes], str] = {}
+        with self._lock:
+            for key, text in zip(keys, texts):
+                if key is None or key in results or key in missing:
+                    continue
+                cached = self._counts.get(key)
+                if cached is None:
+                    missing[key] = text
+                    self._stats["misses"] += 1
+                else:
+                    self._counts.move_to_end(key)
+                    results[key] = cached
+                    self._stats["hits"] += 1
+
+        if missing:
+            counted = self._tokenize(model, missing)
+            results.update(counted)
+            with self._lock:
+                self._counts.update(counted)
+                while len(self._counts) > self.max_entries:
+                    self._counts.popitem(last=False)
+
+        return [0 if key is None else results[key] for key in keys]
+
+    def _tokenize(
+        self, model: Optional[str], texts: Dict[tuple[str, bytes], str]
+    ) -> Dict[tuple[str, bytes], int]:
+        large = {k: t for k, t in texts.items() if len(t) >= self.pool_threshold}
+        futures = {}
+        if large:
+            pool = self._get_pool()
+            futures = {
+                key: pool.submit(tokenize_count, model, text)
+                for key, text in large.items()
+            }
+            with self._lock:
+                self._stats["pooled"] += len(futures)
+
+        # Count small texts here while the pool works on the large ones
+        counts = {
+            key: tokenize_count(model, text)
+            for key, text in texts.items()
+            if key not in large
+        }
+        for key, future in futures.items():
+            counts[key] = future.result()
+        return counts
+
+    def shutdown(self) -> None:
+        """Stop the process pool, if it was started."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit, miss and pooled counters and the cache size."""
+        with self._lock:
+            return {**self._stats, "size": len(self._counts)}
+
+
+def reported_usage(agent: Any) -> Optional[Dict[str, int]]:
+    """
+    Return the provider-reported token usage summed over an agent's LLM calls.
+
+    Returns None when the agent does not track usage or the provider reported
+    none, in which case callers fall back to tokenizing.
+    """
+    usage = getattr(agent, "usage", None)
+    if not isinstance(usage, dict) or not usage.get("total_tokens"):
+        return None
+    return usage
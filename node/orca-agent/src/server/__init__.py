@@ -1,8 +1,10 @@
 """Flask application initialization."""
 
 from flask import Flask, request
-from .routes import healthz, config, logs
+from src.api.metrics import MetricsRegistry
+from .routes import healthz, config, logs, metrics, admin
 import os
+import time
 import uuid
 import logging
 
@@ -17,17 +19,36 @@ def create_app():
     )
     logger = logging.getLogger(__name__)
 
+    # Metrics served on /metrics, one registry per app
+    registry = MetricsRegistry()
+    request_duration = registry.histogram(
+        'http_request_duration_seconds',
+        'Latency of node server requests',
+        ['method', 'route', 'status'],
+    )
+    app.extensions['metrics'] = registry
+
     # Add request ID middleware
     @app.before_request
     def before_request():
         request.id = str(uuid.uuid4())
-        request.start_time = request.environ.get("REQUEST_TIME", 0)
+        request.start_time = time.perf_counter()
 
     @app.after_request
     def after_request(response):
         # Calculate request duration
-        duration = (request.environ.get("REQUEST_TIME", 0) - request.start_time) * 1000
-        
+        seconds = time.perf_counter() - request.start_time
+        duration = round(seconds * 1000, 2)
+
+        # The rule keeps ids out of the labels; unmatched paths share one
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        request_duration.observe(
+            seconds,
+            method=request.method,
+            route=route,
+            status=str(response.status_code),
+        )
+
         # Log the request
         status_color = '\033[92m' if response.status_code < 400 else '\033[91m'
         logger.info(
@@ -40,6 +61,8 @@ def create_app():
     app.register_blueprint(healthz.bp)
     app.register_blueprint(config.bp)
     app.register_blueprint(logs.bp)
+    app.register_blueprint(metrics.bp)
+    app.register_blueprint(admin.bp)
 
     # Log startup information
     logger.info("SERVER STARTUP")
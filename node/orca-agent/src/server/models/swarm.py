@@ -74,7 +74,7 @@ class SwarmJob(BaseModel):
     """A swarm job record."""
     job_id: str
     status: SwarmStatusEnum
-    swarm_spec: SwarmSpec
+    swarm_spec: Dict[str, Any]
     created_at: datetime
     updated_at: datetime
     metadata: Optional[Dict[str, Any]] = None
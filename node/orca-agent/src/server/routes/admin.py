@@ -0,0 +1,45 @@
+"""Operator routes for the agent."""
+
+from flask import Blueprint, jsonify, request
+from src.api.auth import is_admin_token
+from src.api.profiler import (
+    PROFILE_DEFAULT_INTERVAL,
+    ProfilerBusyError,
+    SamplingProfiler,
+)
+import logging
+
+logger = logging.getLogger(__name__)
+bp = Blueprint('admin', __name__, url_prefix='/admin')
+
+# Samples every thread on request; costs nothing while no profile runs
+profiler = SamplingProfiler()
+
+@bp.before_request
+def require_admin_token():
+    """Reject requests without the ADMIN_TOKEN."""
+    if not is_admin_token(request.headers.get('X-Admin-Token')):
+        return jsonify({
+            'status': 'error',
+            'message': 'Invalid admin token'
+        }), 403
+
+@bp.route('/profile', methods=['GET'])
+def profile_process():
+    """Profile this process and return flamegraph-ready collapsed stacks."""
+    try:
+        seconds = request.args.get('seconds', 10, type=float)
+        interval = request.args.get('interval', PROFILE_DEFAULT_INTERVAL, type=float)
+        idle = request.args.get('idle', 'false').lower() == 'true'
+        result = profiler.profile(seconds, interval, idle)
+    except ProfilerBusyError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 409
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    logger.info(f"Profiled {result.samples} samples over {result.duration:.2f}s")
+    return result.collapsed(), 200, {
+        'Content-Type': 'text/plain; charset=utf-8',
+        'X-Profile-Samples': str(result.samples),
+        'X-Profile-Duration': f"{result.duration:.3f}",
+    }
@@ -0,0 +1,12 @@
+"""Prometheus metrics route for the agent."""
+
+from flask import Blueprint, Response, current_app
+from src.api.metrics import CONTENT_TYPE
+
+bp = Blueprint('metrics', __name__)
+
+@bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Serve the app's metrics in the Prometheus text format."""
+    registry = current_app.extensions['metrics']
+    return Response(registry.render(), content_type=CONTENT_TYPE)
@@ -7,7 +7,7 @@ from prometheus_swarm.database import get_db
 from src.server.services.repo_summary_service import logger
 
 bp = Blueprint("task", __name__)
-executor = ThreadPoolExecutor(max_workers=2)
+executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="worker_task")
 
 # Track in-progress tasks
 in_progress_tasks = set()
@@ -80,4 +80,17 @@ def mock_swarm_status():
         "progress": 0.5,
         "started_at": datetime.now(timezone.utc).isoformat(),
         "updated_at": datetime.now(timezone.utc).isoformat()
-    } 
\ No newline at end of file
+    } 
+class FakeClock:
+    """Manually advanced clock."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock():
+    """Create a clock that only moves when a test advances ``now``."""
+    return FakeClock()
@@ -0,0 +1,152 @@
+"""Tests for standard and flex admission control."""
+
+import threading
+import time
+
+import pytest
+
+from src.api.admission import AdmissionController, FlexCapacityError
+from src.api.executors import NamedExecutor
+
+
+def acquire_in_thread(controller, tier, timeout=None):
+    """Start acquiring in a thread; return the thread and its outcome list."""
+    outcome = []
+
+    def run():
+        try:
+            controller.acquire(tier, timeout)
+            outcome.append("admitted")
+        except FlexCapacityError as e:
+            outcome.append(e)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, outcome
+
+
+def wait_for_waiting(controller, count):
+    while controller.stats()["flex_waiting"] < count:
+        pass
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_standard_runs_are_never_queued():
+    """Test standard runs are admitted even beyond capacity."""
+    controller = AdmissionController(capacity=2)
+    for _ in range(5):
+        controller.acquire("standard")
+    assert controller.stats()["running"] == 5
+
+
+def test_flex_waits_for_idle_capacity():
+    """Test flex runs start only once utilization drops below the threshold."""
+    controller = AdmissionController(capacity=4, flex_threshold=0.5)
+    controller.acquire("standard")
+    controller.acquire("flex")  # 1/4 busy: room for flex
+    assert controller.stats()["admitted_flex"] == 1
+
+    thread, outcome = acquire_in_thread(controller, "flex")  # 2/4 busy
+    wait_for_waiting(controller, 1)
+    assert outcome == []
+
+    controller.release()
+    thread.join(5)
+    assert outcome == ["admitted"]
+    assert controller.stats()["running"] == 2
+
+
+def test_flex_is_admitted_in_arrival_order():
+    """Test waiting flex runs are drained first in, first out."""
+    controller = AdmissionController(capacity=1, flex_threshold=1.0)
+    controller.acquire("standard")
+    order = []
+
+    def run(name):
+        controller.acquire("flex")
+        order.append(name)
+        controller.release()
+
+    threads = []
+    for i, name in enumerate(["first", "second", "third"]):
+        threads.append(threading.Thread(target=run, args=(name,)))
+        threads[-1].start()
+        wait_for_waiting(controller, i + 1)
+
+    controller.release()
+    for thread in threads:
+        thread.join(5)
+    assert order == ["first", "second", "third"]
+
+
+def test_flex_deadline_is_enforced():
+    """Test a flex run that cannot start in time is rejected."""
+    controller = AdmissionController(capacity=1, flex_threshold=0.5)
+    controller.acquire("standard")
+
+    with pytest.raises(FlexCapacityError):
+        controller.acquire("flex", timeout=0.05)
+    stats = controller.stats()
+    assert stats["flex_expired"] == 1
+    assert stats["flex_waiting"] == 0
+
+
+def test_flex_queue_is_bounded():
+    """Test flex runs beyond the waiting limit are rejected immediately."""
+    controller = AdmissionController(capacity=1, flex_max_waiting=1)
+    controller.acquire("standard")
+    thread, _ = acquire_in_thread(controller, "flex")
+    wait_for_waiting(controller, 1)
+
+    with pytest.raises(FlexCapacityError):
+        controller.acquire("flex")
+    assert controller.stats()["flex_rejected"] == 1
+
+    controller.release()
+    thread.join(5)
+
+
+def test_waiting_flex_runs_hold_no_worker():
+    """Test a flex run is handed to the executor only once it is admitted."""
+    controller = AdmissionController(capacity=1, flex_threshold=1.0)
+    executor = NamedExecutor("test-admission", 1, 0)
+    controller.acquire("standard")
+
+    future = controller.submit("flex", executor, lambda: "ran")
+    assert controller.stats()["flex_waiting"] == 1
+    # The only worker is free for a standard run meanwhile
+    assert executor.submit(lambda: "standard").result(5) == "standard"
+    assert not future.done()
+
+    controller.release()
+    assert future.result(5) == "ran"
+    wait_for(lambda: controller.stats()["running"] == 0)
+    executor.shutdown()
+
+
+def test_submitted_flex_runs_expire_or_withdraw():
+    """Test a waiting submit fails once expired and leaves the queue if cancelled."""
+    controller = AdmissionController(capacity=1, flex_threshold=1.0)
+    executor = NamedExecutor("test-admission", 1, 0)
+    controller.acquire("standard")
+    ran = []
+
+    expired = controller.submit("flex", executor, ran.append, 1, timeout=0.05)
+    with pytest.raises(FlexCapacityError):
+        expired.result(5)
+
+    cancelled = controller.submit("flex", executor, ran.append, 2)
+    assert cancelled.cancel()
+    controller.release()
+    stats = controller.stats()
+    assert stats["running"] == 0
+    assert stats["flex_waiting"] == 0
+    assert stats["flex_expired"] == 1
+    assert ran == []
+    executor.shutdown()
@@ -0,0 +1,132 @@
+"""Tests for the warm agent pool."""
+
+import threading
+
+from src.api.agent_pool import AgentPool, agent_pool_key
+
+
+class FakeAgent:
+    """Agent stub with per-run memory and usage."""
+
+    def __init__(self, temperature=0.5):
+        self.system_prompt = "You are a careful analyst."
+        self.temperature = temperature
+        self.max_loops = 1
+        self.short_memory = ["system"]
+        self._usage = {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+
+    def short_memory_init(self):
+        return ["system"]
+
+    def run(self, task):
+        self.short_memory.append(task)
+        self.temperature = 0.9
+        self._usage["total_tokens"] += 10
+
+
+def test_keys_ignore_argument_order():
+    """Test equal configurations map to the same pool key."""
+    assert agent_pool_key({"agent_name": "a", "model_name": "gpt-4o"}) == (
+        agent_pool_key({"model_name": "gpt-4o", "agent_name": "a"})
+    )
+    assert agent_pool_key({"temperature": 0.1}) != agent_pool_key(
+        {"temperature": 0.2}
+    )
+
+
+def test_released_agents_are_reused():
+    """Test a released agent is handed out again instead of rebuilt."""
+    pool = AgentPool()
+    built = []
+
+    def factory():
+        built.append(FakeAgent())
+        return built[-1]
+
+    first = pool.acquire("k", factory)
+    pool.release(first)
+    second = pool.acquire("k", factory)
+
+    assert second is first
+    assert len(built) == 1
+    assert pool.stats()["hits"] == 1
+    assert pool.stats()["misses"] == 1
+    assert pool.stats()["leased"] == 1
+
+
+def test_release_resets_run_state():
+    """Test memory, usage and changed attributes do not leak between requests."""
+    pool = AgentPool()
+    agent = pool.acquire("k", FakeAgent)
+    agent.run("first task")
+    pool.release(agent)
+
+    assert agent.short_memory == ["system"]
+    assert agent._usage["total_tokens"] == 0
+    assert agent.temperature == 0.5
+
+
+def test_leased_agents_are_never_shared():
+    """Test concurrent callers never hold the same agent at once."""
+    pool = AgentPool()
+    held, overlaps = set(), []
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(200):
+            agent = pool.acquire("k", FakeAgent)
+            with lock:
+                if id(agent) in held:
+                    overlaps.append(agent)
+                held.add(id(agent))
+            with lock:
+                held.discard(id(agent))
+            pool.release(agent)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert overlaps == []
+    assert pool.stats()["leased"] == 0
+    assert pool.stats()["idle"] <= 8
+
+
+def test_idle_agents_are_capped():
+    """Test the per-key cap and the total cap, dropping the LRU key first."""
+    pool = AgentPool(max_idle=3, max_idle_per_key=2)
+    a = [pool.acquire("a", FakeAgent) for _ in range(3)]
+    for agent in a:
+        pool.release(agent)
+    assert pool.stats()["idle"] == 2
+
+    b = [pool.acquire("b", FakeAgent) for _ in range(2)]
+    for agent in b:
+        pool.release(agent)
+
+    stats = pool.stats()
+    assert stats["idle"] == 3
+    assert stats["evictions"] == 2
+    assert pool.acquire("b", FakeAgent) in b
+
+
+def test_idle_agents_expire(clock):
+    """Test agents idle for longer than idle_ttl are evicted."""
+    pool = AgentPool(idle_ttl=10, clock=clock)
+    pool.release(pool.acquire("old", FakeAgent))
+    clock.now += 5
+    pool.release(pool.acquire("new", FakeAgent))
+    clock.now += 6
+
+    assert pool.evict_idle() == 1
+    assert pool.stats()["idle"] == 1
+    assert pool.stats()["keys"] == 1
+
+
+def test_unknown_agents_are_ignored_on_release():
+    """Test releasing an agent the pool never leased is a no-op."""
+    pool = AgentPool()
+    pool.release(FakeAgent())
+    assert pool.stats()["idle"] == 0
@@ -0,0 +1,168 @@
+"""Tests for the cached API key authentication."""
+
+import asyncio
+import threading
+
+import pytest
+
+from src.api.auth import INVALID_KEY, AuthCache, AuthInfo
+
+
+class FakeLoader:
+    """Counts lookups against a mutable key table."""
+
+    def __init__(self, keys):
+        self.keys = keys
+        self.calls = 0
+
+    def __call__(self, api_key):
+        self.calls += 1
+        user_id = self.keys.get(api_key)
+        if user_id is None:
+            return INVALID_KEY
+        return AuthInfo(valid=True, user_id=user_id, tier="standard")
+
+
+def make_cache(loader, clock):
+    return AuthCache(loader, ttl=60, negative_ttl=10, stale_ttl=30, clock=clock)
+
+
+def test_valid_key_is_cached_until_ttl(clock):
+    """Test one lookup serves validity and user id until the TTL expires."""
+    loader = FakeLoader({"good": "user-1"})
+    cache = make_cache(loader, clock)
+
+    assert cache.get("good") == AuthInfo(True, "user-1", "standard")
+    assert cache.get("good").user_id == "user-1"
+    assert loader.calls == 1
+
+
+def test_invalid_key_is_negatively_cached(clock):
+    """Test bad keys are remembered for the negative TTL only."""
+    loader = FakeLoader({})
+    cache = make_cache(loader, clock)
+
+    assert not cache.get("bad").valid
+    assert not cache.get("bad").valid
+    assert loader.calls == 1
+
+    clock.now += 11
+    cache.get("bad")
+    assert loader.calls == 2
+
+
+def test_stale_entry_is_served_while_refreshing(clock):
+    """Test an expired valid key is served stale and revoked in the background."""
+    loader = FakeLoader({"good": "user-1"})
+    cache = make_cache(loader, clock)
+    cache.get("good")
+
+    # Revoke the key, then let the entry expire
+    del loader.keys["good"]
+    clock.now += 61
+    assert cache.get("good").valid
+
+    cache._refresher.shutdown(wait=True)
+    assert loader.calls == 2
+    assert not cache.get("good").valid
+
+
+def test_concurrent_misses_share_one_lookup():
+    """Test simultaneous misses for a key trigger a single lookup."""
+    release = threading.Event()
+    calls = []
+
+    def slow_loader(api_key):
+        calls.append(api_key)
+        release.wait(5)
+        return AuthInfo(valid=True, user_id="user-1")
+
+    cache = AuthCache(slow_loader)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get("good")))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    while not calls:
+        pass
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert len(results) == 5
+    assert all(result.user_id == "user-1" for result in results)
+
+
+def test_loader_errors_are_not_cached():
+    """Test backend failures propagate and the next call retries."""
+    attempts = []
+
+    def flaky_loader(api_key):
+        attempts.append(api_key)
+        if len(attempts) == 1:
+            raise ConnectionError("database unavailable")
+        return AuthInfo(valid=True, user_id="user-1")
+
+    cache = AuthCache(flaky_loader)
+    with pytest.raises(ConnectionError):
+        cache.get("good")
+    assert cache.get("good").valid
+
+
+def test_cancelled_async_lookup_is_not_left_in_flight():
+    """Test cancelling the caller running an async lookup settles it for followers."""
+    started = asyncio.Event()
+
+    async def slow_loader(api_key):
+        started.set()
+        await asyncio.sleep(10)
+
+    async def fast_loader(api_key):
+        return AuthInfo(valid=True, user_id="user-1")
+
+    cache = AuthCache(lambda api_key: INVALID_KEY, async_loader=slow_loader)
+
+    async def main():
+        leader = asyncio.create_task(cache.aget("good"))
+        await started.wait()
+        follower = asyncio.create_task(cache.aget("good"))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        with pytest.raises(RuntimeError):
+            await asyncio.wait_for(follower, 1)
+        assert cache._inflight == {}
+        cache.async_loader = fast_loader
+        return await cache.aget("good")
+
+    assert asyncio.run(main()).user_id == "user-1"
+
+
+def test_cancelled_follower_does_not_cancel_the_lookup():
+    """Test one cancelled waiter leaves the owner and other waiters their result."""
+    release = asyncio.Event()
+
+    async def slow_loader(api_key):
+        await release.wait()
+        return AuthInfo(valid=True, user_id="user-1")
+
+    cache = AuthCache(lambda api_key: INVALID_KEY, async_loader=slow_loader)
+
+    async def main():
+        owner = asyncio.create_task(cache.aget("good"))
+        await asyncio.sleep(0)
+        followers = [asyncio.create_task(cache.aget("good")) for _ in range(2)]
+        await asyncio.sleep(0)
+        followers[0].cancel()
+        await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(owner, *followers, return_exceptions=True)
+
+    owner, cancelled, follower = asyncio.run(main())
+    assert isinstance(cancelled, asyncio.CancelledError)
+    assert owner.user_id == follower.user_id == "user-1"
+    assert cache._inflight == {}
@@ -0,0 +1,189 @@
+"""Tests for fair batch scheduling."""
+
+import asyncio
+import threading
+
+from src.api.admission import AdmissionController, FlexCapacityError
+from src.api.batch import FairBatchScheduler, batch_concurrency, iter_batch
+from src.api.executors import NamedExecutor
+
+
+def make_scheduler(max_running):
+    return FairBatchScheduler(NamedExecutor("test-batch", max_running, 100))
+
+
+def collect_sync(scheduler, owner, fn, items, concurrency):
+    """Submit a batch and return an event set when all items finished."""
+    outcomes, finished = {}, threading.Event()
+
+    def on_result(index, result, error):
+        outcomes[index] = error or result
+        if len(outcomes) == len(items):
+            finished.set()
+
+    scheduler.submit(owner, fn, items, concurrency, on_result)
+    return outcomes, finished
+
+
+def test_concurrency_is_capped_by_the_server():
+    """Test requested concurrency is clamped to the configured maximum."""
+    assert batch_concurrency(None) >= 1
+    assert batch_concurrency(0) == 1
+    assert batch_concurrency(10_000) == batch_concurrency(10_000 + 1)
+
+
+def test_batch_concurrency_limit_is_respected():
+    """Test no more than the batch's concurrency items run at once."""
+    scheduler = make_scheduler(8)
+    lock, running, peak = threading.Lock(), [0], [0]
+
+    def work(item):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        threading.Event().wait(0.01)
+        with lock:
+            running[0] -= 1
+        return item * 2
+
+    outcomes, finished = collect_sync(scheduler, "key", work, list(range(12)), 3)
+    assert finished.wait(5)
+    assert outcomes == {i: i * 2 for i in range(12)}
+    assert peak[0] <= 3
+
+
+def test_keys_are_interleaved():
+    """Test a small batch is not stuck behind another key's large batch."""
+    scheduler = make_scheduler(1)
+    gate, order = threading.Event(), []
+
+    def work(item):
+        gate.wait(5)
+        order.append(item)
+
+    big, big_done = collect_sync(scheduler, "a", work, ["a"] * 6, 1)
+    small, small_done = collect_sync(scheduler, "b", work, ["b"] * 2, 1)
+    gate.set()
+
+    assert big_done.wait(5) and small_done.wait(5)
+    assert order[:4] == ["a", "b", "a", "b"]
+
+
+def test_iter_batch_yields_indexed_results_as_they_finish():
+    """Test results arrive tagged with their index, errors included."""
+    scheduler = make_scheduler(4)
+
+    def work(item):
+        if item == "bad":
+            raise ValueError("boom")
+        threading.Event().wait(0.05 if item == "slow" else 0)
+        return item.upper()
+
+    async def main():
+        return [
+            outcome
+            async for outcome in iter_batch(
+                scheduler, "key", work, ["slow", "bad", "fast"], 3
+            )
+        ]
+
+    outcomes = asyncio.run(main())
+    assert outcomes[-1] == (0, "SLOW", None)
+    by_index = {index: (result, error) for index, result, error in outcomes}
+    assert str(by_index[1][1]) == "boom"
+    assert by_index[2] == ("FAST", None)
+
+
+def test_iter_batch_sends_heartbeats_and_cancels_on_early_exit():
+    """Test idle periods yield None and unstarted items are dropped on exit."""
+    scheduler = make_scheduler(1)
+    started = []
+
+    def work(item):
+        started.append(item)
+        threading.Event().wait(0.2)
+        return item
+
+    async def main():
+        seen = []
+        async for outcome in iter_batch(
+            scheduler, "key", work, [1, 2, 3], 1, heartbeat=0.05
+        ):
+            seen.append(outcome)
+            if outcome is not None:
+                break
+        await asyncio.sleep(0.3)
+        return seen
+
+    seen = asyncio.run(main())
+    assert seen[0] is None
+    assert seen[-1] == (0, 1, None)
+    assert started == [1, 2]
+    assert scheduler.stats()["queued"] == 0
+
+
+def swarm_spec(name, **fields):
+    from src.api.api import SwarmSpec
+
+    return SwarmSpec(name=name, task=fields.pop("task", "task"), **fields)
+
+
+def test_identical_swarms_in_a_batch_run_once(monkeypatch):
+    """Test duplicate swarm requests share one run and fan the result out."""
+    from src.api import api
+
+    calls = []
+
+    def fake_create_swarm(swarm, api_key, event_stream=None, user_id=None):
+        calls.append(swarm.name)
+        return {"output": swarm.name}
+
+    monkeypatch.setattr(api, "create_swarm", fake_create_swarm)
+    swarms = [swarm_spec("a"), swarm_spec("b"), swarm_spec("a"), swarm_spec("a")]
+
+    async def main():
+        return [r async for r in api.iter_batch_results(swarms, "key", 4)]
+
+    results = sorted(asyncio.run(main()), key=lambda r: r["index"])
+    assert sorted(calls) == ["a", "b"]
+    assert [r["index"] for r in results] == [0, 1, 2, 3]
+    assert [r["result"]["output"] for r in results] == ["a", "b", "a", "a"]
+
+
+def test_duplicate_tasks_run_once(monkeypatch):
+    """Test batch_run gets each distinct task once, in first-seen order."""
+    from src.api import api
+
+    class FakeRouter:
+        def __init__(self, **kwargs):
+            pass
+
+        def batch_run(self, tasks):
+            FakeRouter.tasks = tasks
+            return [f"answer to {task}" for task in tasks]
+
+    monkeypatch.setattr(api, "SwarmRouter", FakeRouter)
+    spec = swarm_spec("s", task=None, tasks=["x", "y", "x"])
+
+    result = api.run_swarm_spec(spec, None, spec.tasks)
+    assert FakeRouter.tasks == ["x", "y"]
+    assert result["output"] == ["answer to x", "answer to y", "answer to x"]
+
+
+def test_items_not_admitted_complete_with_the_error():
+    """Test an item refused by an admitting executor is reported, not lost."""
+    admission = AdmissionController(capacity=1, flex_max_waiting=0)
+    executor = NamedExecutor("test-batch", 2, 100)
+    scheduler = FairBatchScheduler(
+        admission.executor(executor, lambda run, index: run.items[index])
+    )
+    admission.acquire("standard")
+
+    outcomes, finished = collect_sync(
+        scheduler, "key", lambda tier: tier, ["standard", "flex"], 2
+    )
+    assert finished.wait(5)
+    assert outcomes[0] == "standard"
+    assert isinstance(outcomes[1], FlexCapacityError)
+    assert scheduler.stats()["running"] == 0
+    executor.shutdown()
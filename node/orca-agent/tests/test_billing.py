@@ -0,0 +1,265 @@
+"""Tests for the credit ledger and its SQLite store."""
+
+import threading
+from decimal import Decimal
+
+import pytest
+
+from src.api.billing import (
+    Balance,
+    Charge,
+    CreditAccountNotFoundError,
+    CreditLedger,
+    InsufficientCreditsError,
+    SQLiteCreditStore,
+    SupabaseCreditStore,
+)
+
+
+class CountingStore(SQLiteCreditStore):
+    """SQLite store that counts balance loads and can fail settlement."""
+
+    def __init__(self):
+        super().__init__(":memory:")
+        self.loads = 0
+        self.online = True
+
+    def load_balance(self, user_id):
+        self.loads += 1
+        return super().load_balance(user_id)
+
+    def settle(self, user_id, charges):
+        if not self.online:
+            raise ConnectionError("backend unreachable")
+        return super().settle(user_id, charges)
+
+
+def make_ledger(credit="1", free_credit="0"):
+    store = CountingStore()
+    store.set_balance("user-1", Balance(Decimal(credit), Decimal(free_credit)))
+    ledger = CreditLedger(store, balance_ttl=60)
+    ledger._thread = object()  # Settle manually instead of in the background
+    return ledger, store
+
+
+def test_charges_are_batched_until_settlement():
+    """Test charges update the cached balance and reach the store in one batch."""
+    ledger, store = make_ledger(credit="1")
+
+    for _ in range(3):
+        hold = ledger.hold("user-1", 0.1)
+        ledger.capture(hold, 0.2, "key", "swarm_execution_test")
+
+    assert ledger.available("user-1") == Decimal("0.4")
+    assert store.transactions("user-1") == []
+    assert store.loads == 1
+
+    ledger.settle()
+    assert store.load_balance("user-1") == Balance(Decimal("0.4"), Decimal("0"))
+    assert len(store.transactions("user-1")) == 3
+    assert ledger.stats()["pending_charges"] == 0
+
+
+def test_free_credit_is_spent_first():
+    """Test settlement deducts from free credit before regular credit."""
+    ledger, store = make_ledger(credit="1", free_credit="0.5")
+
+    ledger.charge("user-1", "key", 0.75, "swarm_execution_test")
+    ledger.settle()
+
+    assert store.load_balance("user-1") == Balance(Decimal("0.75"), Decimal("0"))
+
+
+def test_holds_prevent_concurrent_overspend():
+    """Test concurrent holds cannot reserve more than the balance."""
+    ledger, _ = make_ledger(credit="1")
+    granted, refused = [], []
+
+    def reserve():
+        try:
+            granted.append(ledger.hold("user-1", 0.3))
+        except InsufficientCreditsError:
+            refused.append(True)
+
+    threads = [threading.Thread(target=reserve) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(granted) == 3
+    assert len(refused) == 7
+
+
+def test_released_hold_is_not_charged():
+    """Test a failed run's hold returns the credits without a transaction."""
+    ledger, store = make_ledger(credit="1")
+
+    hold = ledger.hold("user-1", 0.6)
+    with pytest.raises(InsufficientCreditsError):
+        ledger.hold("user-1", 0.6)
+    ledger.release(hold)
+    ledger.release(hold)
+
+    assert ledger.available("user-1") == Decimal("1")
+    ledger.settle()
+    assert store.transactions("user-1") == []
+
+
+def test_capture_bills_work_beyond_the_balance():
+    """Test a run that costs more than is left is billed into a negative balance."""
+    ledger, store = make_ledger(credit="1")
+
+    hold = ledger.hold("user-1", 0.5)
+    ledger.capture(hold, 1.5, "key", "swarm_execution_test")
+
+    assert ledger.available("user-1") == Decimal("-0.5")
+    with pytest.raises(InsufficientCreditsError):
+        ledger.hold("user-1", 0.1)
+    ledger.settle()
+    assert store.load_balance("user-1").credit == Decimal("-0.5")
+    assert len(store.transactions("user-1")) == 1
+
+
+def test_charges_count_until_settlement_returns():
+    """Test charges being settled still count against the balance."""
+    ledger, store = make_ledger(credit="1")
+    entered, proceed = threading.Event(), threading.Event()
+    settle = store.settle
+
+    def slow_settle(user_id, charges):
+        entered.set()
+        proceed.wait(5)
+        return settle(user_id, charges)
+
+    store.settle = slow_settle
+    ledger.charge("user-1", "key", 0.5, "swarm_execution_test")
+    thread = threading.Thread(target=ledger.settle)
+    thread.start()
+    assert entered.wait(5)
+
+    assert ledger.available("user-1") == Decimal("0.5")
+    ledger.charge("user-1", "key", 0.25, "swarm_execution_test")
+    proceed.set()
+    thread.join(5)
+
+    # The charge made during settlement stays pending on the new balance
+    assert ledger.available("user-1") == Decimal("0.25")
+    assert ledger.stats()["pending_charges"] == 1
+
+
+def test_failed_settlement_is_retried():
+    """Test charges stay pending and counted while the store is unreachable."""
+    ledger, store = make_ledger(credit="1")
+    ledger.charge("user-1", "key", 0.25, "swarm_execution_test")
+
+    store.online = False
+    ledger.settle()
+    assert ledger.available("user-1") == Decimal("0.75")
+    assert ledger.stats()["pending_charges"] == 1
+
+    store.online = True
+    ledger.settle()
+    assert store.load_balance("user-1").credit == Decimal("0.75")
+    assert len(store.transactions("user-1")) == 1
+
+
+def test_settling_a_charge_twice_bills_it_once():
+    """Test a batch retried after it was recorded is not recorded or deducted again."""
+    store = SQLiteCreditStore()
+    store.set_balance("user-1", Balance(Decimal("1"), Decimal("0")))
+    charges = [
+        Charge("user-1", "key", Decimal("0.25"), "swarm_execution_test", "c-1"),
+        Charge("user-1", "key", Decimal("0.25"), "swarm_execution_test", "c-2"),
+    ]
+    store.settle("user-1", charges[:1])
+    # The first charge is retried together with a new one
+    assert store.settle("user-1", charges) == Balance(Decimal("0.50"), Decimal("0"))
+    assert len(store.transactions("user-1")) == 2
+
+
+def test_concurrent_settlements_from_workers_are_not_lost(tmp_path):
+    """Test ledgers of separate workers settling one user both count."""
+    path = str(tmp_path / "credits.db")
+    SQLiteCreditStore(path).set_balance(
+        "user-1", Balance(Decimal("10"), Decimal("0"))
+    )
+    ledgers = []
+    for _ in range(4):
+        ledger = CreditLedger(SQLiteCreditStore(path))
+        ledger._thread = object()
+        for _ in range(5):
+            ledger.charge("user-1", "key", 0.25, "swarm_execution_test")
+        ledgers.append(ledger)
+
+    threads = [threading.Thread(target=ledger.settle) for ledger in ledgers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert SQLiteCreditStore(path).load_balance("user-1").credit == Decimal("5")
+
+
+def test_supabase_settlement_is_one_rpc():
+    """Test the Supabase store settles a batch in one idempotent function call."""
+    calls = []
+
+    class Query:
+        def execute(self):
+            return type("Response", (), {"data": [{"credit": 4, "free_credit": 0}]})
+
+    class Client:
+        def rpc(self, name, params):
+            calls.append((name, params))
+            return Query()
+
+    store = SupabaseCreditStore(Client)
+    charge = Charge("user-1", "key", Decimal("1.5"), "swarm_execution_test", "c-1")
+    assert store.settle("user-1", [charge]) == Balance(Decimal("4"), Decimal("0"))
+    [(name, params)] = calls
+    assert name == "settle_credit_charges"
+    assert params["p_user_id"] == "user-1"
+    assert params["p_charges"][0]["charge_id"] == "c-1"
+    assert params["p_charges"][0]["amount"] == "1.5"
+
+
+def test_unknown_user_has_no_account():
+    """Test users without a credit record are rejected."""
+    ledger, _ = make_ledger()
+    with pytest.raises(CreditAccountNotFoundError):
+        ledger.hold("user-2", 0.1)
+
+
+def test_stop_settles_pending_charges():
+    """Test stop() flushes charges captured since the last settlement."""
+    store = SQLiteCreditStore()
+    store.set_balance("user-1", Balance(Decimal("1"), Decimal("0")))
+    ledger = CreditLedger(store, settle_interval=60)
+
+    ledger.charge("user-1", "key", 0.5, "swarm_execution_test")
+    ledger.stop()
+
+    assert store.load_balance("user-1").credit == Decimal("0.5")
+
+
+def test_swarm_hold_is_sized_from_the_cost_estimate():
+    """Test the hold grows with agents, loops and max_tokens."""
+    from src.api.api import AgentSpec, SwarmSpec, estimate_swarm_cost
+
+    def spec(max_tokens=1000, max_loops=1, agents=1):
+        return SwarmSpec(
+            agents=[
+                AgentSpec(agent_name=f"a{i}", max_tokens=max_tokens)
+                for i in range(agents)
+            ],
+            max_loops=max_loops,
+        )
+
+    base = estimate_swarm_cost(spec(), "Summarize this", None)
+    assert base > 0.01 + 1000 / 1_000_000 * 4.5
+    assert estimate_swarm_cost(spec(max_tokens=2000), "Summarize this", None) > base
+    assert estimate_swarm_cost(spec(max_loops=2), "Summarize this", None) > base
+    assert estimate_swarm_cost(spec(agents=2), "Summarize this", None) == pytest.approx(
+        2 * base
+    )
+    assert estimate_swarm_cost(spec(), None, ["a", "b"]) > base
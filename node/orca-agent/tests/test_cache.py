@@ -0,0 +1,348 @@
+"""Tests for the shared response cache."""
+
+import asyncio
+import threading
+from time import sleep
+
+import pytest
+
+from src.api import cache as cache_module
+from src.api.admission import AdmissionController, FlexCapacityError
+from src.api.cache import DiskCache, ResponseCache, SingleFlight, make_cache_key
+from src.api.executors import NamedExecutor
+
+
+def test_keys_are_canonical_and_fixed_size():
+    """Test key order does not matter and long prompts give short keys."""
+    first = make_cache_key("agent", {"task": "x" * 100_000, "temp": 0.5})
+    second = make_cache_key("agent", {"temp": 0.5, "task": "x" * 100_000})
+
+    assert first == second
+    assert first.startswith("agent:")
+    assert len(first) == len("agent:") + 64
+    assert make_cache_key("swarm", {"task": "x"}) != make_cache_key(
+        "agent", {"task": "x"}
+    )
+
+
+def test_namespaces_have_their_own_ttl(clock):
+    """Test swarm and agent entries expire independently."""
+    cache = ResponseCache(ttls={"swarm": 3600, "agent": 300}, clock=clock)
+    cache.set("swarm", "s", {"output": 1})
+    cache.set("agent", "a", {"output": 2})
+
+    clock.now += 301
+    assert cache.get("agent", "a") is None
+    assert cache.get("swarm", "s") == {"output": 1}
+
+    stats = cache.stats()["namespaces"]
+    assert stats["agent"]["expirations"] == 1
+    assert stats["swarm"]["hits"] == 1
+
+
+def test_byte_budget_evicts_least_recently_used():
+    """Test the byte budget is enforced in LRU order."""
+    cache = ResponseCache(max_bytes=100, compression="none")
+    cache.set("swarm", "a", "x" * 40)
+    cache.set("swarm", "b", "x" * 40)
+    cache.get("swarm", "a")
+    cache.set("swarm", "c", "x" * 40)
+
+    assert cache.get("swarm", "b") is None
+    assert cache.get("swarm", "a") is not None
+    assert cache.get("swarm", "c") is not None
+    assert cache.stats()["bytes"] <= 100
+    assert cache.stats()["namespaces"]["swarm"]["evictions"] == 1
+
+
+def test_oversized_responses_are_not_cached():
+    """Test a response larger than the whole budget is skipped."""
+    cache = ResponseCache(max_bytes=10, compression="none")
+    cache.set("agent", "big", "x" * 100)
+    assert cache.get("agent", "big") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_get_returns_a_copy():
+    """Test callers cannot mutate the cached response."""
+    cache = ResponseCache()
+    cache.set("agent", "a", {"outputs": [1]})
+    cache.get("agent", "a")["outputs"].append(2)
+    assert cache.get("agent", "a") == {"outputs": [1]}
+
+
+@pytest.mark.skipif(cache_module.zstandard is None, reason="zstandard not installed")
+def test_large_responses_are_compressed():
+    """Test zstd shrinks large, repetitive responses."""
+    cache = ResponseCache(compression="zstd", compress_min_bytes=100)
+    response = {"outputs": "the same sentence again. " * 1000}
+    cache.set("swarm", "s", response)
+
+    assert cache.stats()["bytes"] < len("the same sentence again. ") * 100
+    assert cache.get("swarm", "s") == response
+
+
+def test_concurrent_access_keeps_accounting_consistent():
+    """Test parallel writers never exceed the budget or corrupt the size."""
+    cache = ResponseCache(max_bytes=2000, compression="none")
+
+    def worker(n):
+        for i in range(200):
+            cache.set("agent", f"{n}-{i}", "x" * 50)
+            cache.get("agent", f"{n}-{i // 2}")
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    stats = cache.stats()
+    assert stats["bytes"] <= 2000
+    assert stats["bytes"] == sum(len(e.blob) for e in cache._entries.values())
+
+
+def test_disk_tier_is_shared_between_workers(tmp_path):
+    """Test a response cached by one worker is served to another from disk."""
+    path = str(tmp_path / "cache.db")
+    first = ResponseCache(disk=DiskCache(path))
+    second = ResponseCache(disk=DiskCache(path))
+
+    first.set("swarm", "s", {"output": "shared"})
+    assert second.get("swarm", "s") == {"output": "shared"}
+    assert second.get("swarm", "s") == {"output": "shared"}
+
+    counters = second.stats()["namespaces"]["swarm"]
+    assert counters["disk_hits"] == 1
+    assert counters["hits"] == 1
+
+
+def test_aget_reads_the_disk_tier_off_the_event_loop(tmp_path):
+    """Test aget serves memory hits inline and disk reads on a worker thread."""
+    path = str(tmp_path / "cache.db")
+    first = ResponseCache(disk=DiskCache(path))
+    second = ResponseCache(disk=DiskCache(path))
+    first.set("swarm", "s", {"output": "shared"})
+
+    disk_get = second.disk.get
+    threads = []
+
+    def tracking_get(key):
+        threads.append(threading.current_thread())
+        return disk_get(key)
+
+    second.disk.get = tracking_get
+
+    async def main():
+        return [
+            await second.aget("swarm", "s"),
+            await second.aget("swarm", "s"),
+            await second.aget("swarm", "missing"),
+        ]
+
+    assert asyncio.run(main()) == [{"output": "shared"}, {"output": "shared"}, None]
+    assert len(threads) == 2
+    assert threading.main_thread() not in threads
+    counters = second.stats()["namespaces"]["swarm"]
+    assert (counters["disk_hits"], counters["hits"], counters["misses"]) == (1, 1, 1)
+
+
+def test_disk_compaction_drops_expired_then_lru(tmp_path, clock):
+    """Test compaction removes expired rows, then the least recently used."""
+    disk = DiskCache(str(tmp_path / "cache.db"), max_bytes=100, clock=clock)
+    cache = ResponseCache(
+        ttls={"agent": 10}, compression="none", disk=disk, clock=clock
+    )
+
+    cache.set("agent", "old", "x" * 40)
+    clock.now += 11
+    cache.set("agent", "a", "x" * 40)
+    clock.now += 1
+    cache.set("agent", "b", "x" * 40)
+    clock.now += 1
+    cache.set("agent", "c", "x" * 40)
+
+    assert disk.compact() == 2
+    assert disk.get("old") is None
+    assert disk.get("a") is None
+    assert disk.get("c") is not None
+    assert disk.stats()["bytes"] <= 100
+
+
+def test_snapshot_and_warm_load_survive_restart(tmp_path):
+    """Test a restarted worker starts with the previous memory tier."""
+    path = str(tmp_path / "cache.db")
+    before = ResponseCache(disk=DiskCache(path))
+    before.set("agent", "a", {"outputs": 1})
+    before.disk.delete("a")  # Pretend the write-through was lost
+    before.snapshot()
+
+    after = ResponseCache(disk=DiskCache(path))
+    assert after.warm_load() == 1
+    assert after.stats()["entries"] == 1
+    assert after.get("agent", "a") == {"outputs": 1}
+    assert after.stats()["namespaces"]["agent"]["hits"] == 1
+
+
+def run_followers(flights, fn, count):
+    """Start ``count`` callers of the same key once the leader is running."""
+    results, errors = [], []
+
+    def call():
+        try:
+            results.append(flights.do("agent:k", fn))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+
+def test_identical_requests_share_one_run():
+    """Test concurrent callers of one key wait for a single execution."""
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def run():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"outputs": ["done"]}
+
+    threads, results, _ = run_followers(flights, run, 1)
+    started.wait(5)
+    more, more_results, _ = run_followers(flights, run, 4)
+    while flights.stats()["followers"] < 4:
+        pass
+    release.set()
+    for thread in threads + more:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert results + more_results == [{"outputs": ["done"]}] * 5
+    assert more_results[0] is not results[0]
+    assert flights.stats() == {"leaders": 1, "followers": 4, "inflight": 0}
+
+
+def test_followers_retry_after_leader_failure():
+    """Test a leader's error is not handed to its followers."""
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def run():
+        calls.append(1)
+        if len(calls) == 1:
+            started.set()
+            release.wait(5)
+            raise RuntimeError("leader only")
+        sleep(0.1)  # Long enough for the other followers to join
+        return "ok"
+
+    threads, _, errors = run_followers(flights, run, 1)
+    started.wait(5)
+    more, results, more_errors = run_followers(flights, run, 3)
+    while flights.stats()["followers"] < 3:
+        pass
+    release.set()
+    for thread in threads + more:
+        thread.join(5)
+
+    assert [str(e) for e in errors] == ["leader only"]
+    assert more_errors == []
+    assert results == ["ok"] * 3
+    assert len(calls) == 2
+
+
+def test_async_followers_wait_on_the_event_loop():
+    """Test do_async coalesces event-loop callers onto one worker thread."""
+    flights = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def run():
+        calls.append(1)
+        release.wait(5)
+        return "ok"
+
+    async def main():
+        tasks = [
+            asyncio.create_task(flights.do_async("swarm:k", run)) for _ in range(5)
+        ]
+        await asyncio.sleep(0.05)
+        release.set()
+        return await asyncio.gather(*tasks)
+
+    assert asyncio.run(main()) == ["ok"] * 5
+    assert len(calls) == 1
+
+
+def test_cancelled_follower_does_not_cancel_the_flight():
+    """Test a follower cancelled mid-wait leaves the leader and others their result."""
+    flights = SingleFlight()
+    release = threading.Event()
+
+    def run():
+        release.wait(5)
+        return "ok"
+
+    async def main():
+        leader = asyncio.create_task(flights.do_async("swarm:k", run))
+        await asyncio.sleep(0.05)
+        followers = [
+            asyncio.create_task(flights.do_async("swarm:k", run)) for _ in range(2)
+        ]
+        await asyncio.sleep(0.05)
+        followers[0].cancel()
+        await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(leader, *followers, return_exceptions=True)
+
+    leader, cancelled, follower = asyncio.run(main())
+    assert isinstance(cancelled, asyncio.CancelledError)
+    assert leader == follower == "ok"
+    assert flights.stats()["inflight"] == 0
+
+
+def test_followers_retry_when_the_leader_never_starts():
+    """Test a leader refused by its executor does not strand its followers."""
+    flights = SingleFlight()
+    # The flex leader waits for capacity, then expires
+    admission = AdmissionController(capacity=1, flex_max_wait=0.05)
+    admission.acquire("standard")
+    executor = NamedExecutor("test-flight", 1, 0)
+
+    async def main():
+        leader = asyncio.create_task(
+            flights.do_async_on(
+                admission.executor(executor, "flex"), "swarm:k", lambda: "flex"
+            )
+        )
+        follower = asyncio.create_task(flights.do_async("swarm:k", lambda: "retry"))
+        return await asyncio.gather(leader, follower, return_exceptions=True)
+
+    leader, follower = asyncio.run(main())
+    assert isinstance(leader, FlexCapacityError)
+    assert follower == "retry"
+    assert flights.stats()["inflight"] == 0
+    executor.shutdown()
+
+
+def test_runs_are_only_shared_within_an_api_key(monkeypatch):
+    """Test flight keys are per tenant and each job keeps its own job_id."""
+    from src.api import api
+
+    key = make_cache_key("swarm", {"task": "x"})
+    assert api.flight_key(key, "key-1") == api.flight_key(key, "key-1")
+    assert api.flight_key(key, "key-1") != api.flight_key(key, "key-2")
+    assert "key-1" not in api.flight_key(key, "key-1")
+
+    shared = {"output": "ok"}
+    monkeypatch.setattr(api, "execute_and_cache_swarm", lambda *a, **k: shared)
+    swarm = api.SwarmSpec(task="x")
+    assert api.run_and_cache_swarm(swarm, "key-1", "job-1")["job_id"] == "job-1"
+    assert api.run_and_cache_swarm(swarm, "key-1", "job-2")["job_id"] == "job-2"
+    assert shared == {"output": "ok"}
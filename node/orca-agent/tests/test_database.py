@@ -0,0 +1,236 @@
+"""Tests for the async Supabase data-access layer, against a local stand-in."""
+
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import pytest
+from postgrest.exceptions import APIError
+
+from src.api.auth import INVALID_KEY, AuthCache, AuthInfo
+from src.api.database import AsyncDatabase, DatabaseUnavailableError
+
+
+class StandInPostgREST(ThreadingHTTPServer):
+    """
+    Minimal PostgREST: ``eq`` filters, ``limit`` and inserts on in-memory
+    tables, with injectable failures and latency. Selected columns are
+    recorded, not applied.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.tables = {}
+        self.failures = []
+        self.delay = 0.0
+        self.requests = 0
+        self.selects = []
+        self.active = 0
+        self.peak_active = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _handle(self, write):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            server.active += 1
+            server.peak_active = max(server.peak_active, server.active)
+            failure = server.failures.pop(0) if server.failures else None
+        try:
+            time.sleep(server.delay)
+            url = urlsplit(self.path)
+            table = server.tables.setdefault(url.path.rsplit("/", 1)[-1], [])
+            body = None
+            if write:
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            if self.headers.get("apikey") != "service-key":
+                return self._reply(401, {"message": "bad key", "code": "401"})
+            if failure is not None:
+                return self._reply(failure, {"message": "unavailable"})
+            if write:
+                table.extend(body if isinstance(body, list) else [body])
+                return self._reply(201, body)
+            params = dict(parse_qsl(url.query))
+            limit = int(params.pop("limit", len(table)))
+            with server.lock:
+                server.selects.append(params.pop("select", "*"))
+            rows = [
+                row
+                for row in table
+                if all(f"eq.{row.get(k)}" == v for k, v in params.items())
+            ]
+            self._reply(200, rows[:limit])
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def do_GET(self):
+        self._handle(write=False)
+
+    def do_POST(self):
+        self._handle(write=True)
+
+
+@pytest.fixture
+def server():
+    server = StandInPostgREST()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_database(server, **kwargs):
+    kwargs.setdefault("retry_base_delay", 0.01)
+    return AsyncDatabase(url=server.url, key="service-key", **kwargs)
+
+
+def run(database, coro_fn):
+    async def main():
+        try:
+            return await coro_fn()
+        finally:
+            await database.aclose()
+
+    return asyncio.run(main())
+
+
+def test_select_and_insert(server):
+    """Test queries built like sync supabase queries run against PostgREST."""
+    server.tables["swarms_cloud_api_keys"] = [{"key": "k1", "user_id": "u1"}]
+    db = make_database(server)
+
+    async def calls():
+        found = await db.execute(
+            db.table("swarms_cloud_api_keys").select("user_id").eq("key", "k1").limit(1)
+        )
+        await db.execute(
+            db.table("swarms_api_logs").insert({"api_key": "k1"}), idempotent=False
+        )
+        return found.data
+
+    assert run(db, calls) == [{"key": "k1", "user_id": "u1"}]
+    assert server.tables["swarms_api_logs"] == [{"api_key": "k1"}]
+    assert db.stats()["calls"] == 2
+
+
+def test_transient_errors_are_retried(server):
+    """Test reads are retried through 503s and non-transient errors are not."""
+    db = make_database(server, max_retries=3)
+    server.failures = [503, 503]
+    assert run(db, lambda: db.execute(db.table("t").select("*"))).data == []
+    assert db.stats()["retries"] == 2
+
+    server.failures = [503] * 5
+    with pytest.raises(DatabaseUnavailableError):
+        run(db, lambda: db.execute(db.table("t").select("*")))
+
+    server.failures = [400]
+    with pytest.raises(APIError):
+        run(db, lambda: db.execute(db.table("t").select("*")))
+
+
+def test_writes_are_not_retried_after_reaching_the_server(server):
+    """Test an insert that may have been applied is not sent twice."""
+    db = make_database(server)
+    server.failures = [503]
+    with pytest.raises(APIError):
+        run(db, lambda: db.execute(db.table("t").insert({"a": 1}), idempotent=False))
+    assert server.requests == 1
+
+
+def test_calls_time_out(server):
+    """Test a slow database fails the call after its timeout."""
+    db = make_database(server, timeout=5)
+    server.delay = 0.5
+    with pytest.raises(DatabaseUnavailableError, match="timed out"):
+        run(db, lambda: db.execute(db.table("t").select("*"), timeout=0.1))
+    assert db.stats()["timeouts"] == 1
+
+
+def test_concurrency_is_limited(server):
+    """Test no more than max_concurrency calls reach the database at once."""
+    db = make_database(server, max_concurrency=2)
+    server.delay = 0.05
+
+    async def calls():
+        await asyncio.gather(
+            *(db.execute(db.table("t").select("*")) for _ in range(6))
+        )
+
+    run(db, calls)
+    assert server.requests == 6
+    assert server.peak_active <= 2
+    assert db.stats()["peak_in_flight"] == 2
+
+
+def test_auth_cache_awaits_the_async_loader(server):
+    """Test concurrent async misses share one database lookup."""
+    server.tables["swarms_cloud_api_keys"] = [{"key": "k1", "user_id": "u1"}]
+    server.delay = 0.05
+    db = make_database(server)
+
+    async def load(api_key):
+        response = await db.execute(
+            db.table("swarms_cloud_api_keys").select("*").eq("key", api_key).limit(1)
+        )
+        if not response.data:
+            return INVALID_KEY
+        return AuthInfo(valid=True, user_id=response.data[0]["user_id"])
+
+    def fail(api_key):
+        raise AssertionError("the sync loader must not be used")
+
+    cache = AuthCache(fail, async_loader=load)
+
+    async def calls():
+        return await asyncio.gather(*(cache.aget("k1") for _ in range(5)))
+
+    assert {info.user_id for info in run(db, calls)} == {"u1"}
+    assert server.requests == 1
+
+
+def test_api_key_lookup_reads_the_tier(server):
+    """Test API key lookups select the tier column and keep non-standard tiers."""
+    from src.api.api import api_key_query, auth_info_from_rows
+
+    server.tables["swarms_cloud_api_keys"] = [
+        {"key": "k1", "user_id": "u1", "tier": "enterprise"},
+        {"key": "k2", "user_id": "u2", "tier": None},
+    ]
+    db = make_database(server)
+
+    async def calls():
+        return [
+            auth_info_from_rows((await db.execute(api_key_query(db, key))).data)
+            for key in ("k1", "k2")
+        ]
+
+    assert run(db, calls) == [
+        AuthInfo(valid=True, user_id="u1", tier="enterprise"),
+        AuthInfo(valid=True, user_id="u2", tier="standard"),
+    ]
+    assert all("tier" in select.split(",") for select in server.selects)
@@ -0,0 +1,91 @@
+"""Tests for the shared named executors."""
+
+import asyncio
+import threading
+
+import pytest
+
+from src.api.cache import SingleFlight
+from src.api.executors import (
+    ExecutorSaturatedError,
+    NamedExecutor,
+    executor_stats,
+    get_executor,
+)
+
+
+def blocked_executor(max_workers=1, max_queue=1):
+    """Return an executor whose workers wait on the returned event."""
+    executor = NamedExecutor("test", max_workers, max_queue)
+    release = threading.Event()
+    started = threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+        return "done"
+
+    return executor, block, started, release
+
+
+def test_queue_depth_is_bounded():
+    """Test submissions beyond the queue limit are rejected, not queued."""
+    executor, block, started, release = blocked_executor()
+    running = executor.submit(block)
+    started.wait(5)
+    queued = executor.submit(block)
+
+    with pytest.raises(ExecutorSaturatedError):
+        executor.submit(block)
+
+    stats = executor.stats()
+    assert stats["active"] == 1
+    assert stats["queued"] == 1
+    assert stats["rejected"] == 1
+
+    release.set()
+    assert running.result(5) == queued.result(5) == "done"
+    stats = executor.stats()
+    assert (stats["active"], stats["queued"], stats["completed"]) == (0, 0, 2)
+    executor.shutdown()
+
+
+def test_cancelled_tasks_leave_the_queue():
+    """Test queue depth accounts for tasks cancelled before they start."""
+    executor, block, started, release = blocked_executor()
+    executor.submit(block)
+    started.wait(5)
+    assert executor.submit(block).cancel()
+
+    assert executor.stats()["queued"] == 0
+    release.set()
+    executor.shutdown(wait=True)
+
+
+def test_named_executors_are_shared():
+    """Test every caller gets the same long-lived executor for a name."""
+    assert get_executor("batch") is get_executor("batch")
+    assert "batch" in executor_stats()
+    with pytest.raises(KeyError):
+        get_executor("unknown")
+
+
+def test_saturated_flight_fails_its_followers():
+    """Test a leader that cannot be scheduled does not strand followers."""
+    executor, block, started, release = blocked_executor(max_queue=0)
+    executor.submit(block)
+    started.wait(5)
+    flights = SingleFlight(executor=executor)
+
+    async def main():
+        return await asyncio.gather(
+            flights.do_async("swarm:k", lambda: "ok"),
+            flights.do_async("swarm:k", lambda: "ok"),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(main())
+    assert all(isinstance(r, ExecutorSaturatedError) for r in results)
+    assert flights.stats()["inflight"] == 0
+    release.set()
+    executor.shutdown()
@@ -0,0 +1,186 @@
+"""Tests for the outbound LLM governor."""
+
+import threading
+import time
+
+import litellm
+import pytest
+
+from src.api.governor import (
+    GovernorCallback,
+    LLMBudgetExceededError,
+    LLMGovernor,
+    ModelLimits,
+)
+
+
+class FakeTime:
+    """Clock whose sleep advances it."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(round(seconds, 3))
+        self.now += seconds
+
+
+def make_governor(fake, **limits):
+    return LLMGovernor(
+        limits={},
+        default=ModelLimits(**{"rpm": 0, "tpm": 0, "concurrency": 0, **limits}),
+        burst_seconds=6,
+        max_wait=30,
+        clock=fake.clock,
+        sleep=fake.sleep,
+    )
+
+
+def test_bursts_are_spread_out_at_the_rpm():
+    """Test a burst beyond the bucket waits one request interval per call."""
+    fake = FakeTime()
+    governor = make_governor(fake, rpm=60)
+
+    for _ in range(8):
+        governor.release(governor.acquire("gpt-4o", 10))
+
+    # 60 RPM holds 6 seconds (6 calls) of burst, then one call per second
+    assert fake.slept == [1.0, 1.0]
+    stats = governor.stats()["models"]["gpt-4o"]
+    assert stats["calls"] == 8
+    assert stats["delayed"] == 2
+    assert stats["wait_seconds_total"] == pytest.approx(2.0)
+
+
+def test_token_budget_uses_reported_usage():
+    """Test an overestimated call refunds the tokens it did not use."""
+    fake = FakeTime()
+    governor = make_governor(fake, tpm=6000)  # 600 tokens of burst
+
+    governor.release(governor.acquire("gpt-4o", 600), used_tokens=100)
+    governor.acquire("gpt-4o", 500)
+    assert fake.slept == []
+
+    governor.acquire("gpt-4o", 100)
+    assert fake.slept == [1.0]
+
+
+def test_calls_over_the_max_wait_are_rejected_and_refunded():
+    """Test a call that would wait too long is rejected without using budget."""
+    fake = FakeTime()
+    governor = make_governor(fake, tpm=600)  # 60 tokens of burst, 10 per second
+
+    with pytest.raises(LLMBudgetExceededError):
+        governor.acquire("gpt-4o", 1000)
+    governor.acquire("gpt-4o", 60)
+    assert fake.slept == []
+    assert governor.stats()["rejected"] == 1
+
+
+def test_check_rejects_without_reserving():
+    """Test check rejects a model with a long backlog and reserves nothing."""
+    fake = FakeTime()
+    governor = make_governor(fake, tpm=600)
+
+    governor.check("gpt-4o", 60)
+    governor.acquire("gpt-4o", 60)
+    # The bucket is empty; a call may still start within max_wait
+    governor.check("gpt-4o", 200)
+    with pytest.raises(LLMBudgetExceededError):
+        governor.check("gpt-4o", 1000)
+    stats = governor.stats()
+    assert stats["rejected"] == 1
+    assert stats["models"]["gpt-4o"]["calls"] == 1
+
+
+def test_concurrency_cap():
+    """Test calls beyond the in-flight cap wait for a slot."""
+    governor = LLMGovernor(
+        limits={}, default=ModelLimits(rpm=0, tpm=0, concurrency=1), max_wait=5
+    )
+    first = governor.acquire("gpt-4o", 1)
+    started = threading.Event()
+
+    def second():
+        governor.release(governor.acquire("gpt-4o", 1))
+        started.set()
+
+    thread = threading.Thread(target=second)
+    thread.start()
+    assert not started.wait(0.1)
+    governor.release(first)
+    assert started.wait(2)
+    thread.join()
+    assert governor.stats()["models"]["gpt-4o"]["delayed"] == 1
+
+
+def test_limits_by_model_and_prefix():
+    """Test exact entries win over prefixes, and the longest prefix wins."""
+    governor = LLMGovernor(
+        limits={
+            "gpt-4o": ModelLimits(rpm=1),
+            "claude*": ModelLimits(rpm=2),
+            "claude-3-opus*": ModelLimits(rpm=3),
+        }
+    )
+    assert governor.limits_for("gpt-4o").rpm == 1
+    assert governor.limits_for("claude-3-opus-latest").rpm == 3
+    assert governor.limits_for("claude-3-haiku").rpm == 2
+    assert governor.limits_for("gpt-4o-mini") == governor.default
+
+
+def test_callback_governs_litellm_calls():
+    """Test litellm calls pass through the governor and report usage."""
+    governor = LLMGovernor(limits={}, default=ModelLimits(rpm=600, tpm=0))
+    callback = GovernorCallback(governor)
+    litellm.callbacks.append(callback)
+    try:
+        for _ in range(3):
+            litellm.completion(
+                model="gpt-4o-mini",
+                messages=[{"role": "user", "content": "hello"}],
+                mock_response="hi",
+            )
+        # Success callbacks of sync calls run on litellm's thread pool
+        deadline = time.time() + 5
+        while governor.stats()["models"]["gpt-4o-mini"]["in_flight"] and (
+            time.time() < deadline
+        ):
+            time.sleep(0.01)
+    finally:
+        litellm.callbacks.remove(callback)
+
+    stats = governor.stats()["models"]["gpt-4o-mini"]
+    assert stats["calls"] == 3
+    assert stats["in_flight"] == 0
+    assert stats["tokens_used"] > 0
+
+
+def test_callback_holds_calls_over_budget():
+    """Test the callback holds a call over budget for max_wait and counts it."""
+    fake = FakeTime()
+    governor = make_governor(fake, tpm=600)
+    callback = GovernorCallback(governor, estimate=lambda model, messages: 0)
+
+    kwargs = {
+        "litellm_call_id": "call-1",
+        "model": "gpt-4o",
+        "optional_params": {"max_tokens": 1000},
+    }
+    callback.log_pre_api_call("gpt-4o", [], kwargs)
+
+    assert fake.slept == [30.0]
+    stats = governor.stats()["models"]["gpt-4o"]
+    assert stats["calls"] == 1
+    assert stats["over_budget"] == 1
+    assert stats["rejected"] == 0
+    assert stats["tokens_reserved"] == 1000
+    # The debt stays on the budget, so the next call is rejected up front
+    with pytest.raises(LLMBudgetExceededError):
+        governor.check("gpt-4o")
+    callback.log_success_event(kwargs, None, None, None)
+    assert governor.stats()["models"]["gpt-4o"]["in_flight"] == 0
@@ -0,0 +1,113 @@
+"""Tests for the background swarm job manager."""
+
+import threading
+
+import pytest
+
+from src.api.admission import AdmissionController
+from src.api.jobs import JobQueueFullError, SwarmJobManager
+from src.server.models.swarm import SwarmStatusEnum
+
+SWARM_SPEC = {"name": "Test Swarm", "task": "Test task"}
+
+
+def wait_for(manager, job_id):
+    """Block until the job's future has finished."""
+    manager._jobs[job_id].future.result(timeout=5)
+
+
+def test_job_completes_with_result():
+    """Test a job runs on the pool and exposes its result."""
+    manager = SwarmJobManager(max_workers=2)
+    job = manager.submit("job-1", SWARM_SPEC, lambda: {"output": "done"}, owner="key")
+
+    assert job.status == SwarmStatusEnum.PENDING
+    assert job.swarm_spec["name"] == "Test Swarm"
+
+    wait_for(manager, "job-1")
+    status = manager.get_status("job-1", owner="key")
+    result = manager.get_result("job-1", owner="key")
+
+    assert status.status == SwarmStatusEnum.COMPLETED
+    assert status.progress == 1.0
+    assert result.output == {"output": "done"}
+    manager.shutdown()
+
+
+def test_job_failure_is_recorded():
+    """Test exceptions raised by a job mark it as failed."""
+    manager = SwarmJobManager(max_workers=1)
+
+    def boom():
+        raise ValueError("bad swarm")
+
+    manager.submit("job-2", SWARM_SPEC, boom)
+    wait_for(manager, "job-2")
+
+    status = manager.get_status("job-2")
+    assert status.status == SwarmStatusEnum.FAILED
+    assert status.error == "bad swarm"
+    assert manager.get_result("job-2").output == {"error": "bad swarm"}
+    manager.shutdown()
+
+
+def test_jobs_are_scoped_to_owner():
+    """Test jobs cannot be read with a different API key."""
+    manager = SwarmJobManager(max_workers=1)
+    manager.submit("job-3", SWARM_SPEC, lambda: {}, owner="key-a")
+
+    assert manager.get_status("job-3", owner="key-b") is None
+    assert manager.get_status("job-3", owner="key-a") is not None
+    manager.shutdown(wait=True)
+
+
+def test_queue_limit_and_cancel():
+    """Test pending jobs are bounded and can be cancelled before running."""
+    manager = SwarmJobManager(max_workers=1, max_pending=1)
+    release = threading.Event()
+    started = threading.Event()
+
+    def blocking():
+        started.set()
+        release.wait(5)
+        return {}
+
+    manager.submit("running", SWARM_SPEC, blocking)
+    started.wait(5)
+    manager.submit("queued", SWARM_SPEC, lambda: {})
+
+    with pytest.raises(JobQueueFullError):
+        manager.submit("rejected", SWARM_SPEC, lambda: {})
+
+    assert manager.cancel("queued")
+    assert manager.get_status("queued").status == SwarmStatusEnum.CANCELLED
+    assert not manager.cancel("running")
+
+    release.set()
+    wait_for(manager, "running")
+    assert manager.stats()["completed"] == 1
+    manager.shutdown()
+
+
+def test_flex_jobs_wait_for_admission_without_a_worker():
+    """Test flex jobs queue for admission outside the pool and fail if refused."""
+    admission = AdmissionController(capacity=1, flex_threshold=1.0, flex_max_waiting=1)
+    manager = SwarmJobManager(max_workers=1, admission=admission)
+    admission.acquire("standard")
+    abandoned = []
+
+    manager.submit("flex-1", SWARM_SPEC, lambda: {"output": "flex"}, tier="flex")
+    manager.submit(
+        "flex-2", SWARM_SPEC, lambda: {}, tier="flex", on_abandon=abandoned.append
+    )
+    # The refused job fails at once, and the worker is still free
+    assert manager.get_status("flex-2").status == SwarmStatusEnum.FAILED
+    assert abandoned == [manager.get_status("flex-2").error]
+    manager.submit("standard", SWARM_SPEC, lambda: {"output": "now"}, tier="standard")
+    wait_for(manager, "standard")
+    assert manager.get_status("flex-1").status == SwarmStatusEnum.PENDING
+
+    admission.release()
+    wait_for(manager, "flex-1")
+    assert manager.get_result("flex-1").output == {"output": "flex"}
+    manager.shutdown()
@@ -0,0 +1,119 @@
+"""Tests for paginated API log queries."""
+
+import asyncio
+from datetime import UTC, datetime
+from types import SimpleNamespace
+
+import pytest
+
+from src.api.logs import (
+    InvalidLogQueryError,
+    LogQuery,
+    decode_cursor,
+    encode_cursor,
+    fetch_log_page,
+    parse_fields,
+    select_clause,
+)
+
+
+class RecordingTable:
+    """PostgREST-style builder that records calls and returns canned rows."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            return self
+
+        return call
+
+    def execute(self):
+        limit = next(args[0] for name, args, _ in self.calls if name == "limit")
+        return SimpleNamespace(data=self.rows[:limit])
+
+
+class FakeDatabase:
+    """Stands in for AsyncDatabase, running the recorded query."""
+
+    def __init__(self, rows):
+        self.table_ = RecordingTable(rows)
+
+    def table(self, name):
+        assert name == "swarms_api_logs"
+        return self.table_
+
+    async def execute(self, query):
+        return query.execute()
+
+
+def fetch(database, query):
+    return asyncio.run(fetch_log_page(database, "key", query))
+
+
+def rows(count):
+    return [
+        {"id": count - i, "created_at": f"2025-01-01T00:00:{59 - i:02d}+00:00"}
+        for i in range(count)
+    ]
+
+
+def test_fields_are_validated_and_keyset_columns_kept():
+    """Test projections are allowlisted and always include id and created_at."""
+    assert parse_fields(None) is None
+    fields = parse_fields("data->path, created_at")
+    assert select_clause(fields) == "id,created_at,data->path"
+    with pytest.raises(InvalidLogQueryError):
+        parse_fields("password")
+
+
+def test_cursor_round_trip_and_tampering():
+    """Test cursors resume after a row and reject injected filters."""
+    cursor = encode_cursor({"id": 7, "created_at": "2025-01-01T00:00:00+00:00"})
+    assert decode_cursor(cursor) == ("2025-01-01T00:00:00+00:00", 7)
+
+    for bad in ["not-base64!", encode_cursor({"id": "1),id.gt.(0", "created_at": "x"})]:
+        with pytest.raises(InvalidLogQueryError):
+            decode_cursor(bad)
+
+
+def test_pages_are_limited_and_return_a_cursor():
+    """Test a full page comes back with a cursor pointing at its last row."""
+    client = FakeDatabase(rows(5))
+    page, cursor = fetch(client, LogQuery(limit=3))
+
+    assert [row["id"] for row in page] == [5, 4, 3]
+    assert decode_cursor(cursor) == (page[-1]["created_at"], 3)
+    assert ("limit", (4,), {}) in client.table_.calls
+
+
+def test_last_page_has_no_cursor():
+    """Test a short page ends the pagination."""
+    page, cursor = fetch(FakeDatabase(rows(2)), LogQuery(limit=3))
+    assert len(page) == 2
+    assert cursor is None
+
+
+def test_filters_are_applied():
+    """Test time range, path and cursor become PostgREST filters."""
+    client = FakeDatabase([])
+    since = datetime(2025, 1, 1, tzinfo=UTC)
+    cursor = encode_cursor({"id": 9, "created_at": "2025-01-02T00:00:00+00:00"})
+    fetch(client, LogQuery(since=since, path="/v1/swarm/completions", cursor=cursor))
+
+    calls = client.table_.calls
+    assert ("eq", ("api_key", "key"), {}) in calls
+    assert ("gte", ("created_at", since.isoformat()), {}) in calls
+    assert ("eq", ("data->>path", "/v1/swarm/completions"), {}) in calls
+    assert (
+        "or_",
+        (
+            "created_at.lt.2025-01-02T00:00:00+00:00,"
+            "and(created_at.eq.2025-01-02T00:00:00+00:00,id.lt.9)",
+        ),
+        {},
+    ) in calls
+    assert ("order", ("created_at",), {"desc": True}) in calls
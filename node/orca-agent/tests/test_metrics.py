@@ -0,0 +1,149 @@
+"""Tests for the Prometheus metrics registry and /metrics endpoints."""
+
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.api.metrics import (
+    CONTENT_TYPE,
+    LLMMetricsCallback,
+    MetricFamily,
+    MetricsRegistry,
+)
+
+
+def sample(text, line_start):
+    """Return the value of the first exposition line starting with ``line_start``."""
+    for line in text.splitlines():
+        if line.startswith(line_start + " "):
+            return float(line.rsplit(" ", 1)[1])
+    raise AssertionError(f"{line_start} not in:\n{text}")
+
+
+def test_histogram_buckets_are_cumulative():
+    """Test observations land in every bucket at or above them."""
+    registry = MetricsRegistry()
+    histogram = registry.histogram("latency_seconds", "Latency", ["route"], [0.1, 1])
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value, route="/a")
+    text = registry.render()
+
+    assert "# TYPE latency_seconds histogram" in text
+    assert sample(text, 'latency_seconds_bucket{route="/a",le="0.1"}') == 2
+    assert sample(text, 'latency_seconds_bucket{route="/a",le="1.0"}') == 3
+    assert sample(text, 'latency_seconds_bucket{route="/a",le="+Inf"}') == 4
+    assert sample(text, 'latency_seconds_count{route="/a"}') == 4
+    assert sample(text, 'latency_seconds_sum{route="/a"}') == pytest.approx(3.65)
+
+
+def test_labels_are_escaped_and_checked():
+    """Test label values are escaped and label names must match."""
+    registry = MetricsRegistry()
+    counter = registry.counter("calls_total", "Calls", ["model"])
+    counter.inc(model='a"b\\c')
+    assert sample(registry.render(), 'calls_total{model="a\\"b\\\\c"}') == 1
+    with pytest.raises(ValueError):
+        counter.inc(other="x")
+    with pytest.raises(ValueError):
+        counter.inc(-1, model="a")
+    # Registering the same metric again returns it
+    assert registry.counter("calls_total", "Calls", ["model"]) is counter
+
+
+def test_series_are_capped():
+    """Test new label values are dropped once a metric holds max_series."""
+    registry = MetricsRegistry()
+    counter = registry.counter("paths_total", "Paths", ["path"])
+    counter.max_series = 2
+    for path in ("/a", "/b", "/c"):
+        counter.inc(path=path)
+    text = registry.render()
+    assert 'path="/b"' in text
+    assert 'path="/c"' not in text
+
+
+def test_collectors_render_at_scrape_time():
+    """Test collectors are called on render and a failing one is skipped."""
+    registry = MetricsRegistry()
+    depth = {"swarm_run": 3}
+
+    def broken():
+        raise RuntimeError("boom")
+
+    registry.add_collector(broken)
+    registry.add_collector(
+        lambda: [
+            MetricFamily(
+                "queue_depth",
+                "gauge",
+                "Queued tasks",
+                [({"executor": name}, value) for name, value in depth.items()],
+            )
+        ]
+    )
+    assert sample(registry.render(), 'queue_depth{executor="swarm_run"}') == 3
+    depth["swarm_run"] = 1
+    assert sample(registry.render(), 'queue_depth{executor="swarm_run"}') == 1
+
+
+def test_llm_callback_records_latency_and_tokens():
+    """Test litellm success and failure events feed the LLM metrics."""
+    registry = MetricsRegistry()
+    callback = LLMMetricsCallback(registry)
+    start = datetime(2026, 1, 1)
+    response = {"usage": {"prompt_tokens": 12, "completion_tokens": 5}}
+
+    callback.log_success_event(
+        {"model": "gpt-4o"}, response, start, start + timedelta(seconds=2)
+    )
+    callback.log_failure_event({"model": "gpt-4o"}, None, start, start)
+    text = registry.render()
+
+    labels = 'model="gpt-4o",status="success"'
+    assert sample(text, f"llm_call_duration_seconds_sum{{{labels}}}") == 2
+    assert sample(text, 'llm_call_duration_seconds_count{model="gpt-4o",status="error"}') == 1
+    assert sample(text, 'llm_tokens_total{model="gpt-4o",kind="prompt"}') == 12
+    assert sample(text, 'llm_tokens_total{model="gpt-4o",kind="completion"}') == 5
+
+
+def test_api_metrics_endpoint():
+    """Test the API records requests by route template and serves /metrics."""
+    from src.api import api
+
+    client = TestClient(api.app)
+    assert client.get("/health").status_code == 200
+    client.get("/no/such/path")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == CONTENT_TYPE
+    text = response.text
+    assert sample(
+        text,
+        'http_request_duration_seconds_count{method="GET",route="/health",status="200"}',
+    ) >= 1
+    assert 'route="unmatched",status="404"' in text
+    assert "# TYPE executor_queue_depth gauge" in text
+    assert "# TYPE cache_hit_ratio gauge" in text
+
+
+def test_node_server_times_requests():
+    """Test the Flask app measures real durations and serves /metrics."""
+    from src.server import create_app
+
+    app = create_app()
+
+    @app.route("/slow")
+    def slow():
+        time.sleep(0.02)
+        return "ok"
+
+    client = app.test_client()
+    assert client.get("/slow").status_code == 200
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    labels = 'method="GET",route="/slow",status="200"'
+    assert sample(response.text, f"http_request_duration_seconds_sum{{{labels}}}") >= 0.02
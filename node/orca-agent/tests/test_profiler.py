@@ -0,0 +1,134 @@
+"""Tests for the on-demand sampling profiler."""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.api import auth
+from src.api.profiler import ProfilerBusyError, SamplingProfiler
+
+ADMIN_TOKEN = "test-admin-token"
+
+
+def spin(started, stop):
+    """Burn CPU in a frame the profiler can find."""
+    started.set()
+    while not stop.is_set():
+        sum(range(1000))
+
+
+@pytest.fixture
+def busy_pool():
+    """A named pool with one busy worker and one idle worker."""
+    pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="swarm_run")
+    started, stop = threading.Event(), threading.Event()
+    pool.submit(spin, started, stop)
+    # Starts a second worker, which goes back to waiting for work
+    pool.submit(started.wait).result()
+    time.sleep(0.05)
+    yield pool
+    stop.set()
+    pool.shutdown()
+
+
+@pytest.fixture
+def admin_token(monkeypatch):
+    monkeypatch.setattr(auth, "ADMIN_TOKEN", ADMIN_TOKEN)
+    return ADMIN_TOKEN
+
+
+def test_profile_collapses_stacks_by_pool(busy_pool):
+    """Test busy executor threads show up rooted at their pool name."""
+    result = SamplingProfiler().profile(0.2, interval=0.01)
+
+    assert result.samples >= 5
+    spinning = [s for s in result.stacks if ";spin (test_profiler.py:16)" in s]
+    assert spinning and all(s.startswith("swarm_run;") for s in spinning)
+    assert sum(result.stacks[s] for s in spinning) == result.samples
+
+    line = result.collapsed().splitlines()[0]
+    stack, count = line.rsplit(" ", 1)
+    assert ";" in stack and int(count) > 0
+
+
+def test_idle_workers_are_left_out(busy_pool):
+    """Test threads waiting for work only appear with include_idle."""
+    profiler = SamplingProfiler()
+
+    def idle_workers(stacks):
+        return [s for s in stacks if s.startswith("swarm_run;") and "spin" not in s]
+
+    assert idle_workers(profiler.sample()) == []
+    assert idle_workers(profiler.sample(include_idle=True))
+
+
+def test_one_profile_at_a_time():
+    """Test a second profile is rejected while one runs, and limits apply."""
+    profiler = SamplingProfiler(max_seconds=5)
+    started = threading.Event()
+
+    def sleep(seconds):
+        started.set()
+        time.sleep(seconds)
+
+    profiler._sleep = sleep
+    thread = threading.Thread(target=profiler.profile, args=(0.3,))
+    thread.start()
+    assert started.wait(2)
+    with pytest.raises(ProfilerBusyError):
+        profiler.profile(0.1)
+    thread.join()
+
+    with pytest.raises(ValueError):
+        profiler.profile(10)
+    with pytest.raises(ValueError):
+        profiler.profile(1, interval=0)
+    stats = profiler.stats()
+    assert stats["profiles"] == 1
+    assert stats["busy"] == 1
+    assert not stats["active"]
+
+
+def test_api_profile_endpoint_requires_admin_token(admin_token):
+    """Test the API profiles only for the admin token."""
+    from src.api import api
+
+    client = TestClient(api.app)
+    url = "/v1/admin/profile?seconds=0.1"
+    assert client.get(url).status_code == 403
+    assert client.get(url, headers={"x-admin-token": "wrong"}).status_code == 403
+
+    response = client.get(url, headers={"x-admin-token": admin_token})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert int(response.headers["x-profile-samples"]) > 0
+
+
+def test_admin_endpoints_disabled_without_token(monkeypatch):
+    """Test an unset ADMIN_TOKEN rejects every token."""
+    monkeypatch.setattr(auth, "ADMIN_TOKEN", "")
+    assert not auth.is_admin_token("")
+    assert not auth.is_admin_token(None)
+
+
+def test_node_server_profile_endpoint(admin_token, busy_pool):
+    """Test the Flask app serves profiles of its worker threads."""
+    from src.server import create_app
+
+    client = create_app().test_client()
+    assert client.get("/admin/profile?seconds=0.1").status_code == 403
+    assert (
+        client.get(
+            "/admin/profile?seconds=100", headers={"X-Admin-Token": admin_token}
+        ).status_code
+        == 400
+    )
+
+    response = client.get(
+        "/admin/profile?seconds=0.2", headers={"X-Admin-Token": admin_token}
+    )
+    assert response.status_code == 200
+    assert "swarm_run;" in response.get_data(as_text=True)
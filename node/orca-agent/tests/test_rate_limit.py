@@ -0,0 +1,77 @@
+"""Tests for the token-bucket rate limiter."""
+
+from src.api.rate_limit import (
+    MemoryRateLimiter,
+    SQLiteRateLimiter,
+    client_key,
+)
+
+
+def test_client_key_prefers_api_key():
+    """Test buckets are keyed by hashed API key, falling back to IP."""
+    key = client_key("secret-key", "1.2.3.4")
+    assert key.startswith("key:")
+    assert "secret-key" not in key
+    assert client_key(None, "1.2.3.4") == "ip:1.2.3.4"
+
+
+def test_memory_bucket_limits_and_refills(clock):
+    """Test the bucket admits a burst, rejects with Retry-After, then refills."""
+    limiter = MemoryRateLimiter(capacity=3, window=3, clock=clock)
+
+    decisions = [limiter.acquire("client") for _ in range(4)]
+    assert [d.allowed for d in decisions] == [True, True, True, False]
+    assert decisions[2].remaining == 0
+
+    headers = decisions[3].headers()
+    assert headers["Retry-After"] == "1"
+    assert headers["X-RateLimit-Limit"] == "3"
+    assert headers["X-RateLimit-Remaining"] == "0"
+
+    clock.now += 1
+    assert limiter.acquire("client").allowed
+
+
+def test_memory_evicts_idle_buckets(clock):
+    """Test idle buckets are dropped and the key cap is enforced."""
+    limiter = MemoryRateLimiter(capacity=5, window=10, max_keys=2, clock=clock)
+
+    limiter.acquire("a")
+    limiter.acquire("b")
+    limiter.acquire("c")
+    assert len(limiter) == 2
+
+    clock.now += 11
+    limiter.acquire("d")
+    assert len(limiter) == 1
+
+
+def test_sqlite_limits_are_shared(tmp_path, clock):
+    """Test two limiters on the same database share one budget."""
+    db_path = str(tmp_path / "limits.db")
+    worker_a = SQLiteRateLimiter(capacity=2, window=60, db_path=db_path, clock=clock)
+    worker_b = SQLiteRateLimiter(capacity=2, window=60, db_path=db_path, clock=clock)
+
+    assert worker_a.acquire("client").allowed
+    assert worker_b.acquire("client").allowed
+    assert not worker_a.acquire("client").allowed
+    assert worker_b.acquire("other").allowed
+
+    clock.now += 61
+    assert worker_a.evict_idle() == 2
+
+
+def test_unverified_api_keys_share_the_ip_bucket(monkeypatch):
+    """Test rotating made-up keys on open endpoints does not reset the limit."""
+    from fastapi.testclient import TestClient
+
+    from src.api import api
+
+    monkeypatch.setattr(api, "request_limiter", MemoryRateLimiter(2, 60))
+    client = TestClient(api.app)
+    statuses = [
+        client.get("/v1/models/available", headers={"x-api-key": f"fake-{i}"})
+        .status_code
+        for i in range(3)
+    ]
+    assert statuses == [200, 200, 429]
@@ -0,0 +1,259 @@
+"""Tests for LLM call deadlines, circuit breakers and hedging."""
+
+import threading
+import time
+
+import litellm
+import pytest
+
+from src.api.executors import NamedExecutor
+from src.api.governor import LLMBudgetExceededError, LLMGovernor, ModelLimits
+from src.api.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    Fallback,
+    GuardedLLM,
+    LLMDeadlineExceededError,
+    LLMGuard,
+    provider_of,
+)
+
+PRIMARY = "gpt-4o"
+FALLBACK = "claude-3-haiku-20240307"
+
+
+@pytest.fixture
+def executor():
+    executor = NamedExecutor("test-llm", 4, 4)
+    yield executor
+    executor.shutdown()
+
+
+def make_guard(executor, **kwargs):
+    kwargs.setdefault("fallbacks", {PRIMARY: Fallback(model=FALLBACK)})
+    kwargs.setdefault("failure_threshold", 2)
+    return LLMGuard(executor=executor, **kwargs)
+
+
+def failing(overrides):
+    raise litellm.InternalServerError("boom", llm_provider="openai", model=PRIMARY)
+
+
+def test_breaker_opens_and_probes_after_reset(clock):
+    """Test consecutive failures open the breaker until a probe succeeds."""
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    clock.now += 30
+    assert breaker.allow()
+    assert not breaker.allow()  # one probe at a time
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_open_provider_fails_over_or_fails_fast(executor):
+    """Test an open breaker sends calls to the fallback, or rejects them."""
+    guard = make_guard(executor)
+    for _ in range(2):
+        with pytest.raises(litellm.InternalServerError):
+            guard.call(PRIMARY, failing)
+
+    assert guard.call(PRIMARY, lambda o: o.get("model")) == FALLBACK
+    assert guard.stats()["failovers"] == 1
+
+    guard.fallbacks = {}
+    with pytest.raises(CircuitOpenError):
+        guard.call(PRIMARY, lambda o: "unreachable")
+
+
+def test_request_errors_do_not_trip_the_breaker(executor):
+    """Test errors caused by the request leave the provider closed."""
+    guard = make_guard(executor)
+
+    def bad_request(overrides):
+        raise litellm.BadRequestError("bad", model=PRIMARY, llm_provider="openai")
+
+    for _ in range(3):
+        with pytest.raises(litellm.BadRequestError):
+            guard.call(PRIMARY, bad_request)
+    assert guard.breaker("openai").state == "closed"
+
+
+def test_calls_over_the_governor_budget_are_rejected(executor, clock):
+    """Test a call to a model far over its rate limits never starts."""
+    governor = LLMGovernor(
+        limits={},
+        default=ModelLimits(rpm=60, tpm=0, concurrency=0),
+        burst_seconds=1,
+        max_wait=5,
+        clock=clock,
+    )
+    guard = make_guard(executor, governor=governor)
+    # One call of burst, then ten more queued behind it
+    for _ in range(11):
+        governor.acquire(PRIMARY, 1, block=False)
+    calls = []
+
+    with pytest.raises(LLMBudgetExceededError):
+        guard.call(PRIMARY, lambda overrides: calls.append(overrides))
+    assert calls == []
+    assert guard.stats()["over_budget"] == 1
+
+    clock.now += 60
+    assert guard.call(PRIMARY, lambda overrides: "ok") == "ok"
+
+
+def test_deadline_frees_the_caller(executor):
+    """Test a stuck call returns at its deadline, passing it on as timeout."""
+    guard = make_guard(executor, fallbacks={})
+    seen = {}
+    release = threading.Event()
+
+    def stuck(overrides):
+        seen.update(overrides)
+        release.wait(5)
+
+    started = time.monotonic()
+    with pytest.raises(LLMDeadlineExceededError):
+        guard.call(PRIMARY, stuck, deadline=0.2)
+    release.set()
+
+    assert time.monotonic() - started < 2
+    assert seen["timeout"] == 0.2
+    assert guard.stats()["deadline_exceeded"] == 1
+
+
+def test_slow_calls_are_hedged_to_the_fallback(executor):
+    """Test a call slower than the hedge delay is raced against its fallback."""
+    guard = make_guard(
+        executor, hedge=True, hedge_default_delay=0.05, hedge_max_fraction=1.0
+    )
+    release = threading.Event()
+
+    def call(overrides):
+        if overrides.get("model") == FALLBACK:
+            return "fallback"
+        release.wait(5)
+        return "primary"
+
+    try:
+        assert guard.call(PRIMARY, call, deadline=3) == "fallback"
+    finally:
+        release.set()
+    stats = guard.stats()
+    assert stats["hedged"] == 1
+    assert stats["hedge_wins"] == 1
+
+
+def test_fast_calls_are_not_hedged(executor):
+    """Test calls that answer before the hedge delay run once."""
+    guard = make_guard(
+        executor, hedge=True, hedge_default_delay=1, hedge_max_fraction=1.0
+    )
+    calls = []
+    assert guard.call(PRIMARY, lambda o: calls.append(o) or "ok") == "ok"
+    assert len(calls) == 1
+    assert guard.stats()["hedged"] == 0
+
+
+def test_hedges_not_sent_leave_the_fallback_probe_free():
+    """Test a half-open fallback keeps its probe when no hedge is sent."""
+    # One worker and no queue: the primary attempt takes the only slot
+    executor = NamedExecutor("test-llm-hedge", 1, 0)
+
+    def slow(overrides):
+        time.sleep(0.2)
+        return "primary"
+
+    try:
+        for hedge_max_fraction in (0.0, 1.0):
+            guard = make_guard(
+                executor,
+                hedge=True,
+                hedge_default_delay=0.05,
+                hedge_max_fraction=hedge_max_fraction,
+                reset_timeout=0,
+            )
+            breaker = guard.breaker(provider_of(FALLBACK))
+            breaker.record_failure()
+            breaker.record_failure()
+            assert breaker.state == "open"
+
+            assert guard.call(PRIMARY, slow, deadline=3) == "primary"
+            # Over budget, or the executor was saturated: no hedge was sent
+            assert guard.stats()["hedge_wins"] == 0
+            assert breaker.allow()
+    finally:
+        executor.shutdown()
+
+
+def test_hedge_delay_follows_the_latency_quantile(executor):
+    """Test the hedge delay is the p95 once enough samples exist."""
+    guard = make_guard(executor, hedge_min_samples=10, hedge_default_delay=7)
+    assert guard.hedge_delay(PRIMARY) == 7
+    for i in range(1, 21):
+        guard.latency(PRIMARY).record(i / 10)
+    assert guard.hedge_delay(PRIMARY) == 2.0
+
+
+def test_guarded_llm_passes_overrides_and_attributes():
+    """Test the wrapper only intercepts run."""
+
+    class FakeLLM:
+        model_name = PRIMARY
+
+        def run(self, task=None, **kwargs):
+            return task, kwargs
+
+    llm = FakeLLM()
+    guarded = GuardedLLM(llm, LLMGuard(fallbacks={}, deadline=9))
+    assert guarded.run(task="t") == ("t", {"timeout": 9})
+    guarded.temperature = 0.2
+    assert llm.temperature == 0.2
+    assert guarded.model_name == PRIMARY
+
+
+def test_abandoned_attempts_do_not_bill_the_next_user(executor):
+    """Test a losing hedge's tokens stay out of the agent's usage once it returns."""
+    guard = make_guard(
+        executor, hedge=True, hedge_default_delay=0.05, hedge_max_fraction=1.0
+    )
+    usage = {"total_tokens": 0}
+    release, finished = threading.Event(), threading.Event()
+
+    class FakeLLM:
+        model_name = PRIMARY
+
+        def __init__(self):
+            self.usage_hook = lambda call: usage.update(
+                total_tokens=usage["total_tokens"] + call["total_tokens"]
+            )
+
+        def run(self, task=None, **kwargs):
+            if kwargs.get("model") == FALLBACK:
+                self.usage_hook({"total_tokens": 50})
+                return "fallback"
+            release.wait(5)
+            self.usage_hook({"total_tokens": 200})
+            finished.set()
+            return "primary"
+
+    guarded = GuardedLLM(FakeLLM(), guard)
+    assert guarded.run(task="t") == "fallback"
+    assert usage["total_tokens"] == 50
+
+    # The agent goes back to the pool and its usage is zeroed for the next lease
+    usage["total_tokens"] = 0
+    release.set()
+    assert finished.wait(5)
+    assert usage["total_tokens"] == 0
+    assert guard.stats()["orphaned_tokens"] == 200
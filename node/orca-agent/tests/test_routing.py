@@ -0,0 +1,109 @@
+"""Tests for latency-aware model routing."""
+
+import random
+
+import pytest
+
+from src.api.resilience import GuardedLLM, LLMGuard
+from src.api.routing import ModelRouter
+
+FAST, SLOW = "gpt-4o-mini", "claude-3-haiku-20240307"
+
+
+def make_router(**kwargs):
+    kwargs.setdefault("explore_rate", 0)
+    return ModelRouter(alpha=0.5, **kwargs)
+
+
+def observe(router, model, latency, failed=False):
+    router.begin(model)
+    router.end(model, latency, failed)
+
+
+def test_lowest_latency_wins():
+    """Test calls go to the model with the lower latency EWMA."""
+    router = make_router()
+    observe(router, FAST, 1.0)
+    observe(router, SLOW, 3.0)
+    assert router.choose([SLOW, FAST]) == FAST
+
+    # The EWMA follows the model getting slower
+    for _ in range(4):
+        observe(router, FAST, 9.0)
+    assert router.choose([SLOW, FAST]) == SLOW
+
+
+def test_queue_depth_spreads_load():
+    """Test calls in flight and governor queues count against a model."""
+    queued = {FAST: 0}
+    router = make_router(load=lambda model: queued.get(model, 0))
+    observe(router, FAST, 1.0)
+    observe(router, SLOW, 2.5)
+
+    router.begin(FAST)
+    assert router.choose([FAST, SLOW]) == FAST  # 1 * 2 < 2.5
+    router.begin(FAST)
+    assert router.choose([FAST, SLOW]) == SLOW  # 1 * 3 > 2.5
+    router.end(FAST, 1.0, False)
+    router.end(FAST, 1.0, False)
+
+    queued[FAST] = 5
+    assert router.choose([FAST, SLOW]) == SLOW
+
+
+def test_failing_models_are_avoided():
+    """Test the failure rate inflates a model's expected latency."""
+    router = make_router()
+    observe(router, FAST, 1.0)
+    observe(router, SLOW, 1.5)
+    observe(router, FAST, None, failed=True)
+    assert router.stats()["models"][FAST]["error_rate"] == 0.5
+    assert router.choose([FAST, SLOW]) == SLOW
+
+
+def test_unmeasured_models_are_tried():
+    """Test a model without samples is scored with the best known latency."""
+    router = make_router()
+    observe(router, SLOW, 2.0)
+    router.begin(SLOW)
+    assert router.choose([SLOW, FAST]) == FAST
+
+
+def test_exploration_picks_random_candidates():
+    """Test a share of calls goes to a random candidate."""
+    router = ModelRouter(explore_rate=1.0, rng=random.Random(0))
+    picks = {router.choose([FAST, SLOW]) for _ in range(20)}
+    assert picks == {FAST, SLOW}
+    assert router.stats()["explored"] == 20
+    with pytest.raises(ValueError):
+        router.choose([])
+
+
+def test_guarded_llm_routes_each_call():
+    """Test routed agents send each call to the chosen model and feed the router."""
+
+    class FakeLLM:
+        model_name = FAST
+
+        def __init__(self):
+            self.models = []
+
+        def run(self, task=None, **kwargs):
+            self.models.append(kwargs["model"])
+            return task
+
+    guard = LLMGuard(fallbacks={}, router=make_router())
+    observe(guard.router, FAST, 5.0)
+    observe(guard.router, SLOW, 1.0)
+    llm = FakeLLM()
+    guarded = GuardedLLM(llm, guard, models=[FAST, SLOW])
+
+    assert guarded.run(task="t") == "t"
+    assert llm.models == [SLOW]
+    assert guard.router.stats()["models"][SLOW]["calls"] == 2
+
+    # Providers with an open breaker are skipped
+    for _ in range(guard.failure_threshold):
+        guard.breaker("anthropic").record_failure()
+    guarded.run(task="t")
+    assert llm.models[-1] == FAST
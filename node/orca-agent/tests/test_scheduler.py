@@ -0,0 +1,188 @@
+"""Tests for the durable swarm scheduler."""
+
+import threading
+
+from src.api.jobs import SwarmJobManager
+from src.api.scheduler import ScheduleStore, SwarmScheduler
+
+
+class Harness:
+    """Scheduler whose dispatched jobs wait until run() is called."""
+
+    def __init__(self, path, clock, **kwargs):
+        self.ran, self.queue = [], []
+        self.refuse = False
+        self.scheduler = SwarmScheduler(
+            ScheduleStore(path),
+            lambda spec, owner, job_id: self.ran.append(job_id) or {"ok": job_id},
+            self.dispatch,
+            clock=clock,
+            **kwargs,
+        )
+
+    def dispatch(self, job_id, owner, spec, fn, on_abandon):
+        if self.refuse:
+            raise RuntimeError("queue full")
+        self.queue.append(fn)
+
+    def run_queued(self):
+        queue, self.queue = self.queue, []
+        return [fn() for fn in queue]
+
+
+def test_jobs_run_when_due_in_time_order(tmp_path, clock):
+    """Test jobs are dispatched once due, earliest first."""
+    h = Harness(str(tmp_path / "s.db"), clock)
+    h.scheduler.schedule("late", "key", clock.now + 20, {"name": "late"})
+    h.scheduler.schedule("early", "key", clock.now + 10, {"name": "early"})
+
+    assert h.scheduler.run_pending() == 0
+    clock.now += 25
+    assert h.scheduler.run_pending() == 2
+    h.run_queued()
+
+    assert h.ran == ["early", "late"]
+    assert h.scheduler.get("early").status == "completed"
+    assert h.scheduler.stats()["completed"] == 2
+
+
+def test_concurrency_cap(tmp_path, clock):
+    """Test no more than max_concurrent scheduled jobs run at once."""
+    h = Harness(str(tmp_path / "s.db"), clock, max_concurrent=2)
+    for i in range(3):
+        h.scheduler.schedule(f"job-{i}", "key", clock.now, {})
+
+    assert h.scheduler.run_pending() == 2
+    assert h.scheduler.run_pending() == 0
+    h.run_queued()
+    assert h.scheduler.run_pending() == 1
+
+
+def test_cancelled_jobs_do_not_run(tmp_path, clock):
+    """Test only waiting jobs of the owner can be cancelled."""
+    h = Harness(str(tmp_path / "s.db"), clock)
+    h.scheduler.schedule("job", "key", clock.now + 5, {})
+
+    assert not h.scheduler.cancel("job", "other-key")
+    assert h.scheduler.cancel("job", "key")
+    clock.now += 10
+    assert h.scheduler.run_pending() == 0
+    assert h.scheduler.get("job").status == "cancelled"
+
+
+def test_missed_jobs_are_caught_up_after_restart(tmp_path, clock):
+    """Test a new scheduler runs jobs that became due while it was down."""
+    path = str(tmp_path / "s.db")
+    Harness(path, clock).scheduler.schedule("recent", "key", clock.now + 5, {})
+    Harness(path, clock).scheduler.schedule("earlier", "key", clock.now + 5, {})
+
+    clock.now += 3600
+    restarted = Harness(path, clock, misfire_grace=7200)
+    restarted.scheduler.store.add("too-old", "key", clock.now - 8000, {}, clock.now)
+
+    assert restarted.scheduler.run_pending() == 2
+    restarted.run_queued()
+    assert sorted(restarted.ran) == ["earlier", "recent"]
+    assert restarted.scheduler.get("too-old").status == "missed"
+
+
+def test_two_workers_never_run_a_job_twice(tmp_path, clock):
+    """Test the atomic claim lets exactly one worker dispatch a job."""
+    path = str(tmp_path / "s.db")
+    first, second = Harness(path, clock), Harness(path, clock)
+    first.scheduler.schedule("job", "key", clock.now, {})
+
+    assert second.scheduler.run_pending() + first.scheduler.run_pending() == 1
+
+
+def test_refused_dispatch_is_retried(tmp_path, clock):
+    """Test a job the pool refuses goes back to the schedule."""
+    h = Harness(str(tmp_path / "s.db"), clock, retry_delay=10)
+    h.scheduler.schedule("job", "key", clock.now, {})
+
+    h.refuse = True
+    assert h.scheduler.run_pending() == 0
+    assert h.scheduler.get("job").status == "scheduled"
+
+    h.refuse = False
+    clock.now += 10
+    assert h.scheduler.run_pending() == 1
+
+
+def test_interrupted_jobs_are_failed_not_rerun(tmp_path, clock):
+    """Test a job whose worker stopped heartbeating is marked failed."""
+    path = str(tmp_path / "s.db")
+    crashed = Harness(path, clock, lease_timeout=60)
+    crashed.scheduler.schedule("job", "key", clock.now, {})
+    crashed.scheduler.run_pending()
+
+    clock.now += 61
+    Harness(path, clock, lease_timeout=60).scheduler.run_pending()
+    job = crashed.scheduler.get("job")
+    assert job.status == "failed"
+    assert job.error == "Interrupted before completion"
+
+
+def test_jobs_cancelled_in_the_pool_free_their_slot(tmp_path, clock):
+    """Test cancelling a dispatched job before it runs marks it and frees its slot."""
+    manager = SwarmJobManager(max_workers=1)
+    release = threading.Event()
+    manager.submit("busy", {}, release.wait, 5)
+    ran = []
+    scheduler = SwarmScheduler(
+        ScheduleStore(str(tmp_path / "s.db")),
+        lambda spec, owner, job_id: ran.append(job_id),
+        lambda job_id, owner, spec, fn, on_abandon: manager.submit(
+            job_id, spec, fn, owner=owner, on_abandon=on_abandon
+        ),
+        max_concurrent=1,
+        clock=clock,
+    )
+    scheduler.schedule("job", "user-1", clock.now, {})
+    scheduler.schedule("next", "user-1", clock.now, {})
+    assert scheduler.run_pending() == 1
+
+    assert manager.cancel("job", owner="user-1")
+    assert scheduler.get("job").status == "cancelled"
+    assert scheduler.stats()["running"] == 0
+    assert scheduler.stats()["cancelled"] == 1
+
+    assert scheduler.run_pending() == 1
+    release.set()
+    manager._jobs["next"].future.result(timeout=5)
+    assert ran == ["next"]
+    manager.shutdown()
+
+
+def test_api_schedules_are_owned_by_user_not_api_key(tmp_path, monkeypatch):
+    """Test scheduled swarms store the user id and never the API key."""
+    from fastapi.testclient import TestClient
+
+    from src.api import api
+    from src.api.auth import AuthCache, AuthInfo
+
+    path = tmp_path / "s.db"
+    scheduler = SwarmScheduler(ScheduleStore(str(path)), None, None)
+    monkeypatch.setattr(api, "swarm_scheduler", scheduler)
+    monkeypatch.setattr(
+        api, "auth_cache", AuthCache(lambda key: AuthInfo(True, "user-1"))
+    )
+    client = TestClient(api.app)
+
+    response = client.post(
+        "/v1/swarm/jobs",
+        headers={"x-api-key": "sk-secret"},
+        json={
+            "task": "report",
+            "schedule": {"scheduled_time": "2999-01-01T00:00:00"},
+        },
+    )
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+
+    assert scheduler.get(job_id).owner == "user-1"
+    assert all(b"sk-secret" not in f.read_bytes() for f in tmp_path.iterdir())
+    # Another key of the same user sees and cancels it
+    headers = {"x-api-key": "sk-other"}
+    assert client.get(f"/v1/swarm/schedule/{job_id}", headers=headers).status_code == 200
+    assert client.delete(f"/v1/swarm/schedule/{job_id}", headers=headers).status_code == 200
@@ -0,0 +1,94 @@
+"""Tests for Server-Sent Events streaming."""
+
+import asyncio
+import json
+
+from fastapi import HTTPException
+
+from src.api.streaming import EventStream, format_sse
+
+
+def parse_frames(frames):
+    """Decode SSE frames into (event, data) tuples."""
+    parsed = []
+    for frame in frames:
+        event_line, data_line = frame.strip().split("\n")
+        parsed.append(
+            (event_line[len("event: "):], json.loads(data_line[len("data: "):]))
+        )
+    return parsed
+
+
+def collect(fn, *args):
+    """Run fn through an EventStream and return the decoded frames."""
+
+    async def run():
+        stream = EventStream()
+        return [frame async for frame in stream.run(fn, stream, *args)]
+
+    return parse_frames(asyncio.run(run()))
+
+
+class FakeAgent:
+    """Minimal stand-in for a swarms Agent."""
+
+    agent_name = "Test Agent"
+
+    def run(self, task):
+        return f"answer to {task}"
+
+
+def test_format_sse():
+    """Test SSE frames are encoded as event + JSON data."""
+    assert format_sse("token", {"token": "hi"}) == (
+        'event: token\ndata: {"token": "hi"}\n\n'
+    )
+
+
+def test_tokens_stream_before_completion():
+    """Test tokens emitted from the worker arrive in order before the result."""
+
+    def work(stream):
+        on_token = stream.token_callback("Test Agent")
+        for token in ["Hel", "lo"]:
+            on_token(token)
+        return {"output": "Hello"}
+
+    events = collect(work)
+
+    assert events == [
+        ("token", {"agent_name": "Test Agent", "token": "Hel"}),
+        ("token", {"agent_name": "Test Agent", "token": "lo"}),
+        ("completion", {"output": "Hello"}),
+        ("done", {}),
+    ]
+
+
+def test_agent_completion_events():
+    """Test instrumented agents emit an event when their run finishes."""
+
+    def work(stream):
+        agent = stream.instrument_agent(FakeAgent())
+        return agent.run("task")
+
+    events = collect(work)
+
+    assert events[0] == (
+        "agent_completion",
+        {"agent_name": "Test Agent", "output": "answer to task"},
+    )
+    assert events[1] == ("completion", "answer to task")
+
+
+def test_errors_are_streamed():
+    """Test failures are reported as an error event instead of breaking the stream."""
+
+    def work(stream):
+        raise HTTPException(status_code=402, detail="Insufficient credits")
+
+    events = collect(work)
+
+    assert events == [
+        ("error", {"status_code": 402, "detail": "Insufficient credits"}),
+        ("done", {}),
+    ]
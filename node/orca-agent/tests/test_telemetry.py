@@ -0,0 +1,183 @@
+"""Tests for telemetry capture and the batched telemetry writer."""
+
+from datetime import datetime, timezone
+
+from src.api.telemetry import (
+    SERVER_ID,
+    SERVER_INFO,
+    SystemMetricsSampler,
+    TelemetryWriter,
+    should_log_path,
+)
+
+
+class FakeSink:
+    """Records bulk inserts and can be switched offline."""
+
+    def __init__(self):
+        self.batches = []
+        self.online = True
+
+    def __call__(self, rows):
+        if not self.online:
+            raise ConnectionError("backend unreachable")
+        self.batches.append(rows)
+
+
+def make_writer(tmp_path, sink, **kwargs):
+    return TelemetryWriter(
+        sink,
+        batch_size=kwargs.pop("batch_size", 2),
+        flush_interval=60,
+        spool_path=str(tmp_path / "spool.jsonl"),
+        **kwargs,
+    )
+
+
+def test_rows_are_written_in_batches(tmp_path):
+    """Test queued rows are flushed as bulk inserts of batch_size."""
+    sink = FakeSink()
+    writer = make_writer(tmp_path, sink)
+    writer._thread = object()  # Flush manually instead of in the background
+
+    for i in range(3):
+        writer.enqueue({"api_key": "key", "data": {"i": i}})
+    writer.flush()
+
+    assert [len(batch) for batch in sink.batches] == [2, 1]
+    assert writer.stats()["written"] == 3
+
+
+def test_rows_are_json_safe(tmp_path):
+    """Test datetimes are serialized before reaching the sink."""
+    sink = FakeSink()
+    writer = make_writer(tmp_path, sink)
+    writer._thread = object()
+
+    now = datetime.now(timezone.utc)
+    writer.enqueue({"api_key": "key", "data": {"at": now}})
+    writer.flush()
+
+    assert sink.batches[0][0]["data"]["at"] == str(now)
+
+
+def test_failed_batches_are_spooled_and_replayed(tmp_path):
+    """Test rows survive a backend outage via the spool file."""
+    sink = FakeSink()
+    writer = make_writer(tmp_path, sink)
+    writer._thread = object()
+
+    sink.online = False
+    writer.enqueue({"api_key": "key", "data": {"i": 1}})
+    writer.flush()
+    assert writer.stats()["spooled"] == 1
+    assert (tmp_path / "spool.jsonl").exists()
+
+    sink.online = True
+    writer.flush()
+    assert sink.batches == [[{"api_key": "key", "data": {"i": 1}}]]
+    assert not (tmp_path / "spool.jsonl").exists()
+
+
+def test_malformed_spool_lines_do_not_lose_the_rest(tmp_path):
+    """Test a corrupt spool line is dropped and every other row is replayed."""
+    sink = FakeSink()
+    writer = make_writer(tmp_path, sink, batch_size=10)
+    writer._thread = object()
+    (tmp_path / "spool.jsonl").write_text(
+        '{"data": {"i": 1}}\n{"data": {"i": \n{"data": {"i": 2}}\n',
+        encoding="utf-8",
+    )
+
+    writer.flush()
+    assert [row["data"]["i"] for row in sink.batches[0]] == [1, 2]
+    assert writer.stats()["dropped_malformed"] == 1
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_unreadable_spool_is_put_back(tmp_path):
+    """Test a spool that cannot be decoded is restored for a later flush."""
+    sink = FakeSink()
+    writer = make_writer(tmp_path, sink)
+    writer._thread = object()
+    (tmp_path / "spool.jsonl").write_bytes(b"\xff\xfe not utf-8\n")
+
+    writer.flush()
+    assert sink.batches == []
+    assert [p.name for p in tmp_path.iterdir()] == ["spool.jsonl"]
+
+
+def test_queue_drops_oldest_when_full(tmp_path):
+    """Test backpressure drops the oldest rows and counts them."""
+    sink = FakeSink()
+    writer = make_writer(tmp_path, sink, batch_size=10, max_queue=2)
+    writer._thread = object()
+
+    for i in range(3):
+        writer.enqueue({"data": {"i": i}})
+    writer.flush()
+
+    assert sink.batches == [[{"data": {"i": 1}}, {"data": {"i": 2}}]]
+    assert writer.stats()["dropped_queue_full"] == 1
+
+
+def test_background_thread_flushes_on_stop(tmp_path):
+    """Test stop() flushes rows still waiting in the queue."""
+    sink = FakeSink()
+    writer = make_writer(tmp_path, sink, batch_size=100)
+
+    writer.enqueue({"data": {}})
+    writer.stop()
+
+    assert sink.batches == [[{"data": {}}]]
+
+
+def test_health_endpoints_are_excluded():
+    """Test health and docs endpoints are not logged unless sampled."""
+    assert should_log_path("/v1/swarm/completions")
+    assert not should_log_path("/health")
+    assert should_log_path("/health", sample_rate=1.0)
+
+
+def test_metrics_sampler_publishes_snapshots():
+    """Test the sampler serves a snapshot without sampling on read."""
+    sampler = SystemMetricsSampler(interval=0.01)
+    first = sampler.latest()
+    assert set(first) == {
+        "cpu_percent",
+        "memory_total",
+        "memory_available",
+        "memory_percent",
+    }
+    assert sampler.latest() is first
+
+    sampler.start()
+    sampler._stopping.wait(0.1)
+    sampler.stop()
+    assert sampler.latest() is not first
+
+
+def test_server_info_is_referenced_by_id():
+    """Test static server info is computed once with a stable id."""
+    assert SERVER_INFO["id"] == SERVER_ID
+    assert SERVER_INFO["hostname"]
+
+
+def test_server_info_is_written_once(tmp_path):
+    """Test the first accepted row carries the full host record."""
+    sink = FakeSink()
+    writer = make_writer(tmp_path, sink, server_info=SERVER_INFO)
+    writer._thread = object()
+
+    sink.online = False
+    writer.enqueue({"api_key": "key", "data": {"i": 0}})
+    writer.flush()
+    sink.online = True
+    for i in range(1, 4):
+        writer.enqueue({"api_key": "key", "data": {"i": i}})
+    writer.flush()
+
+    rows = [row for batch in sink.batches for row in batch]
+    assert [row["data"]["i"] for row in rows] == [1, 2, 3, 0]
+    assert rows[0]["data"]["server"] == SERVER_INFO
+    assert all("server" not in row["data"] for row in rows[1:])
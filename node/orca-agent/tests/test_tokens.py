@@ -0,0 +1,128 @@
+"""Tests for the memoized token counter."""
+
+from types import SimpleNamespace
+
+from src.api.tokens import TokenCounter, resolve_tokenizer, tokenize_count
+
+
+def test_counts_are_cached_by_content():
+    """Test repeated texts are tokenized once and counted consistently."""
+    counter = TokenCounter()
+    text = "You are a helpful research assistant."
+
+    first = counter.count(text, "gpt-4o")
+    assert first == tokenize_count("gpt-4o", text)
+    assert counter.count(text, "gpt-4o") == first
+    assert counter.stats()["misses"] == 1
+    assert counter.stats()["hits"] == 1
+
+
+def test_models_sharing_an_encoding_share_counts():
+    """Test the cache is keyed by tokenizer rather than model name."""
+    assert resolve_tokenizer("gpt-4o") == resolve_tokenizer("gpt-4o-mini")
+
+    counter = TokenCounter()
+    counter.count("shared prompt", "gpt-4o")
+    counter.count("shared prompt", "gpt-4o-mini")
+    assert counter.stats()["misses"] == 1
+
+
+def test_batch_counts_each_distinct_text_once():
+    """Test count_many dedupes texts and keeps input order."""
+    counter = TokenCounter()
+    counts = counter.count_many(["alpha beta", "", "gamma", "alpha beta"])
+
+    assert counts[0] == counts[3]
+    assert counts[1] == 0
+    assert counts[2] > 0
+    assert counter.stats()["misses"] == 2
+
+
+def test_cache_is_bounded():
+    """Test the least recently used counts are dropped past max_entries."""
+    counter = TokenCounter(max_entries=2)
+    counter.count_many(["one", "two", "three"])
+    assert counter.stats()["size"] == 2
+
+
+def test_large_texts_are_counted_in_the_process_pool():
+    """Test texts over the threshold are tokenized out of process."""
+    counter = TokenCounter(pool_threshold=1000, pool_workers=1)
+    try:
+        large, small = "word " * 1000, "small text"
+        counts = counter.count_many([large, small], "gpt-4o")
+    finally:
+        counter.shutdown()
+
+    assert counts == [
+        tokenize_count("gpt-4o", large),
+        tokenize_count("gpt-4o", small),
+    ]
+    assert counter.stats()["pooled"] == 1
+
+
+class FakeAgent:
+    """Agent stub with optional provider-reported usage."""
+
+    def __init__(self, name, usage=None):
+        self.agent_name = name
+        self.model_name = "gpt-4o"
+        self.system_prompt = "You are a careful analyst."
+        self.short_memory = SimpleNamespace(return_history_as_string=lambda: "")
+        if usage is not None:
+            self.usage = {**usage, "total_tokens": sum(usage.values())}
+
+
+def token_counts(cost_info):
+    return cost_info["cost_breakdown"]["token_counts"]
+
+
+def test_swarm_cost_uses_provider_usage():
+    """Test reported usage is billed as is, without tokenizing outputs."""
+    from src.api import api
+
+    agents = [
+        FakeAgent("a", {"input_tokens": 100, "output_tokens": 40}),
+        FakeAgent("b", {"input_tokens": 200, "output_tokens": 60}),
+    ]
+    before = api.token_counter.stats()
+    cost = api.calculate_swarm_cost(
+        agents, "task", 1.0, [{"role": "a", "content": "never counted"}]
+    )
+
+    counts = token_counts(cost)
+    assert counts["total_input_tokens"] == 300
+    assert counts["total_output_tokens"] == 100
+    assert counts["per_agent"]["a"]["usage_source"] == "provider"
+    assert api.token_counter.stats()["misses"] == before["misses"]
+
+
+def test_swarm_cost_counts_each_output_once():
+    """Test fallback output tokens are attributed by role, not per agent."""
+    from src.api import api
+
+    outputs = [
+        {"role": "User", "content": "the task"},
+        {"role": "a", "content": "first answer"},
+        {"role": "b", "content": "second answer"},
+    ]
+    agents = [
+        FakeAgent("a"),
+        FakeAgent("b", {"input_tokens": 10, "output_tokens": 5}),
+    ]
+    counts = token_counts(api.calculate_swarm_cost(agents, "task", 1.0, outputs))
+
+    expected = api.token_counter.count_many([m["content"] for m in outputs])
+    assert counts["per_agent"]["a"]["output_tokens"] == expected[1]
+    assert counts["per_agent"]["a"]["usage_source"] == "estimated"
+    assert counts["per_agent"]["b"]["output_tokens"] == 5
+    assert counts["total_output_tokens"] == expected[0] + expected[1] + 5
+
+
+def test_swarm_cost_does_not_invent_output():
+    """Test missing output and usage bill no output tokens."""
+    from src.api import api
+
+    counts = token_counts(api.calculate_swarm_cost([FakeAgent("a")], "task", 1.0))
+    assert counts["total_output_tokens"] == 0
+    assert counts["total_input_tokens"] > 0